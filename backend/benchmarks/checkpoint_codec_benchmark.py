@@ -0,0 +1,102 @@
+"""
+检查点编码格式基准测试
+
+对比 SimpleRedisSaver 两种存储格式的编解码耗时与存储字节数：
+1、legacy：JsonPlusSerializer 输出经 hex 编码后嵌入 JSON（旧实现）
+2、binary：msgpack 原始字节 + 可选 zstd 压缩（CheckpointCodec）
+
+运行方式：cd backend && python benchmarks/checkpoint_codec_benchmark.py --turns 20 --iterations 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from db.redis import CheckpointCodec
+
+
+def _build_checkpoint(turns: int, answer_chars: int):
+    """构造一个接近真实会话的检查点：多轮对话 + 检索结果 + 最终答案"""
+    checkpoint = empty_checkpoint()
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"第 {i} 轮问题：请分析一下行业的最新发展趋势"))
+        messages.append(AIMessage(content="分析结果。" * (answer_chars // 5)))
+    checkpoint["channel_values"] = {
+        "messages": messages,
+        "original_query": "请分析一下行业的最新发展趋势",
+        "rag_hits": [{"file_name": f"文档{i}.pdf", "text": "知识库片段内容。" * 40, "score": 0.03} for i in range(5)],
+        "final_answer": "最终答案。" * (answer_chars // 5),
+    }
+    metadata = {"source": "loop", "step": turns, "parents": {}}
+    return checkpoint, metadata
+
+
+def _legacy_encode(serde: JsonPlusSerializer, checkpoint, metadata, config) -> bytes:
+    """与旧版 SimpleRedisSaver.aput 相同的编码方式"""
+    type_str, data_raw = serde.dumps_typed(checkpoint)
+    save_data = {
+        "checkpoint": [type_str, data_raw.hex()],
+        "metadata": metadata,
+        "parent_config": config,
+        "encoding": "hex",
+    }
+    return json.dumps(save_data, default=str).encode("utf-8")
+
+
+def _measure(func, n: int) -> list[float]:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name: str, encode: list[float], decode: list[float], size: int) -> None:
+    print(f"{name:<14} encode p50={statistics.median(encode):7.3f} ms  "
+          f"decode p50={statistics.median(decode):7.3f} ms  size={size:>9} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点编码格式基准测试")
+    parser.add_argument("--turns", type=int, default=20, help="检查点中的对话轮数")
+    parser.add_argument("--answer-chars", type=int, default=2000, help="每轮回答的字符数")
+    parser.add_argument("--iterations", type=int, default=200, help="每种格式的重复次数")
+    parser.add_argument("--level", type=int, default=3, help="zstd 压缩级别")
+    args = parser.parse_args()
+
+    serde = JsonPlusSerializer()
+    checkpoint, metadata = _build_checkpoint(args.turns, args.answer_chars)
+    config = {"configurable": {"thread_id": "benchmark"}}
+
+    codecs = {
+        "legacy": None,
+        "binary": CheckpointCodec(serde, compress=False),
+        "binary+zstd": CheckpointCodec(serde, compress=True, threshold=0, level=args.level),
+    }
+
+    for name, codec in codecs.items():
+        if codec is None:
+            encode = lambda: _legacy_encode(serde, checkpoint, metadata, config)
+            decode_codec = CheckpointCodec(serde)
+            blob = encode()
+            decode = lambda: decode_codec.decode(blob)
+        else:
+            encode = lambda: codec.encode(checkpoint, metadata, config)
+            blob = encode()
+            decode = lambda: codec.decode(blob)
+        _report(name, _measure(encode, args.iterations), _measure(decode, args.iterations), len(blob))
+
+
+if __name__ == "__main__":
+    main()
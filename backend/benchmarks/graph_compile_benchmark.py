@@ -0,0 +1,63 @@
+"""
+工作流图编译开销基准测试
+
+对比两种方式下每个请求获取图的耗时：
+1、per-request：每个请求都调用 create_graph 重新构建并编译 StateGraph（旧实现）
+2、registry：启动时编译一次，请求中从 graph_registry 直接取（新实现）
+
+运行方式：cd backend && python benchmarks/graph_compile_benchmark.py --requests 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from langgraph.checkpoint.memory import MemorySaver
+from work_flow.graph import create_graph, GraphRegistry
+
+
+def _measure(func, n: int) -> list[float]:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<14} mean={statistics.mean(samples):8.3f} ms  p50={statistics.median(samples):8.3f} ms  p99={p99:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工作流图编译开销基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="模拟的请求数")
+    args = parser.parse_args()
+
+    checkpointer = MemorySaver()
+
+    # 启动阶段：一次性编译
+    registry = GraphRegistry()
+    start = time.perf_counter()
+    registry.warmup(checkpointer)
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    per_request = _measure(lambda: create_graph(checkpointer=checkpointer), args.requests)
+    from_registry = _measure(lambda: registry.get("main", checkpointer), args.requests)
+
+    print(f"启动预编译耗时: {startup_ms:.3f} ms")
+    _report("per-request", per_request)
+    _report("registry", from_registry)
+    saved = statistics.mean(per_request) - statistics.mean(from_registry)
+    print(f"每个请求节省: {saved:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
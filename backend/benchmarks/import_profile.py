@@ -0,0 +1,62 @@
+"""
+API 冷启动导入耗时分析
+
+在子进程中以 python -X importtime 导入 main 模块，统计：
+1、导入总耗时，与 --target-ms 比较，超出时以非 0 退出码结束（可用于 CI 守护冷启动时间）
+2、累计耗时最高的若干模块，定位导入阶段的重量级依赖（如 transformer 模型、SDK 客户端）
+
+运行方式：cd backend && python benchmarks/import_profile.py --target-ms 3000 --top 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _profile(module: str) -> List[Tuple[str, int, int, int]]:
+    """返回 (模块名, 嵌套深度, self 耗时 us, 累计耗时 us) 列表"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"导入 {module} 失败")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 冷启动导入耗时分析")
+    parser.add_argument("--module", default="main", help="要分析的入口模块")
+    parser.add_argument("--target-ms", type=float, default=3000.0, help="导入总耗时目标（毫秒）")
+    parser.add_argument("--top", type=int, default=20, help="输出累计耗时最高的模块数")
+    args = parser.parse_args()
+
+    entries = _profile(args.module)
+    total_ms = next(cumulative for name, _, _, cumulative in entries if name == args.module) / 1000
+
+    print(f"导入 {args.module} 总耗时: {total_ms:.1f} ms  (目标 {args.target_ms:.0f} ms)")
+    print(f"\n累计耗时最高的 {args.top} 个模块:")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, depth, self_us, cumulative_us in sorted(entries, key=lambda e: e[3], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{name}")
+
+    if total_ms > args.target_ms:
+        print(f"\n超出目标 {total_ms - args.target_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
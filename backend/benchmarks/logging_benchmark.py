@@ -0,0 +1,103 @@
+"""
+日志写入开销基准测试
+
+模拟高 QPS 下每个请求输出若干条日志（含大消息，如检索结果、模型输出），对比 logging.sink_mode 的几种取值：
+1、sync：同步写文件（旧配置）
+2、process：loguru 自带的 enqueue，记录经 pickle 后通过管道交给写入线程
+3、queue：进程内线程队列，请求路径上只做格式化与入队
+4、queue+hot：在 queue 基础上对热点日志器截断超长消息并采样
+输出每个请求花在日志调用上的耗时分位数、事件循环延迟、总吞吐，以及请求结束后写完队列的耗时
+
+运行方式：cd backend && python benchmarks/logging_benchmark.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from loguru import logger
+
+from benchmarks.workflow_load_test import LoopLagMonitor, _percentile
+from config.loguru_config import HotLoggerPolicy, LoguruConfigManager
+from config.models import HotLoggerConfig
+
+FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+
+
+def _configure(manager: LoguruConfigManager, mode: str, path: str, sample_rate: float, max_chars: int) -> None:
+    """与 LoguruConfigManager 相同的方式添加单个文件 sink"""
+    manager.stop_queues()
+    logger.remove()
+    manager.config.logging.sink_mode = mode.split("+")[0]
+    rules = {}
+    if mode.endswith("+hot"):
+        rules = {__name__: HotLoggerConfig(sample_rate=sample_rate, max_message_chars=max_chars)}
+    logger.configure(patcher=HotLoggerPolicy(rules).patch)
+    manager._add_sink("benchmark", path, format=FORMAT, level="INFO", encoding="utf-8")
+
+
+async def _request(payload: str, messages: int, samples: List[float]) -> None:
+    spent = 0.0
+    for i in range(messages):
+        start = time.perf_counter()
+        logger.info(f"第 {i} 条日志: {payload}")
+        spent += time.perf_counter() - start
+        # 模拟请求中的其它异步工作
+        await asyncio.sleep(0)
+    samples.append(spent * 1000)
+
+
+async def _run(manager: LoguruConfigManager, mode: str, args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure(manager, mode, os.path.join(tmp, "app.log"), args.sample_rate, args.max_chars)
+        payload = "检索结果" * (args.message_chars // 4)
+        samples: List[float] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with semaphore:
+                await _request(payload, args.messages_per_request, samples)
+
+        monitor = LoopLagMonitor(interval_ms=5.0)
+        monitor.start()
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(args.requests)])
+        wall_s = time.perf_counter() - start
+        await monitor.stop()
+        drain_start = time.perf_counter()
+        await logger.complete()
+        manager.stop_queues(timeout=600)
+        drain_s = time.perf_counter() - drain_start
+        logger.remove()
+        size = os.path.getsize(os.path.join(tmp, "app.log"))
+
+    print(f"[{mode:<12}] 每请求日志耗时 p50={statistics.median(samples):7.3f} ms  p99={_percentile(samples, 0.99):7.3f} ms  "
+          f"吞吐={args.requests / wall_s:8.1f} req/s  事件循环延迟 p99={_percentile(monitor.samples, 0.99):6.2f} ms  "
+          f"写完队列={drain_s:5.2f} s  日志文件={size / 1024 / 1024:.1f} MB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="日志写入开销基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发请求数")
+    parser.add_argument("--messages-per-request", type=int, default=10, help="每个请求输出的日志条数")
+    parser.add_argument("--message-chars", type=int, default=8000, help="每条日志消息的字符数")
+    parser.add_argument("--sample-rate", type=float, default=0.2, help="enqueue+hot 模式下的采样比例")
+    parser.add_argument("--max-chars", type=int, default=2000, help="enqueue+hot 模式下的截断长度")
+    args = parser.parse_args()
+
+    manager = LoguruConfigManager()
+    for mode in ("sync", "process", "queue", "queue+hot"):
+        await _run(manager, mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
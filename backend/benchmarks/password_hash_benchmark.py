@@ -0,0 +1,92 @@
+"""
+登录突发场景下的事件循环延迟基准测试
+
+模拟 N 个并发登录请求同时校验密码，对比两种执行方式：
+1、inline：在协程中直接调用 verify_password（旧实现），哈希运算期间事件循环被阻塞
+2、pool：通过 PasswordHashPool 在有界线程池中执行
+同时统计登录耗时分位数与事件循环延迟（同一 worker 上 SSE 流的卡顿程度）
+
+运行方式：cd backend && python benchmarks/password_hash_benchmark.py --logins 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from benchmarks.stubs import install_stub_knowledge_service
+from benchmarks.workflow_load_test import LoopLagMonitor, _percentile
+
+# services.auth_service 与 routes 包存在循环导入，需先导入 routes；知识库服务用桩替代，避免加载嵌入模型
+install_stub_knowledge_service(0)
+import routes  # noqa: F401
+from services.auth_service import PasswordHashBusyError, PasswordHashPool, get_password_hash, verify_password
+
+
+async def _login_inline(password: str, hashed: str) -> bool:
+    return verify_password(password, hashed)
+
+
+async def _burst(login, logins: int, password: str, hashed: str):
+    latencies: List[float] = []
+    rejected = 0
+
+    async def one():
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            await login(password, hashed)
+        except PasswordHashBusyError:
+            rejected += 1
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    # 先让监控跑一个周期作为基线
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(logins)])
+    wall_s = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    return latencies, rejected, wall_s, monitor.samples
+
+
+def _report(name: str, latencies: List[float], rejected: int, wall_s: float, loop_lag: List[float]) -> None:
+    print(f"[{name}] 完成 {len(latencies)}  拒绝 {rejected}  总耗时 {wall_s:.2f} s  吞吐 {len(latencies) / wall_s:.1f} 次/s")
+    if latencies:
+        print(f"[{name}] 登录耗时 p50={statistics.median(latencies):8.1f} ms  p99={_percentile(latencies, 0.99):8.1f} ms")
+    if loop_lag:
+        print(f"[{name}] 事件循环延迟 mean={statistics.mean(loop_lag):7.2f} ms  p99={_percentile(loop_lag, 0.99):7.2f} ms  "
+              f"max={max(loop_lag):7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="登录突发场景下的事件循环延迟基准测试")
+    parser.add_argument("--logins", type=int, default=50, help="并发登录请求数")
+    parser.add_argument("--workers", type=int, default=4, help="哈希线程池大小")
+    parser.add_argument("--max-pending", type=int, default=64, help="排队请求上限")
+    args = parser.parse_args()
+
+    password = "benchmark-password"
+    hashed = get_password_hash(password)
+
+    _report("inline", *await _burst(_login_inline, args.logins, password, hashed))
+
+    pool = PasswordHashPool(workers=args.workers, max_pending=args.max_pending)
+    try:
+        _report("pool", *await _burst(pool.verify, args.logins, password, hashed))
+        print(f"[pool] 线程池统计: {pool.get_stats()}")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
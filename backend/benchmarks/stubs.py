@@ -0,0 +1,287 @@
+"""
+基准测试用的本地桩实现
+在不依赖外部服务的情况下驱动工作流，所有桩的输出都是确定性的，延迟可配置：
+    StubChatModel:       替代 DeepSeek / OpenAI 聊天模型，支持 token 级流式输出
+    StubAgent:           替代 work_flow.agent.get_agent 返回的 Agent
+    StubSearchClient:    替代 Tavily HTTP 请求
+    StubKnowledgeService:替代基于 Milvus 的 knowledge_service
+    StubRedis:           替代 redis.asyncio.Redis，供 SimpleRedisSaver 使用
+"""
+import asyncio
+import fnmatch
+import sys
+import time
+import types
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+@dataclass
+class StubLatency:
+    """各个桩的延迟配置（毫秒）"""
+    llm_first_token_ms: float = 300.0
+    llm_token_ms: float = 20.0
+    llm_tokens: int = 50
+    search_ms: float = 800.0
+    milvus_ms: float = 50.0
+    redis_ms: float = 1.0
+
+
+class StubChatModel(BaseChatModel):
+    """固定输出的聊天模型，按配置的首 token 延迟与 token 间隔输出"""
+    response: str = "ok"
+    first_token_ms: float = 300.0
+    token_ms: float = 20.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat-model"
+
+    def _chunks(self) -> List[str]:
+        # 每个 token 用一个字符近似
+        return list(self.response) or [""]
+
+    def _latency_s(self) -> float:
+        return (self.first_token_ms + self.token_ms * len(self._chunks())) / 1000
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._latency_s())
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._latency_s())
+        return self._result()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for index, token in enumerate(self._chunks()):
+            if index:
+                await asyncio.sleep(self.token_ms / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class StubAgent:
+    """与 create_agent 返回值接口一致的最小 Agent：{"messages": [...]} -> {"messages": [..., AIMessage]}"""
+
+    def __init__(self, system_prompt: str, llm: StubChatModel):
+        self.system_prompt = system_prompt
+        self.llm = llm
+
+    async def ainvoke(self, input: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        messages: List[BaseMessage] = [HumanMessage(content=self.system_prompt)] + list(input.get("messages", []))
+        response = await self.llm.ainvoke(messages, config=config)
+        return {"messages": messages + [response]}
+
+
+def make_stub_get_agent(latency: StubLatency, intent: str = "research"):
+    """生成替代 work_flow.agent.get_agent 的协程函数，按 system prompt（见 AgentPrompts）返回对应的固定输出"""
+
+    async def get_agent(system_prompt: str, llm_type: str = "standard"):
+        if "意图识别专家" in system_prompt:
+            response = intent
+        elif "会话总结助手" in system_prompt:
+            response = "压测会话"
+        else:
+            response = "压" * latency.llm_tokens
+        llm = StubChatModel(response=response, first_token_ms=latency.llm_first_token_ms, token_ms=latency.llm_token_ms)
+        return StubAgent(system_prompt, llm)
+
+    return get_agent
+
+
+class _StubResponse:
+    def __init__(self, payload: Dict[str, Any]):
+        self._payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self) -> None:
+        return None
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+
+class StubSearchClient:
+    """替代 WebSearchService.client，模拟 Tavily /search 接口"""
+
+    def __init__(self, latency_ms: float, max_results: int = 5):
+        self.latency_ms = latency_ms
+        self.max_results = max_results
+        self.calls = 0
+
+    async def post(self, url: str, **kwargs) -> _StubResponse:
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        query = (kwargs.get("json") or {}).get("query", "")
+        results = [
+            {"title": f"结果 {i}", "url": f"https://example.com/{i}", "content": f"{query} 的第 {i} 条网络结果。" * 5,
+             "score": 1.0 - i * 0.1}
+            for i in range(self.max_results)
+        ]
+        return _StubResponse({"query": query, "results": results})
+
+
+class StubKnowledgeService:
+    """替代 knowledge_service，search_content 返回固定的召回结果"""
+
+    def __init__(self, latency_ms: float, limit: int = 5):
+        self.latency_ms = latency_ms
+        self.limit = limit
+
+    async def search_content(self, query, limit: int = 5, search_strategy=None, file_id=None):
+        await asyncio.sleep(self.latency_ms / 1000)
+        queries = [query] if isinstance(query, str) else query
+        return [
+            [
+                {"file_id": f"file-{i}", "file_name": f"文档{i}.pdf", "text": f"{q} 相关的知识库片段 {i}。" * 5,
+                 "score": 0.03 - i * 0.002}
+                for i in range(min(limit, self.limit))
+            ]
+            for q in queries
+        ]
+
+
+def install_stub_knowledge_service(latency_ms: float) -> StubKnowledgeService:
+    """
+    在 services.knowledge_service 被导入前注册桩模块，
+    避免导入时加载 HuggingFace 嵌入模型并连接 Milvus
+    """
+    service = StubKnowledgeService(latency_ms)
+    module = types.ModuleType("services.knowledge_service")
+    module.knowledge_service = service
+    sys.modules["services.knowledge_service"] = module
+    return service
+
+
+class _StubPipeline:
+    """StubRedis 的管道：缓存命令，execute 时一次往返执行"""
+
+    def __init__(self, redis: "StubRedis"):
+        self._redis = redis
+        self._commands: List[tuple] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> List[Any]:
+        await self._redis._round_trip()
+        results = [getattr(self._redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._commands = []
+
+
+class StubRedis:
+    """内存版 Redis 客户端，实现 SimpleRedisSaver 用到的命令，每次往返（或每个管道）加上固定延迟"""
+
+    def __init__(self, latency_ms: float = 1.0):
+        self.latency_ms = latency_ms
+        self.store: Dict[str, Any] = {}
+        self.round_trips = 0
+
+    async def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    def __getattr__(self, name: str):
+        # 单条命令：一次往返后执行对应的 _<command> 实现
+        impl = getattr(type(self), f"_{name}", None)
+        if impl is None:
+            raise AttributeError(name)
+
+        async def command(*args, **kwargs):
+            await self._round_trip()
+            return impl(self, *args, **kwargs)
+        return command
+
+    def pipeline(self, transaction: bool = True) -> _StubPipeline:
+        return _StubPipeline(self)
+
+    async def scan_iter(self, match: str = "*"):
+        await self._round_trip()
+        for key in [k for k in self.store if fnmatch.fnmatchcase(k, match)]:
+            yield key.encode("utf-8")
+
+    async def aclose(self) -> None:
+        return None
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    def _ping(self) -> bool:
+        return True
+
+    def _get(self, key: str):
+        return self.store.get(key)
+
+    def _set(self, key: str, value, ex: Optional[int] = None):
+        self.store[key] = self._encode(value)
+        return True
+
+    def _delete(self, *keys) -> int:
+        keys = [key.decode("utf-8") if isinstance(key, bytes) else key for key in keys]
+        return sum(1 for key in keys if self.store.pop(key, None) is not None)
+
+    def _expire(self, key: str, seconds: int) -> bool:
+        return key in self.store
+
+    def _hset(self, key: str, field: str, value) -> int:
+        bucket = self.store.setdefault(key, {})
+        created = field.encode("utf-8") not in bucket
+        bucket[field.encode("utf-8")] = self._encode(value)
+        return int(created)
+
+    def _hsetnx(self, key: str, field: str, value) -> int:
+        bucket = self.store.setdefault(key, {})
+        if field.encode("utf-8") in bucket:
+            return 0
+        bucket[field.encode("utf-8")] = self._encode(value)
+        return 1
+
+    def _hgetall(self, key: str) -> Dict[bytes, bytes]:
+        return dict(self.store.get(key, {}))
+
+    def _zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        zset = self.store.setdefault(key, {})
+        added = sum(1 for member in mapping if member not in zset)
+        zset.update(mapping)
+        return added
+
+    def _zcard(self, key: str) -> int:
+        return len(self.store.get(key, {}))
+
+    def _zrem(self, key: str, *members: str) -> int:
+        zset = self.store.get(key, {})
+        return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    def _sorted_members(self, key: str, reverse: bool) -> List[bytes]:
+        zset = self.store.get(key, {})
+        return [m.encode("utf-8") for m, _ in sorted(zset.items(), key=lambda item: item[1], reverse=reverse)]
+
+    def _zrange(self, key: str, start: int, end: int) -> List[bytes]:
+        members = self._sorted_members(key, reverse=False)
+        return members[start:] if end == -1 else members[start:end + 1]
+
+    def _zrevrange(self, key: str, start: int, end: int) -> List[bytes]:
+        members = self._sorted_members(key, reverse=True)
+        return members[start:] if end == -1 else members[start:end + 1]
@@ -0,0 +1,221 @@
+"""
+workflow_stream / workflow_test 接口压测
+
+在当前进程内启动 uvicorn 服务，N 个模拟用户并发调用：
+    POST /api/sessions/{id}/workflow_stream   (SSE)
+    POST /api/sessions/{id}/workflow_test
+LLM、Tavily、Milvus、Redis 替换为 benchmarks/stubs.py 中延迟可配置的确定性桩，
+鉴权通过 dependency_overrides 跳过；PostgreSQL 仍使用 config.yaml 中配置的真实数据库
+（long_term_memory_import / memory_summary 等节点需要读写会话表）。
+
+输出：吞吐量、TTFT（首个 llm_stream 事件）、端到端延迟分位数、事件循环延迟
+
+运行方式：
+    cd backend && python benchmarks/workflow_load_test.py --users 20 --requests-per-user 5 --endpoint stream
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+from benchmarks.stubs import (
+    StubLatency, StubRedis, StubSearchClient, install_stub_knowledge_service, make_stub_get_agent,
+)
+
+
+@dataclass
+class RequestResult:
+    endpoint: str
+    ok: bool
+    e2e_ms: float
+    ttft_ms: Optional[float] = None
+    events: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class LoopLagMonitor:
+    """周期性 sleep，统计实际唤醒时间与预期时间的差值，即事件循环延迟"""
+    interval_ms: float = 10.0
+    samples: List[float] = field(default_factory=list)
+    _task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.samples.append(max(0.0, (time.perf_counter() - start - interval) * 1000))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _call_stream(client, session_id: str, query: str) -> RequestResult:
+    start = time.perf_counter()
+    ttft = None
+    events = 0
+    try:
+        async with client.stream("POST", f"/api/sessions/{session_id}/workflow_stream", params={"query": query}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                events += 1
+                if ttft is None and '"llm_stream"' in line:
+                    ttft = (time.perf_counter() - start) * 1000
+                if '"event": "error"' in line:
+                    return RequestResult("stream", False, (time.perf_counter() - start) * 1000, ttft, events, line)
+        return RequestResult("stream", True, (time.perf_counter() - start) * 1000, ttft, events)
+    except Exception as e:
+        return RequestResult("stream", False, (time.perf_counter() - start) * 1000, ttft, events, repr(e))
+
+
+async def _call_test(client, session_id: str, query: str) -> RequestResult:
+    start = time.perf_counter()
+    try:
+        response = await client.post(f"/api/sessions/{session_id}/workflow_test", params={"query": query})
+        response.raise_for_status()
+        e2e = (time.perf_counter() - start) * 1000
+        return RequestResult("test", True, e2e, e2e)
+    except Exception as e:
+        return RequestResult("test", False, (time.perf_counter() - start) * 1000, error=repr(e))
+
+
+async def _simulated_user(client, user_index: int, args, results: List[RequestResult]):
+    session_id = f"loadtest-{args.run_id}-{user_index}"
+    for i in range(args.requests_per_user):
+        # distinct_queries 控制查询的重复度，用于观察 Web 搜索缓存/合并的效果
+        query = f"压测问题 {(user_index * args.requests_per_user + i) % args.distinct_queries}"
+        if args.endpoint == "both":
+            call = _call_stream if i % 2 == 0 else _call_test
+        else:
+            call = _call_stream if args.endpoint == "stream" else _call_test
+        results.append(await call(client, session_id, query))
+
+
+def _report(results: List[RequestResult], wall_s: float, loop_lag: List[float], stub_redis: StubRedis,
+            stub_search: StubSearchClient, checkpoint_stats: dict):
+    ok = [r for r in results if r.ok]
+    print("\n=== 压测结果 ===")
+    print(f"请求总数: {len(results)}  成功: {len(ok)}  失败: {len(results) - len(ok)}  总耗时: {wall_s:.2f} s")
+    print(f"吞吐量: {len(ok) / wall_s:.2f} req/s")
+    for endpoint in sorted({r.endpoint for r in results}):
+        e2e = [r.e2e_ms for r in ok if r.endpoint == endpoint]
+        ttft = [r.ttft_ms for r in ok if r.endpoint == endpoint and r.ttft_ms is not None]
+        if not e2e:
+            continue
+        print(f"[{endpoint}] e2e  p50={statistics.median(e2e):9.1f} ms  p99={_percentile(e2e, 0.99):9.1f} ms  max={max(e2e):9.1f} ms")
+        if ttft:
+            print(f"[{endpoint}] ttft p50={statistics.median(ttft):9.1f} ms  p99={_percentile(ttft, 0.99):9.1f} ms")
+    if loop_lag:
+        print(f"事件循环延迟: mean={statistics.mean(loop_lag):.2f} ms  p99={_percentile(loop_lag, 0.99):.2f} ms  max={max(loop_lag):.2f} ms")
+    print(f"Redis 往返次数: {stub_redis.round_trips}  每轮平均: {checkpoint_stats['round_trips_per_turn_mean']}  "
+          f"每轮 p95: {checkpoint_stats['round_trips_per_turn_p95']}  Tavily 上游调用: {stub_search.calls}")
+    errors = [r.error for r in results if r.error]
+    if errors:
+        print(f"错误示例: {errors[0][:300]}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="workflow 接口压测")
+    parser.add_argument("--users", type=int, default=10, help="并发模拟用户数")
+    parser.add_argument("--requests-per-user", type=int, default=3, help="每个用户顺序发起的请求数")
+    parser.add_argument("--endpoint", choices=["stream", "test", "both"], default="stream")
+    parser.add_argument("--distinct-queries", type=int, default=1000, help="不同查询的数量，越小重复度越高")
+    parser.add_argument("--intent", choices=["rag", "tavily", "research"], default="research", help="意图识别桩的返回值")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=20.0)
+    parser.add_argument("--llm-tokens", type=int, default=50)
+    parser.add_argument("--search-ms", type=float, default=800.0)
+    parser.add_argument("--milvus-ms", type=float, default=50.0)
+    parser.add_argument("--redis-ms", type=float, default=1.0)
+    parser.add_argument("--write-behind", action="store_true", help="检查点写入缓冲到轮次结束再批量提交")
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+    args.run_id = uuid.uuid4().hex[:6]
+
+    latency = StubLatency(
+        llm_first_token_ms=args.llm_first_token_ms, llm_token_ms=args.llm_token_ms, llm_tokens=args.llm_tokens,
+        search_ms=args.search_ms, milvus_ms=args.milvus_ms, redis_ms=args.redis_ms,
+    )
+
+    # 1. 安装桩：必须在导入 main 之前替换 knowledge_service
+    install_stub_knowledge_service(latency.milvus_ms)
+
+    import httpx
+    import uvicorn
+    import work_flow.agent
+    from main import app
+    from db.database import db_startup, db_shutdown
+    from db.redis import SimpleRedisSaver
+    from routes.schema import User
+    from routes.utils import get_current_user_from_token
+    from services.web_search_service import get_web_search_service
+    from work_flow.graph import graph_registry
+    from datetime import datetime
+
+    work_flow.agent.get_agent = make_stub_get_agent(latency, intent=args.intent)
+    stub_search = StubSearchClient(latency.search_ms)
+    get_web_search_service().client = stub_search
+    stub_redis = StubRedis(latency.redis_ms)
+
+    bench_user = User(id=f"loadtest-user-{args.run_id}", username="loadtest", email="loadtest@example.com",
+                      created_at=datetime.now(), updated_at=datetime.now())
+    app.dependency_overrides[get_current_user_from_token] = lambda: bench_user
+
+    # 2. 手动完成 lifespan 中的初始化（使用 Redis 桩）
+    await db_startup()
+    app.state.checkpointer = SimpleRedisSaver(stub_redis)
+    app.state.checkpointer.write_behind = args.write_behind
+    graph_registry.warmup(app.state.checkpointer)
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, lifespan="off", log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    monitor = LoopLagMonitor()
+    results: List[RequestResult] = []
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits) as client:
+            monitor.start()
+            start = time.perf_counter()
+            await asyncio.gather(*[_simulated_user(client, i, args, results) for i in range(args.users)])
+            wall_s = time.perf_counter() - start
+            await monitor.stop()
+    finally:
+        server.should_exit = True
+        await server_task
+        await db_shutdown()
+
+    _report(results, wall_s, monitor.samples, stub_redis, stub_search, app.state.checkpointer.get_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
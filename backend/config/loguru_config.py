@@ -1,14 +1,102 @@
 """
 Loguru配置模块 - 基于配置系统的日志管理
 """
+import atexit
 import os
+import queue
+import random
 import sys
+import threading
 from pathlib import Path
 from loguru import logger
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from config.loader import get_config
-from config.models import LogLevel, ConsoleHandlerConfig, FileHandlerConfig
+from config.models import LogLevel, ConsoleHandlerConfig, FileHandlerConfig, HotLoggerConfig
+
+# WARNING 的级别数值：该级别及以上的日志不参与采样，队列满时也不丢弃
+_WARNING_NO = 30
+
+
+class HotLoggerPolicy:
+    """
+    热点日志器的采样与截断
+    作为全局 patcher 在记录创建时执行一次，所有 sink 看到相同的结果；
+    采样丢弃的记录打上 sampled_out 标记，由各 sink 的 filter 过滤
+    """
+
+    def __init__(self, hot_loggers: Dict[str, HotLoggerConfig]):
+        # 最长前缀优先匹配
+        self._rules = sorted(hot_loggers.items(), key=lambda item: len(item[0]), reverse=True)
+        self._resolved: Dict[str, Optional[HotLoggerConfig]] = {}
+
+    def _rule(self, name: str) -> Optional[HotLoggerConfig]:
+        if name not in self._resolved:
+            self._resolved[name] = next(
+                (rule for prefix, rule in self._rules if name == prefix or name.startswith(prefix + ".")), None
+            )
+        return self._resolved[name]
+
+    def patch(self, record) -> None:
+        rule = self._rule(record["name"] or "")
+        if rule is None:
+            return
+        if rule.sample_rate < 1.0 and record["level"].no < _WARNING_NO and random.random() >= rule.sample_rate:
+            record["extra"]["sampled_out"] = True
+            return
+        limit = rule.max_message_chars
+        if limit and len(record["message"]) > limit:
+            dropped = len(record["message"]) - limit
+            record["message"] = f"{record['message'][:limit]}...[已截断 {dropped} 字符]"
+
+
+def sampled_filter(record) -> bool:
+    """请求路径上的 sink 过滤器：跳过被采样丢弃的记录，以及由队列线程转写的记录"""
+    return not record["extra"].get("sampled_out", False) and "log_queue" not in record["extra"]
+
+
+class QueuedSink:
+    """
+    线程队列 sink
+    请求路径上的前端 sink 只把格式化好的文本放入内存队列，由后台线程以 raw 方式重新写入 loguru，
+    交给带 extra.log_queue 标记过滤的真正 sink（保留 loguru 的文件轮转 / 保留 / 压缩能力）
+    """
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._writer = logger.bind(log_queue=name).opt(raw=True)
+        self._thread = threading.Thread(target=self._run, name=f"log-queue-{name}", daemon=True)
+        self._thread.start()
+
+    def write(self, message) -> None:
+        item = (message.record["level"].name, str(message))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # 不在请求路径上阻塞：队列满时丢弃低级别日志，WARNING 及以上仍等待入队
+            if message.record["level"].no >= _WARNING_NO:
+                self._queue.put(item)
+            else:
+                self.dropped += 1
+
+    def owns(self, record) -> bool:
+        """真正 sink 的过滤器：只接收本队列转写的记录"""
+        return record["extra"].get("log_queue") == self.name
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            level, text = item
+            self._writer.log(level, text)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """写完队列中剩余的日志后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout)
 
 
 class LoguruConfigManager:
@@ -24,6 +112,7 @@ class LoguruConfigManager:
     def __init__(self):
         if not self._initialized:
             self.config = get_config()
+            self._queues: List[QueuedSink] = []
             self._setup_logging()
             self._initialized = True
     
@@ -38,6 +127,8 @@ class LoguruConfigManager:
         
         # 获取日志配置
         logging_config = self.config.logging
+        # 热点日志器的采样与截断
+        logger.configure(patcher=HotLoggerPolicy(logging_config.hot_loggers).patch)
         
         # 设置控制台处理器
         if hasattr(logging_config.handlers, 'console') and logging_config.handlers.console.enabled:
@@ -56,8 +147,9 @@ class LoguruConfigManager:
         """添加控制台处理器"""
         format_template = self._get_format_template("development")
         
-        logger.add(
-            sink=sys.stderr,
+        self._add_sink(
+            "console",
+            sys.stderr,
             format=format_template,
             level=config.level.value,
             colorize=config.colorize,
@@ -70,8 +162,9 @@ class LoguruConfigManager:
         format_template = self._get_format_template("production")
         
         # 主应用日志
-        logger.add(
-            sink=config.path,
+        self._add_sink(
+            "app",
+            config.path,
             format=format_template,
             level=config.level.value,
             rotation=config.rotation,
@@ -82,8 +175,9 @@ class LoguruConfigManager:
         
         # 错误日志（仅错误级别）
         error_log_path = str(Path(config.path).parent / "error.log")
-        logger.add(
-            sink=error_log_path,
+        self._add_sink(
+            "error",
+            error_log_path,
             format=format_template,
             level="ERROR",
             rotation=config.rotation,
@@ -94,6 +188,32 @@ class LoguruConfigManager:
         
 
     
+    def _add_sink(self, name: str, sink, *, format: str, level: str, colorize: bool = False,
+                  backtrace: bool = False, diagnose: bool = False, **sink_kwargs):
+        """按 sink_mode 添加 sink；sink_kwargs 为写入端参数（文件轮转、压缩等）"""
+        sink_mode = self.config.logging.sink_mode
+        if sink_mode != "queue":
+            logger.add(sink, format=format, level=level, colorize=colorize, backtrace=backtrace, diagnose=diagnose,
+                       filter=sampled_filter, enqueue=sink_mode == "process", **sink_kwargs)
+            return
+
+        queued = QueuedSink(name, self.config.logging.queue_max_size)
+        self._queues.append(queued)
+        # 前端：在请求线程中完成格式化并入队
+        logger.add(queued.write, format=format, level=level, colorize=colorize, backtrace=backtrace,
+                   diagnose=diagnose, filter=sampled_filter)
+        # 写入端：由队列线程写入，消息已格式化，按原样输出
+        logger.add(sink, format="{message}", level=0, colorize=False, filter=queued.owns, **sink_kwargs)
+
+    def stop_queues(self, timeout: float = 5.0):
+        """写完各队列中剩余的日志并停止后台线程"""
+        for queued in self._queues:
+            queued.stop(timeout)
+        self._queues = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {q.name: {"pending": q._queue.qsize(), "dropped": q.dropped} for q in self._queues}
+
     def _get_format_template(self, format_type: str) -> str:
         """获取格式模板"""
         formats = self.config.logging.format
@@ -117,6 +237,7 @@ class LoguruConfigManager:
     
     def reconfigure(self):
         """重新配置日志系统"""
+        self.stop_queues()
         self._initialized = False
         self.__init__()
 
@@ -134,6 +255,11 @@ def get_logger(name: str = None):
     return logger
 
 
+def shutdown_logging():
+    """写完队列中剩余的日志（应用退出时调用）"""
+    LoguruConfigManager().stop_queues()
+
+
 def reconfigure_logging():
     """重新配置日志系统"""
     manager = LoguruConfigManager()
@@ -141,4 +267,5 @@ def reconfigure_logging():
 
 
 # 预配置日志系统
-setup_logging()
\ No newline at end of file
+setup_logging()
+atexit.register(shutdown_logging)
\ No newline at end of file
@@ -43,11 +43,22 @@ class HandlerConfig(BaseModel):
     console: ConsoleHandlerConfig = Field(default_factory=ConsoleHandlerConfig)
     file: FileHandlerConfig = Field(default_factory=FileHandlerConfig)
 
+class HotLoggerConfig(BaseModel):
+    """热点日志器（按模块名前缀匹配）的采样与截断配置，WARNING 及以上级别不采样"""
+    sample_rate: float = Field(default=1.0, description="WARNING 以下日志的保留比例，0~1")
+    max_message_chars: int = Field(default=2000, description="单条日志消息的最大字符数，超出部分截断，0 表示不截断")
+
 class LoggingConfig(BaseModel):
     level: LogLevel = LogLevel.INFO
     format: Dict[str, str] = Field(default_factory=dict)
     handlers: HandlerConfig = Field(default_factory=HandlerConfig)
     loggers: Dict[str, str] = Field(default_factory=dict)
+    # sink 写入方式：queue 为进程内线程队列（请求路径上只入队，由后台线程写入）；
+    # process 为 loguru 自带的 enqueue（跨进程安全，但每条记录需 pickle 并经管道传输）；sync 为同步写入
+    sink_mode: str = "queue"
+    # queue 模式下的队列容量，队列满时丢弃 WARNING 以下的日志
+    queue_max_size: int = 10000
+    hot_loggers: Dict[str, HotLoggerConfig] = Field(default_factory=dict)
 
 # 飞书配置模型
 class URLBuilder:
@@ -99,6 +110,20 @@ class FeishuConfig(BaseModel):
     app_secret: str = Field(..., description="飞书应用密钥")
     base_url: str = "https://open.feishu.cn"
     timeout: int = 30
+    # 租户令牌过期前多少秒开始后台刷新（飞书在剩余有效期不足 30 分钟时才签发新令牌，不宜超过 1800）
+    token_refresh_ahead: int = 300
+    
+    # 长报告导出：按标题切分的单个章节最大字符数、并发转换的章节数、
+    # 文档接口每秒请求数上限、单次写入的最大块数（飞书上限 1000）、
+    # 单批写入返回业务错误码时的重试次数（网络错误与 5xx 由 HTTP 客户端重试）
+    export_section_chars: int = 20000
+    export_concurrency: int = 3
+    export_rate_limit: float = 3.0
+    export_batch_blocks: int = 500
+    export_write_retries: int = 3
+    # 未完成（写入失败）的导出保留的份数与时长（秒），超出后再次导出会新建文档
+    export_pending_max: int = 32
+    export_pending_ttl: int = 3600
     
     # API端点配置
     endpoints: Dict[str, str] = Field(default_factory=lambda: {
@@ -147,6 +172,25 @@ class PostgresDatabaseConfig(BaseModel):
     password: str = "postgres"
     dbname: str = "postgres"
 
+    # 异步引擎连接池（每个 worker 进程各自一份，总连接数 = workers * (pool_size + max_overflow)）
+    pool_size: int = 10
+    max_overflow: int = 20
+    # 池满时借出连接的最长等待（秒），超时抛出 TimeoutError
+    pool_timeout: float = 30.0
+    pool_recycle: int = 3600
+    pool_pre_ping: bool = True
+    # 同步引擎连接池，供线程池中的后台任务使用
+    sync_pool_size: int = 5
+    sync_max_overflow: int = 10
+
+    # 执行耗时超过该值（毫秒）的语句记录为慢查询
+    slow_query_ms: float = 200.0
+    # psycopg 服务端预编译：同一连接上执行同一语句达到该次数后改为预编译，null 表示关闭（经 pgbouncer 事务池连接时需关闭）
+    prepare_threshold: Optional[int] = 5
+    # 每个连接缓存的预编译语句数上限
+    prepared_max: int = 100
+    echo: bool = False
+
 # 服务配置模型
 class ServerConfig(BaseModel):
     host: str = "0.0.0.0"
@@ -154,6 +198,8 @@ class ServerConfig(BaseModel):
     workers: int = 1
     reload: bool = False
     log_level: str = "info"
+    # 服务开始接收请求后在后台预热嵌入模型等重量级资源；关闭时在首次使用时加载
+    warmup_on_startup: bool = True
 
 # HTTP客户端配置模型
 class HTTPClientConfig(BaseModel):
@@ -164,6 +210,21 @@ class HTTPClientConfig(BaseModel):
     keepalive_expiry: float = 5.0
     retries: int = 3
     backoff_factor: float = 0.5
+    # 单次退避等待上限（秒），Retry-After 同样受此限制
+    max_backoff: float = 10.0
+    # 幂等请求遇到这些状态码时重试（429 对任何方法都重试）
+    retry_statuses: List[int] = Field(default_factory=lambda: [429, 502, 503, 504])
+    # POST 按幂等请求重试的主机（LLM 服务的主机自动加入）
+    idempotent_post_hosts: List[str] = Field(default_factory=list)
+    
+    # 启用 HTTP/2 多路复用（需要安装 h2）
+    http2: bool = False
+    # 按主机覆盖连接数上限，未配置的主机使用 max_connections
+    host_max_connections: Dict[str, int] = Field(default_factory=dict)
+    
+    # 熔断：同一主机连续失败次数达到阈值后熔断，冷却 circuit_reset_timeout 秒后放行探测请求
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
     
     # 代理配置
     proxy: Optional[str] = None
@@ -175,12 +236,82 @@ class HTTPClientConfig(BaseModel):
     # 请求头默认值
     default_headers: Dict[str, str] = Field(default_factory=dict)
 
+# Web搜索配置模型
+class WebSearchConfig(BaseModel):
+    """Web搜索（Tavily）配置"""
+    base_url: str = Field(default="https://api.tavily.com", description="Tavily API基础URL")
+    max_results: int = Field(default=5, description="单次搜索返回的最大结果数")
+    cache_ttl: int = Field(default=600, description="搜索结果缓存时间（秒）")
+    cache_max_size: int = Field(default=1024, description="搜索结果缓存的最大条数")
+    rate_limit_per_minute: int = Field(default=60, description="每个租户每分钟允许的上游请求数")
+    rate_limit_burst: int = Field(default=10, description="每个租户允许的突发请求数")
+
+
+# 生成Prompt上下文预算配置模型
+class ContextBudgetConfig(BaseModel):
+    """llm_response 上下文 token 预算配置"""
+    max_prompt_tokens: int = Field(default=6000, description="最终生成Prompt的最大token数")
+    memory_ratio: float = Field(default=0.25, description="长期记忆与最近对话可占用的预算比例")
+    dedup_threshold: float = Field(default=0.8, description="检索片段重叠度超过该值时视为重复")
+    min_passage_tokens: int = Field(default=32, description="剩余预算低于该值时不再加入新的检索片段")
+
+    @field_validator('memory_ratio', 'dedup_threshold')
+    def validate_ratio(cls, v):
+        if not 0 <= v <= 1:
+            raise ValueError('比例必须在0到1之间')
+        return v
+
+
+# 链路追踪配置模型
+class TracingConfig(BaseModel):
+    """工作流节点 / LLM / 工具调用的链路追踪配置"""
+    enabled: bool = Field(default=True, description="是否记录span")
+    exporter: str = Field(default="none", description="span导出方式：json / otlp / none，none 时只在内存中聚合")
+    json_path: str = Field(default="logs/spans.jsonl", description="json导出的文件路径")
+    json_max_bytes: int = Field(default=50 * 1024 * 1024, description="json文件超过该大小时轮转，0 表示不轮转")
+    json_backup_count: int = Field(default=3, description="轮转保留的历史文件数")
+    export_queue_size: int = Field(default=10000, description="待导出span的队列上限，写盘跟不上时丢弃新的span")
+    otlp_endpoint: str = Field(default="http://localhost:4317", description="OTLP collector地址")
+    service_name: str = Field(default="deepsearch-backend", description="上报到OTLP的服务名")
+    sample_size: int = Field(default=1000, description="每类span在内存中保留的耗时样本数")
+
+
+# 会话运行时状态配置模型
+class SessionStateConfig(BaseModel):
+    """会话运行时状态（停止标志、活跃流、轮次锁）在多个 worker 之间共享的配置"""
+    cancel_channel: str = Field(default="session:cancel", description="停止生成的 pub/sub 频道")
+    turn_lock_ttl: int = Field(default=120, description="轮次锁过期时间（秒），生成期间会持续续期")
+    stop_flag_ttl: int = Field(default=60, description="停止标志的过期时间（秒）")
+    poll_interval: float = Field(default=1.0, description="未收到 pub/sub 消息时兜底检查停止标志的间隔（秒）")
+
+
+class SessionMemoryCacheConfig(BaseModel):
+    """会话记忆（长期摘要 + 最近几轮对话）的进程内缓存配置"""
+    max_sessions: int = Field(default=1024, description="缓存的最大会话数，超出时淘汰最久未使用的会话")
+    ttl: int = Field(default=1800, description="缓存过期时间（秒）")
+    recent_turns: int = Field(default=3, description="冷启动时导入的最近对话轮数")
+    invalidate_channel: str = Field(default="session:memory", description="会话记忆变更的 pub/sub 频道，用于使其它 worker 的缓存失效")
+
+
+class SSEConfig(BaseModel):
+    """SSE 流式输出配置"""
+    flush_interval: float = Field(default=0.05, description="LLM token 合并窗口（秒），窗口内的增量合并为一帧发送")
+    max_batch_chars: int = Field(default=256, description="合并帧的最大字符数，达到后立即发送")
+    heartbeat_interval: float = Field(default=15.0, description="空闲时发送心跳注释的间隔（秒），同时用于探测客户端断开")
+    max_queue: int = Field(default=256, description="生成端与发送端之间的缓冲事件数")
+    send_timeout: float = Field(default=30.0, description="缓冲区持续已满的最长时间（秒），超过即认为客户端过慢并停止生成")
+
 
 # 安全配置模型
 class SecurityConfig(BaseModel):
     access_token_expire_minutes: int = Field(default=30, description="访问令牌过期时间（分钟）")
     secret_key: str = Field(..., description="用于JWT签名的密钥")
     algorithm: str = Field(default="HS256", description="JWT算法")
+    user_cache_ttl: int = Field(default=60, description="令牌校验时进程内用户缓存的过期时间（秒）")
+    user_cache_max_size: int = Field(default=10000, description="进程内用户缓存的最大条目数")
+    revocation_channel: str = Field(default="auth:events", description="令牌吊销与用户缓存失效的 pub/sub 频道")
+    password_hash_workers: int = Field(default=4, description="密码哈希/校验线程池大小，即同时进行的哈希运算数")
+    password_hash_max_pending: int = Field(default=64, description="等待哈希线程的登录/注册请求上限，超出时直接返回 429")
 
 class StorageConfig(BaseModel):
     storage_type: str = Field(..., description="存储类型，例如'opendal'")
@@ -194,6 +325,10 @@ class EmbeddingConfig(BaseModel):
     api_key: str = Field(..., description="嵌入模型API密钥")
     base_url: str = Field(..., description="嵌入模型API基础URL")
     dim: int = Field(..., description="嵌入向量维度")
+    batch_max_size: int = Field(default=32, description="provider 为 tei 时单次 /embed 请求的最大文本数，需不大于服务端 --max-client-batch-size")
+    batch_max_wait_ms: float = Field(default=5.0, description="provider 为 tei 时动态批处理的等待窗口（毫秒）")
+    max_concurrent_batches: int = Field(default=4, description="provider 为 tei 时同时在途的批次数")
+    timeout: float = Field(default=30.0, description="嵌入服务请求超时（秒）")
 
 class MilvusConfig(BaseModel):
     """Milvus配置"""
@@ -208,6 +343,11 @@ class MineruConfig(BaseModel):
     base_url: str = Field(default="http://localhost:8000", description="Mineru API基础URL")
     parse_endpoint: str = Field(default="/file_parse", description="Mineru解析文件端点")
     use_vllm: bool = Field(default=False, description="是否使用vLLM")
+    base_urls: List[str] = Field(default_factory=list, description="多个Mineru实例地址，分片轮询分配；为空时只使用base_url")
+    shard_pages: int = Field(default=20, description="长PDF按页切分时每个分片的页数")
+    max_concurrent_shards: int = Field(default=2, description="每个Mineru实例同时解析的分片数")
+    shard_retries: int = Field(default=2, description="分片解析失败后的重试次数，重试时切换到下一个实例")
+    timeout: float = Field(default=600.0, description="单个分片的解析超时时间（秒）")
     
 class RedisConfig(BaseModel):
     """Redis 配置"""
@@ -216,6 +356,16 @@ class RedisConfig(BaseModel):
     password: Optional[str] = None
     db: int = 0
     url: Optional[str] = None  # 支持直接通过 URL 连接
+    max_connections: int = 50  # 连接池最大连接数
+    pool_timeout: float = 5.0  # 连接池耗尽时等待空闲连接的超时时间（秒）
+    socket_timeout: float = 5.0  # 单条命令的读写超时时间（秒）
+    checkpoint_compress: bool = True  # 检查点超过阈值时使用 zstd 压缩
+    checkpoint_compress_threshold: int = 4096  # 触发压缩的最小字节数
+    checkpoint_compress_level: int = 3  # zstd 压缩级别
+    checkpoint_history_limit: int = 20  # 每个线程保留的检查点数量，0 表示不限制
+    checkpoint_ttl: int = 604800  # 检查点过期时间（秒），0 表示不过期
+    checkpoint_write_behind: bool = False  # 检查点写入先缓冲，轮次结束时批量提交
+    checkpoint_write_behind_max_commands: int = 500  # 缓冲命令数超过该值时立即提交
 
 # 主配置模型
 class AppConfig(BaseModel):
@@ -230,6 +380,12 @@ class AppConfig(BaseModel):
     lite_llm: Optional[LiteLLMConfig] = Field(default=None, alias="lite-llm")
     postgres_database: PostgresDatabaseConfig = Field(default_factory=PostgresDatabaseConfig)
     tavily_api_key: str = Field(..., description="Tavily API密钥")
+    web_search: WebSearchConfig = Field(default_factory=WebSearchConfig)
+    context_budget: ContextBudgetConfig = Field(default_factory=ContextBudgetConfig)
+    tracing: TracingConfig = Field(default_factory=TracingConfig)
+    session_state: SessionStateConfig = Field(default_factory=SessionStateConfig)
+    sse: SSEConfig = Field(default_factory=SSEConfig)
+    session_memory_cache: SessionMemoryCacheConfig = Field(default_factory=SessionMemoryCacheConfig)
     server: ServerConfig = Field(default_factory=ServerConfig)
     security: SecurityConfig
     http_client: HTTPClientConfig = Field(default_factory=HTTPClientConfig)
@@ -4,6 +4,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text
 from config.loguru_config import get_logger
 from config.loader import get_config
+from db.metrics import EngineMetrics, TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
 logger = get_logger(__name__)
 config = get_config()
 # 新创建的数据库连接URL
@@ -19,20 +20,25 @@ sync_engine = None
 # SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 SessionLocal = None
 SyncSessionLocal = None
+# 连接池与慢查询指标，由 /system/metrics 导出
+engine_metrics = {}
 from sqlalchemy.orm import sessionmaker
 
 async def db_startup():
     logger.info("正在初始化数据库连接池")
     global engine, SessionLocal, sync_engine, SyncSessionLocal
     if not engine and not SessionLocal:
+        db_config = config.postgres_database
         # 1. 异步引擎初始化
         engine = create_async_engine(
             url=pg_connection_url,
-            pool_size=10,  # 连接池大小：保持 10 个活跃连接
-            max_overflow=20,  # 最大溢出连接：连接池满时额外创建 20 个连接
-            pool_pre_ping=True,  # 连接预检：使用连接前检查连接是否有效
-            pool_recycle=3600,  # 连接回收时间：连接使用 1 小时后自动回收，防止连接过期
-            echo=False,  # 关闭 SQL 日志输出，生产环境建议关闭以提高性能
+            poolclass=TimedAsyncAdaptedQueuePool,
+            pool_size=db_config.pool_size,  # 连接池大小：保持的常驻连接数
+            max_overflow=db_config.max_overflow,  # 最大溢出连接：连接池满时额外创建的连接数
+            pool_timeout=db_config.pool_timeout,  # 池满时借出连接的最长等待
+            pool_pre_ping=db_config.pool_pre_ping,  # 连接预检：使用连接前检查连接是否有效
+            pool_recycle=db_config.pool_recycle,  # 连接回收时间：防止连接过期
+            echo=db_config.echo,  # 关闭 SQL 日志输出，生产环境建议关闭以提高性能
         )
         SessionLocal = async_sessionmaker(
             bind=engine,
@@ -40,22 +46,28 @@ async def db_startup():
             expire_on_commit=False,
         )
 
-        # 2. 同步引擎初始化 (使用 psycopg 驱动，去掉 +asyncpg 如果有的话，但在 pg_connection_url 里是 generic 的)
-        # 注意: pg_connection_url 当前定义为 "postgresql+psycopg://..."，这通常支持同步。
-        # 如果异步使用的是 +asyncpg，同步则不需要。
-        # 检查 pg_connection_url 的定义，它是 postgresql+psycopg://，这在 SQLAlchemy 2.0 中通常指 psycopg 3
-        # psycopg 3 支持同步和异步。
-        
+        # 2. 同步引擎初始化
+        # pg_connection_url 为 postgresql+psycopg://，psycopg 3 同时支持同步和异步
         sync_engine = create_engine(
             url=pg_connection_url,
-            pool_size=5, # 后台任务通常不需要太高并发
-            max_overflow=10,
-            pool_pre_ping=True,
-            pool_recycle=3600,
+            poolclass=TimedQueuePool,
+            pool_size=db_config.sync_pool_size, # 后台任务通常不需要太高并发
+            max_overflow=db_config.sync_max_overflow,
+            pool_timeout=db_config.pool_timeout,
+            pool_pre_ping=db_config.pool_pre_ping,
+            pool_recycle=db_config.pool_recycle,
         )
         SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
 
-        logger.info(f"数据库连接池初始化完成")
+        # 3. 连接池 / 慢查询指标与预编译语句设置
+        for name, target in (("async", engine.sync_engine), ("sync", sync_engine)):
+            engine_metrics[name] = EngineMetrics(name, db_config.slow_query_ms)
+            instrument_engine(target, engine_metrics[name], db_config.prepare_threshold, db_config.prepared_max)
+
+        per_worker = (db_config.pool_size + db_config.max_overflow
+                      + db_config.sync_pool_size + db_config.sync_max_overflow)
+        logger.info(f"数据库连接池初始化完成，每个 worker 最多 {per_worker} 个连接，"
+                    f"{config.server.workers} 个 worker 共 {per_worker * config.server.workers} 个")
 
 async def db_shutdown():
     """关闭数据库连接池"""
@@ -89,6 +101,11 @@ async def get_db() -> AsyncSession:
 
 
 
+def get_db_pool_stats() -> dict:
+    """连接池占用、借出等待耗时与语句耗时统计"""
+    return {name: metrics.get_stats() for name, metrics in engine_metrics.items()}
+
+
 # 检查数据库连接
 async def check_db_connection():
     """检查数据库连接"""
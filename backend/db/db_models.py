@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, Enum as SQLEnum, JSON, Text
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, Enum as SQLEnum, JSON, Text, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -49,9 +49,17 @@ class Session(Base):
     waiting_for = Column(String, nullable=True)
     context = Column(JSON, nullable=True)
     message_count = Column(Integer, default=0)
+    # 冗余字段：由 memory_summary 节点在持久化每轮对话时增量更新，供会话列表直接读取
+    last_message = Column(Text, nullable=True)
+    last_message_time = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    # 会话列表：按用户过滤、按更新时间倒序
+    __table_args__ = (
+        Index("ix_sessions_user_id_updated_at", "user_id", "updated_at"),
+    )
+
 
 
 class KnowledgeChunk(Base):
@@ -99,6 +107,11 @@ class ConversationHistory(Base):
     agent_output = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # 历史消息按 (created_at, id) keyset 分页
+    __table_args__ = (
+        Index("ix_conversation_history_session_created_id", "session_id", "created_at", "id"),
+    )
+
 
 class SessionSummary(Base):
     """长时记忆模型"""
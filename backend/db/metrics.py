@@ -0,0 +1,191 @@
+"""
+数据库连接池与语句耗时指标
+1、连接池：借出连接的等待耗时（含池满时排队、新建连接）、等待超时次数、当前占用与峰值占用
+2、语句：每条 SQL 的执行耗时分布；超过 slow_query_ms 的语句记录告警日志，并按语句汇总次数与最大耗时
+由 /system/metrics 导出，用于按 worker 数调整 pool_size / max_overflow
+"""
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from config.loguru_config import get_logger
+
+logger = get_logger(__name__)
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# 慢语句汇总最多保留的语句数
+MAX_SLOW_STATEMENTS = 50
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+class Histogram:
+    """按固定桶统计耗时（毫秒）"""
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回分位数所在桶的上界"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else float("inf")
+        return None
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class EngineMetrics:
+    """单个引擎的连接池与语句指标；同步引擎在后台线程中使用，计数在锁内更新"""
+
+    def __init__(self, name: str, slow_query_ms: float):
+        self.name = name
+        self.slow_query_ms = slow_query_ms
+        self.pool = None
+        self.checkout_wait = Histogram()
+        self.checkout_timeouts = 0
+        self.peak_checked_out = 0
+        self.queries = Histogram()
+        self.slow_statements: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def observe_checkout(self, elapsed_ms: float, timed_out: bool) -> None:
+        with self._lock:
+            self.checkout_wait.observe(elapsed_ms)
+            if timed_out:
+                self.checkout_timeouts += 1
+            elif self.pool is not None:
+                self.peak_checked_out = max(self.peak_checked_out, self.pool.checkedout())
+
+    def observe_query(self, statement: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.queries.observe(elapsed_ms)
+            if elapsed_ms < self.slow_query_ms:
+                return
+            key = WHITESPACE_RE.sub(" ", statement).strip()[:200]
+            entry = self.slow_statements.get(key)
+            if entry is None and len(self.slow_statements) < MAX_SLOW_STATEMENTS:
+                entry = self.slow_statements[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            if entry is not None:
+                entry["count"] += 1
+                entry["total_ms"] += elapsed_ms
+                entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        logger.warning(f"慢查询 [{self.name}] {elapsed_ms:.1f} ms: {key}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "checkout_wait": self.checkout_wait.to_dict(),
+                "checkout_timeouts": self.checkout_timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "queries": self.queries.to_dict(),
+                "slow_query_ms": self.slow_query_ms,
+                "slow_statements": sorted(
+                    ({"statement": statement, **{k: round(v, 2) for k, v in entry.items()}}
+                     for statement, entry in self.slow_statements.items()),
+                    key=lambda item: item["max_ms"], reverse=True,
+                ),
+            }
+        if self.pool is not None:
+            stats["pool"] = {
+                "size": self.pool.size(),
+                "checked_in": self.pool.checkedin(),
+                "checked_out": self.pool.checkedout(),
+                "overflow": self.pool.overflow(),
+                "max_overflow": self.pool._max_overflow,
+                "timeout": self.pool.timeout(),
+            }
+        return stats
+
+
+class _TimedPoolMixin:
+    """统计借出连接的等待耗时；metrics 在引擎创建后挂到连接池上"""
+    metrics: Optional[EngineMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_checkout((time.perf_counter() - start) * 1000, timed_out)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine: Engine, metrics: EngineMetrics,
+                      prepare_threshold: Optional[int], prepared_max: int) -> None:
+    """
+    挂载指标与预编译语句设置；异步引擎传入 engine.sync_engine
+    :param prepare_threshold: psycopg 在同一连接上执行同一语句达到该次数后改为服务端预编译，None 表示关闭
+    :param prepared_max: 每个连接缓存的预编译语句数上限
+    """
+    metrics.pool = engine.pool
+    engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "connect")
+    def _configure_connection(dbapi_connection, connection_record):
+        connection = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        connection.prepare_threshold = prepare_threshold
+        connection.prepared_max = prepared_max
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        metrics.observe_query(statement, (time.perf_counter() - start) * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
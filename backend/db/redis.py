@@ -1,111 +1,491 @@
-from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple,
+    WRITES_IDX_MAP, get_checkpoint_id, get_checkpoint_metadata,
+)
 from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
-from typing import Optional, Any, Sequence, Tuple
+from typing import Optional, Any, AsyncIterator, Dict, List, Sequence, Set, Tuple
+from collections import defaultdict, deque
+import asyncio
 import json
+import statistics
+import time
+import ormsgpack
+import zstandard
 from config.loader import get_config
+from config.loguru_config import get_logger
+from config.models import RedisConfig
 
-# 手动实现 Redis Saver，规避库版本兼容问题
-class SimpleRedisSaver(BaseCheckpointSaver):
-    def __init__(self, client):
-        super().__init__()
-        self.client = client
-        self.serde = JsonPlusSerializer()
+logger = get_logger(__name__)
 
-    async def aget_tuple(self, config: dict) -> Optional[CheckpointTuple]:
-        thread_id = config["configurable"]["thread_id"]
-        key = f"checkpoint:{thread_id}"
-        data = await self.client.get(key)
-        if not data:
-            return None
-        
+# 尝试导入 Redis 相关库
+try:
+    from redis.asyncio import BlockingConnectionPool, Redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+# 进程内共享的 Redis 客户端（连接池）
+_redis_client = None
+
+
+def build_redis_url(redis_config: Optional[RedisConfig]) -> str:
+    """根据配置拼接 Redis 连接 URL"""
+    if redis_config and redis_config.url:
+        return redis_config.url
+    if redis_config:
+        auth_part = f":{redis_config.password}@" if redis_config.password else ""
+        return f"redis://{auth_part}{redis_config.host}:{redis_config.port}/{redis_config.db}"
+    return "redis://localhost:6379/0"
+
+
+def get_redis_client():
+    """
+    获取共享的 Redis 客户端
+    使用阻塞式连接池：连接数达到上限时等待空闲连接，而不是直接报错
+    """
+    global _redis_client
+    if _redis_client is None:
+        redis_config = get_config().redis or RedisConfig()
+        pool = BlockingConnectionPool.from_url(
+            build_redis_url(redis_config),
+            max_connections=redis_config.max_connections,
+            timeout=redis_config.pool_timeout,
+            socket_timeout=redis_config.socket_timeout,
+            health_check_interval=30,
+        )
+        _redis_client = Redis(connection_pool=pool)
+    return _redis_client
+
+
+async def close_redis_client():
+    """关闭共享的 Redis 客户端及其连接池"""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+
+class CheckpointCodec:
+    """
+    检查点二进制编码
+    格式: MAGIC(4) + 版本(1) + 标志位(1) + payload
+    payload 为 msgpack 编码的 {"type", "checkpoint", "metadata", "parent_config"}，
+    checkpoint / metadata 为 JsonPlusSerializer 输出的原始字节，超过阈值时整体使用 zstd 压缩
+    不带 MAGIC 的数据视为旧版 JSON + hex 格式，读取时兼容
+    """
+    MAGIC = b"DSCP"
+    VERSION = 1
+    FLAG_ZSTD = 0x01
+    HEADER_SIZE = 6
+
+    def __init__(self, serde: JsonPlusSerializer, compress: bool = True, threshold: int = 4096, level: int = 3):
+        self.serde = serde
+        self.compress = compress
+        self.threshold = threshold
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, checkpoint: Checkpoint, metadata: CheckpointMetadata, parent_config: dict) -> bytes:
+        type_str, data = self.serde.dumps_typed(checkpoint)
+        payload = ormsgpack.packb({
+            "type": type_str,
+            "checkpoint": data,
+            "metadata": self.serde.dumps_typed(metadata),
+            "parent_config": parent_config,
+        }, default=str)
+        flags = 0
+        if self.compress and len(payload) >= self.threshold:
+            payload = self._compressor.compress(payload)
+            flags |= self.FLAG_ZSTD
+        return self.MAGIC + bytes([self.VERSION, flags]) + payload
+
+    def decode(self, data: bytes) -> Tuple[Checkpoint, CheckpointMetadata, Optional[dict]]:
+        if not data.startswith(self.MAGIC):
+            return self.decode_legacy(data)
+
+        version, flags = data[4], data[5]
+        if version != self.VERSION:
+            raise ValueError(f"不支持的检查点格式版本: {version}")
+        payload = data[self.HEADER_SIZE:]
+        if flags & self.FLAG_ZSTD:
+            payload = self._decompressor.decompress(payload)
+
+        saved_data = ormsgpack.unpackb(payload)
+        checkpoint = self.serde.loads_typed((saved_data["type"], saved_data["checkpoint"]))
+        metadata = self.serde.loads_typed(tuple(saved_data["metadata"]))
+        return checkpoint, metadata, saved_data.get("parent_config")
+
+    def decode_legacy(self, data) -> Tuple[Checkpoint, CheckpointMetadata, Optional[dict]]:
+        """解析旧版 JSON 格式（checkpoint 字节经 hex 编码后嵌入 JSON）"""
         if isinstance(data, bytes):
             data = data.decode('utf-8')
-            
+
         saved_data = json.loads(data)
-        
-        # 恢复 CheckpointTuple
+
         checkpoint_blob = saved_data["checkpoint"]
-        
+
         if isinstance(checkpoint_blob, list):
             checkpoint_blob = tuple(checkpoint_blob)
             encoding = saved_data.get("encoding", "utf-8")
-            
+
             type_str = checkpoint_blob[0]
             data_content = checkpoint_blob[1]
-            
+
             if encoding == "hex":
                 try:
                     data_content = bytes.fromhex(data_content)
                 except ValueError:
-                    pass 
-            
+                    pass
+
             checkpoint_blob = (type_str, data_content)
 
+        checkpoint = self.serde.loads_typed(checkpoint_blob)
+        return checkpoint, saved_data["metadata"], saved_data.get("parent_config")
+
+
+
+
+# write-behind 提交失败时，缓冲最多保留 checkpoint_write_behind_max_commands 的多少倍
+REQUEUE_LIMIT_FACTOR = 4
+
+
+# 手动实现 Redis Saver，规避库版本兼容问题
+class SimpleRedisSaver(BaseCheckpointSaver):
+    """
+    基于 Redis 的 checkpointer，按 (thread_id, checkpoint_ns, checkpoint_id) 保存完整历史：
+        checkpoint:{thread_id}:{ns}:{checkpoint_id}         检查点二进制数据 (String)
+        checkpoint_index:{thread_id}:{ns}                   检查点ID索引 (Sorted Set, score 为写入时间)
+        checkpoint_writes:{thread_id}:{ns}:{checkpoint_id}  节点的中间写入 (Hash, field 为 task_id:idx)
+    写入使用 MULTI 事务管道一次提交；每个线程只保留最近 history_limit 个检查点，所有 key 带 TTL
+    中间写入会随检查点一起返回 (pending_writes)，中断的运行可以从最后一个完成的节点继续
+
+    开启 write_behind 后，写命令先在内存中按线程缓冲，在以下时机通过一个管道批量提交：
+    轮次结束 (aend_turn)、读取该线程之前、缓冲命令数超过上限、服务关闭 (aflush)
+    进程崩溃时未提交的缓冲会丢失，此时只能从上一次提交的检查点恢复；
+    提交失败的命令放回缓冲下次重试，缓冲总量超过上限的 REQUEUE_LIMIT_FACTOR 倍时才丢弃
+    """
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.serde = JsonPlusSerializer()
+        redis_config = get_config().redis or RedisConfig()
+        self.codec = CheckpointCodec(
+            self.serde,
+            compress=redis_config.checkpoint_compress,
+            threshold=redis_config.checkpoint_compress_threshold,
+            level=redis_config.checkpoint_compress_level,
+        )
+        self.history_limit = redis_config.checkpoint_history_limit
+        self.ttl = redis_config.checkpoint_ttl or None
+        self.write_behind = redis_config.checkpoint_write_behind
+        self.write_behind_max_commands = redis_config.checkpoint_write_behind_max_commands
+
+        # write-behind 缓冲：thread_id -> 待提交的命令 / 涉及的索引 key
+        self._pending: Dict[str, List[tuple]] = defaultdict(list)
+        self._pending_namespaces: Dict[str, Set[str]] = defaultdict(set)
+        self._flush_locks: Dict[str, asyncio.Lock] = {}
+        # 正在持有或等待各线程提交锁的协程数，为 0 时回收锁
+        self._flush_users: Dict[str, int] = defaultdict(int)
+
+        # 往返次数统计：当前轮次按线程累计，轮次结束后记入 _turn_round_trips
+        self._round_trips: Dict[str, int] = defaultdict(int)
+        self._turn_round_trips: deque = deque(maxlen=1000)
+        self._stats = {"round_trips": 0, "flushes": 0, "flush_errors": 0}
+
+    @staticmethod
+    def _checkpoint_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _index_key(thread_id: str, checkpoint_ns: str) -> str:
+        return f"checkpoint_index:{thread_id}:{checkpoint_ns}"
+
+    @staticmethod
+    def _writes_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint_writes:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _decode_str(value) -> str:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _count_round_trip(self, thread_id: Optional[str]) -> None:
+        self._stats["round_trips"] += 1
+        if thread_id is not None:
+            self._round_trips[thread_id] += 1
+
+    async def _execute(self, thread_id: str, commands: List[tuple], namespaces: Set[str]) -> None:
+        """
+        通过一个 MULTI 管道提交写命令
+        对写入了新检查点的每个 namespace 追加 ZCARD，超出历史上限时再裁剪最旧的检查点
+        """
+        namespaces = sorted(namespaces)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for name, args, kwargs in commands:
+                getattr(pipe, name)(*args, **kwargs)
+            for checkpoint_ns in namespaces:
+                pipe.zcard(self._index_key(thread_id, checkpoint_ns))
+            results = await pipe.execute()
+        self._count_round_trip(thread_id)
+
+        if not self.history_limit or not namespaces:
+            return
+        for checkpoint_ns, size in zip(namespaces, results[-len(namespaces):]):
+            if size > self.history_limit:
+                await self._trim_history(thread_id, checkpoint_ns, size - self.history_limit)
+
+    async def _submit(self, thread_id: str, commands: List[tuple], checkpoint_ns: Optional[str] = None) -> None:
+        """
+        提交写命令：write-behind 模式下仅缓冲，否则立即执行
+        :param checkpoint_ns: 写入了新检查点时传入，用于提交后检查历史数量
+        """
+        namespaces = {checkpoint_ns} if checkpoint_ns is not None else set()
+        if not self.write_behind:
+            await self._execute(thread_id, commands, namespaces)
+            return
+
+        self._pending[thread_id].extend(commands)
+        self._pending_namespaces[thread_id].update(namespaces)
+        if len(self._pending[thread_id]) >= self.write_behind_max_commands:
+            await self._flush_thread(thread_id)
+
+    async def _flush_thread(self, thread_id: str) -> None:
+        """提交某个线程缓冲的全部写命令；失败时放回缓冲头部，下次提交时重试"""
+        lock = self._flush_locks.get(thread_id)
+        if lock is None:
+            lock = self._flush_locks[thread_id] = asyncio.Lock()
+        self._flush_users[thread_id] += 1
         try:
-             checkpoint = self.serde.loads_typed(checkpoint_blob)
+            async with lock:
+                commands = self._pending.pop(thread_id, None)
+                namespaces = self._pending_namespaces.pop(thread_id, set())
+                if not commands:
+                    return
+                self._stats["flushes"] += 1
+                try:
+                    await self._execute(thread_id, commands, namespaces)
+                except Exception as e:
+                    self._stats["flush_errors"] += 1
+                    self._requeue(thread_id, commands, namespaces, e)
+                    raise
+        finally:
+            self._flush_users[thread_id] -= 1
+            if not self._flush_users[thread_id]:
+                del self._flush_users[thread_id]
+                self._flush_locks.pop(thread_id, None)
+
+    def _requeue(self, thread_id: str, commands: List[tuple], namespaces: Set[str], error: Exception) -> None:
+        """把提交失败的命令放回缓冲头部，保持写入顺序；写命令都是幂等的，重复提交不影响结果"""
+        pending = self._pending.get(thread_id, [])
+        if len(commands) + len(pending) > self.write_behind_max_commands * REQUEUE_LIMIT_FACTOR:
+            logger.error(f"检查点写缓冲提交失败 [Thread: {thread_id}]，缓冲已超过上限，丢弃 {len(commands)} 条命令: {error}")
+            return
+        self._pending[thread_id] = commands + pending
+        self._pending_namespaces[thread_id].update(namespaces)
+        logger.error(f"检查点写缓冲提交失败 [Thread: {thread_id}]，{len(commands)} 条命令放回缓冲等待重试: {error}")
+
+    async def aflush(self, thread_id: Optional[str] = None) -> None:
+        """提交缓冲的写命令；不指定 thread_id 时提交全部线程"""
+        thread_ids = [thread_id] if thread_id is not None else list(self._pending.keys())
+        for pending_thread_id in thread_ids:
+            await self._flush_thread(pending_thread_id)
+
+    async def aend_turn(self, thread_id: str) -> int:
+        """
+        一轮对话结束（包括异常中断和客户端断开）时调用：提交缓冲并记录本轮的 Redis 往返次数
+        :return: 本轮的往返次数
+        """
+        try:
+            await self.aflush(thread_id)
+        finally:
+            round_trips = self._round_trips.pop(thread_id, 0)
+            self._turn_round_trips.append(round_trips)
+        return round_trips
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取往返次数与写缓冲统计"""
+        per_turn = sorted(self._turn_round_trips)
+        return {
+            **self._stats,
+            "write_behind": self.write_behind,
+            "pending_commands": sum(len(commands) for commands in self._pending.values()),
+            "turns": len(per_turn),
+            "round_trips_per_turn_mean": round(statistics.mean(per_turn), 2) if per_turn else 0,
+            "round_trips_per_turn_p95": per_turn[min(len(per_turn) - 1, int(len(per_turn) * 0.95))] if per_turn else 0,
+        }
+
+    async def _checkpoint_ids(self, thread_id: str, checkpoint_ns: str) -> List[str]:
+        """按从新到旧的顺序返回线程的检查点ID"""
+        ids = await self.client.zrevrange(self._index_key(thread_id, checkpoint_ns), 0, -1)
+        self._count_round_trip(thread_id)
+        return [self._decode_str(i) for i in ids]
+
+    @classmethod
+    def _write_order(cls, field) -> Tuple[str, int]:
+        """写入 Hash 的 field 为 task_id:idx，按 (task_id, idx) 数值排序，保证 task:10 排在 task:2 之后"""
+        task_id, _, write_idx = cls._decode_str(field).rpartition(":")
+        return task_id, int(write_idx)
+
+    def _build_tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, data: bytes,
+                     writes: Dict[Any, bytes]) -> Optional[CheckpointTuple]:
+        try:
+            checkpoint, metadata, parent_config = self.codec.decode(data)
         except Exception as e:
-             print(f"Error loading checkpoint: {e}")
-             return None
+            logger.error(f"加载检查点失败 [Thread: {thread_id}]: {e}")
+            return None
 
-        metadata = saved_data["metadata"]
-        parent_config = saved_data.get("parent_config")
-        
+        pending_writes = []
+        for _, value in sorted(writes.items(), key=lambda item: self._write_order(item[0])):
+            task_id, channel, type_str, blob = ormsgpack.unpackb(value)[:4]
+            pending_writes.append((task_id, channel, self.serde.loads_typed((type_str, blob))))
+
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+        return CheckpointTuple(config, checkpoint, metadata, parent_config, pending_writes)
+
+    async def _get_legacy_tuple(self, config: dict) -> Optional[CheckpointTuple]:
+        """读取旧版每线程单 key 的检查点 (checkpoint:{thread_id})，用于平滑迁移"""
+        thread_id = config["configurable"]["thread_id"]
+        data = await self.client.get(f"checkpoint:{thread_id}")
+        self._count_round_trip(thread_id)
+        if not data:
+            return None
+        try:
+            checkpoint, metadata, parent_config = self.codec.decode(data)
+        except Exception as e:
+            logger.error(f"加载检查点失败 [Thread: {thread_id}]: {e}")
+            return None
         return CheckpointTuple(config, checkpoint, metadata, parent_config, [])
 
-    def _sanitize_for_json(self, obj):
-        """递归清洗对象，使其可被 JSON 序列化"""
-        if isinstance(obj, (str, int, float, bool, type(None))):
-            return obj
-        if isinstance(obj, bytes):
-            return obj.hex() 
-        if isinstance(obj, (list, tuple)):
-            return [self._sanitize_for_json(item) for item in obj]
-        if isinstance(obj, dict):
-            return {k: self._sanitize_for_json(v) for k, v in obj.items() if isinstance(k, str)}
-        return None 
+    async def aget_tuple(self, config: dict) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        # 读之前先提交该线程的缓冲，保证读到最新写入
+        if self._pending.get(thread_id):
+            await self._flush_thread(thread_id)
+
+        if not checkpoint_id:
+            ids = await self.client.zrevrange(self._index_key(thread_id, checkpoint_ns), 0, 0)
+            self._count_round_trip(thread_id)
+            if not ids:
+                return await self._get_legacy_tuple(config) if not checkpoint_ns else None
+            checkpoint_id = self._decode_str(ids[0])
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+            pipe.hgetall(self._writes_key(thread_id, checkpoint_ns, checkpoint_id))
+            data, writes = await pipe.execute()
+        self._count_round_trip(thread_id)
+
+        if not data:
+            return None
+        return self._build_tuple(thread_id, checkpoint_ns, checkpoint_id, data, writes or {})
+
+    async def alist(
+        self,
+        config: Optional[dict],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[dict] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is not None:
+            threads = [(config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))]
+            await self.aflush(config["configurable"]["thread_id"])
+        else:
+            await self.aflush()
+            threads = []
+            async for key in self.client.scan_iter(match="checkpoint_index:*"):
+                _, thread_id, checkpoint_ns = self._decode_str(key).split(":", 2)
+                threads.append((thread_id, checkpoint_ns))
+
+        config_checkpoint_id = get_checkpoint_id(config) if config else None
+        before_id = get_checkpoint_id(before) if before else None
+
+        for thread_id, checkpoint_ns in threads:
+            for checkpoint_id in await self._checkpoint_ids(thread_id, checkpoint_ns):
+                if config_checkpoint_id and checkpoint_id != config_checkpoint_id:
+                    continue
+                # checkpoint_id 为 uuid6，字典序即时间顺序
+                if before_id and checkpoint_id >= before_id:
+                    continue
+                checkpoint_tuple = await self.aget_tuple(
+                    {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+                )
+                if checkpoint_tuple is None:
+                    continue
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                if limit is not None and limit <= 0:
+                    return
+                if limit is not None:
+                    limit -= 1
+                yield checkpoint_tuple
 
     async def aput(self, config: dict, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: dict) -> dict:
         thread_id = config["configurable"]["thread_id"]
-        key = f"checkpoint:{thread_id}"
-        
-        serialized_tuple = self.serde.dumps_typed(checkpoint)
-        type_str = serialized_tuple[0]
-        data_raw = serialized_tuple[1]
-        encoding = "utf-8"
-        
-        if isinstance(data_raw, bytes):
-            data_to_store = data_raw.hex()
-            encoding = "hex"
-        else:
-            data_to_store = data_raw
-        
-        clean_config = {
-            "configurable": config.get("configurable", {})
-        }
-        
-        clean_metadata = self._sanitize_for_json(metadata)
-
-        save_data = {
-            "checkpoint": [type_str, data_to_store], 
-            "metadata": clean_metadata,
-            "parent_config": clean_config,
-            "encoding": encoding
-        }
-        
-        def json_default(obj):
-            try:
-                return str(obj)
-            except:
-                return "<not_serializable>"
-        
-        await self.client.set(key, json.dumps(save_data, default=json_default))
-        return config
-
-    # 实现 aput_writes 以支持 LangGraph 3.x
-    async def aput_writes(self, config: dict, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
-        """存储中间写入结果"""
-        # 为了简化，我们暂时只做空实现，或者简单打印
-        # 完整的 RedisSaver 会将其存储到 Hash 或 List 中
-        # 如果不需要"从断点恢复"的高级功能，空实现通常是可以的
-        # print(f"DEBUG: aput_writes called for task {task_id}")
-        pass
\ No newline at end of file
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = checkpoint["id"]
+
+        parent_id = config["configurable"].get("checkpoint_id")
+        parent_config = (
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+            if parent_id else None
+        )
+        data = self.codec.encode(checkpoint, get_checkpoint_metadata(config, metadata), parent_config)
+
+        index_key = self._index_key(thread_id, checkpoint_ns)
+        commands = [
+            ("set", (self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id), data), {"ex": self.ttl}),
+            ("zadd", (index_key, {checkpoint_id: time.time()}), {}),
+        ]
+        if self.ttl:
+            commands.append(("expire", (index_key, self.ttl), {}))
+        await self._submit(thread_id, commands, checkpoint_ns=checkpoint_ns)
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+    async def _trim_history(self, thread_id: str, checkpoint_ns: str, count: int) -> None:
+        """删除最旧的 count 个检查点及其中间写入"""
+        index_key = self._index_key(thread_id, checkpoint_ns)
+        expired = [self._decode_str(i) for i in await self.client.zrange(index_key, 0, count - 1)]
+        self._count_round_trip(thread_id)
+        if not expired:
+            return
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(index_key, *expired)
+            pipe.delete(
+                *[self._checkpoint_key(thread_id, checkpoint_ns, i) for i in expired],
+                *[self._writes_key(thread_id, checkpoint_ns, i) for i in expired],
+            )
+            await pipe.execute()
+        self._count_round_trip(thread_id)
+
+    async def aput_writes(self, config: dict, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        """存储节点的中间写入结果，用于中断后从最后完成的节点恢复"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        writes_key = self._writes_key(thread_id, checkpoint_ns, checkpoint_id)
+
+        commands = []
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            field = f"{task_id}:{write_idx}"
+            type_str, blob = self.serde.dumps_typed(value)
+            packed = ormsgpack.packb([task_id, channel, type_str, blob, task_path])
+            # 普通写入已存在时不覆盖；特殊通道 (错误/中断等) 总是覆盖
+            commands.append(("hsetnx" if write_idx >= 0 else "hset", (writes_key, field, packed), {}))
+        if self.ttl:
+            commands.append(("expire", (writes_key, self.ttl), {}))
+        await self._submit(thread_id, commands)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """删除线程的全部检查点与中间写入"""
+        self._pending.pop(thread_id, None)
+        self._pending_namespaces.pop(thread_id, None)
+        keys = [f"checkpoint:{thread_id}"]
+        for pattern in (f"checkpoint:{thread_id}:*", f"checkpoint_index:{thread_id}:*", f"checkpoint_writes:{thread_id}:*"):
+            keys.extend([key async for key in self.client.scan_iter(match=pattern)])
+        await self.client.delete(*keys)
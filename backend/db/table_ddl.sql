@@ -11,6 +11,8 @@ create table if not exists sessions
     waiting_for         varchar,
     context             json,
     message_count       integer,
+    last_message        text,
+    last_message_time   timestamp with time zone,
     created_at          timestamp with time zone default now(),
     updated_at          timestamp with time zone default now()
 );
@@ -134,6 +136,8 @@ create table if not exists sessions
     waiting_for         varchar,
     context             json,
     message_count       integer,
+    last_message        text,
+    last_message_time   timestamp with time zone,
     created_at          timestamp with time zone default now(),
     updated_at          timestamp with time zone default now()
 );
@@ -276,6 +280,33 @@ alter table conversation_history
 
 create index if not exists ix_conversation_history_session_id ON conversation_history (session_id);
 
+-- 历史消息按 (created_at, id) keyset 分页
+create index if not exists ix_conversation_history_session_created_id
+    on conversation_history (session_id, created_at, id);
+
+-- 会话列表冗余字段：已有数据库补充字段并回填
+alter table sessions add column if not exists last_message text;
+alter table sessions add column if not exists last_message_time timestamp with time zone;
+
+update sessions s
+set last_message      = left(latest.agent_output, 200),
+    last_message_time = latest.created_at,
+    message_count     = latest.turns * 2
+from (
+    select distinct on (session_id)
+           session_id,
+           agent_output,
+           created_at,
+           count(*) over (partition by session_id) as turns
+    from conversation_history
+    order by session_id, created_at desc, id desc
+) latest
+where s.id = latest.session_id
+  and s.last_message_time is null;
+
+create index if not exists ix_sessions_user_id_updated_at
+    on sessions (user_id, updated_at);
+
 -- 长时记忆：存储会话的归纳总结
 create table if not exists session_summaries (
     id VARCHAR PRIMARY KEY,
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 
@@ -10,10 +11,19 @@ import os
 from config.loguru_config import get_logger, setup_logging
 from config.loader import get_config
 from services.http_client import shutdown_http_client
+from services.tracing import shutdown_tracer
 # 直接导入路由模块
 from routes import auth, sessions, system,knowledge
 from db.database import db_startup,db_shutdown
+from db.redis import SimpleRedisSaver, close_redis_client
+from services.auth_cache import auth_cache
+from services.auth_service import password_hasher
+from services.knowledge_service import knowledge_service
+from services.resources import resources
+from services.session_memory import session_memory_cache
+from services.session_state import session_state
 from work_flow.process import get_redis_checkpointer
+from work_flow.graph import graph_registry
 
 # 初始化配置和日志
 config = get_config()
@@ -29,18 +39,44 @@ async def startup(app):
     logger.info("正在初始化 Redis Checkpointer...")
     app.state.checkpointer = await get_redis_checkpointer()
 
+    # 预编译工作流图，请求中直接复用
+    graph_registry.warmup(app.state.checkpointer)
+
+    # 会话运行时状态（停止标志 / 轮次锁）在多个 worker 间共享
+    await session_state.start()
+    # 令牌吊销集合与用户缓存失效在多个 worker 间同步
+    await auth_cache.start()
+    await session_memory_cache.start()
+
+    # 嵌入模型、tokenizer 在后台预热，不阻塞服务开始接收请求；就绪状态见 /api/system/ready
+    if config.server.warmup_on_startup:
+        from work_flow.context_builder import TokenCounter
+        resources.register("embedding_model", knowledge_service.aget_embedding_model)
+        resources.register("tokenizer", lambda: asyncio.to_thread(TokenCounter, config.llm.model), required=False)
+        resources.start_warmup()
+
 async def cleanup(app):
     """
     应用关闭时，执行操作
     """
-    # 关闭 Redis 连接
-    if hasattr(app.state, "checkpointer") and hasattr(app.state.checkpointer, "client"):
-        logger.info("正在关闭 Redis 连接...")
-        await app.state.checkpointer.client.aclose()
+    await resources.stop()
+    await session_state.stop()
+    await auth_cache.stop()
+    await session_memory_cache.stop()
+
+    # 提交检查点写缓冲并关闭 Redis 连接池
+    if isinstance(getattr(app.state, "checkpointer", None), SimpleRedisSaver):
+        await app.state.checkpointer.aflush()
+    logger.info("正在关闭 Redis 连接...")
+    await close_redis_client()
         
     await db_shutdown()
     await shutdown_http_client()
+    password_hasher.shutdown()
+    shutdown_tracer()
     logger.info("SmartAgent API 服务已关闭")
+    # 等待日志队列写完（process 模式）
+    await logger.complete()
 
 @asynccontextmanager
 async def app_lifespan(app:FastAPI):
@@ -14,6 +14,8 @@ MODEL_VOLUME="/home/m1881/hf_models"
 EMBEDDING_MODEL_ID="BAAI/bge-m3"  # 或者本地路径，如 /data/bge-m3
 EMBEDDING_PORT=8081
 EMBEDDING_CONTAINER_NAME="tei-embedding-server"
+# 单次请求的最大文本数，需不小于 config.yaml 中 embedding.batch_max_size
+EMBEDDING_MAX_CLIENT_BATCH_SIZE=32
 
 # Reranker 模型配置
 RERANKER_MODEL_ID="BAAI/bge-reranker-v2-m3" # 或者本地路径，如 /data/bge-reranker-v2-m3
@@ -53,11 +55,13 @@ docker run -d \
     --pull always \
     ghcr.io/huggingface/text-embeddings-inference:1.5 \
     --model-id $EMBEDDING_MODEL_ID \
+    --max-client-batch-size $EMBEDDING_MAX_CLIENT_BATCH_SIZE \
     --auto-truncate
 
 if [ $? -eq 0 ]; then
     echo "✅ Embedding 服务启动成功！"
     echo "   地址: http://localhost:$EMBEDDING_PORT"
+    echo "   后端配置: EMBEDDING_PROVIDER=tei EMBEDDING_BASE_URL=http://localhost:$EMBEDDING_PORT"
 else
     echo "❌ Embedding 服务启动失败，请检查日志: docker logs $EMBEDDING_CONTAINER_NAME"
 fi
@@ -3,7 +3,7 @@ from routes.schema import (
     User, UserCreate, LoginRequest, Token,
     BaseResponse, VerifyRequest
 )
-from services.auth_service import auth_service
+from services.auth_service import auth_service, PasswordHashBusyError
 from db.database import get_db
 from config.loguru_config import get_logger
 from routes.utils import get_current_user_from_token
@@ -15,6 +15,8 @@ async def register(user_data: UserCreate, db=Depends(get_db)):
     """用户注册"""
     try:
         return await auth_service.register_user(user_data,db=db)
+    except PasswordHashBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -26,6 +28,9 @@ async def login(login_data: LoginRequest, db=Depends(get_db)):
     """用户登录"""
     try:
         return await auth_service.login_user(login_data,db=db)
+    except PasswordHashBusyError as e:
+        logger.warning(f"登录请求排队已满: {e}")
+        raise HTTPException(status_code=429, detail=str(e))
     except ValueError as e:
         logger.error(f"登录用户出错: {e}")
         raise HTTPException(status_code=401, detail=str(e))
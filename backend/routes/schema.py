@@ -100,6 +100,8 @@ class Session(SessionBase):
     created_at: datetime
     updated_at: datetime
     message_count: int = 0
+    last_message: Optional[str] = None
+    last_message_time: Optional[datetime] = None
 
 class SessionListItem(BaseModel):
     id: str
@@ -131,6 +133,11 @@ class Message(MessageBase):
 class MessageListResponse(BaseResponse):
     data: List[Message]
 
+class MessagePageResponse(BaseResponse):
+    data: List[Message]
+    next_cursor: Optional[str] = None  # 下一页（更早消息）的游标，为空表示没有更早的消息
+    has_more: bool = False
+
 # 工具调用相关模型
 class ToolInvokeRequest(BaseModel):
     tool_name: str
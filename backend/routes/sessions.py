@@ -1,20 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
 from typing import List, Optional
+from datetime import datetime
 
 from langchain_core.messages import HumanMessage, AIMessage
+from starlette.background import BackgroundTask
 from starlette.responses import StreamingResponse
 
 from routes.schema import (
     Session, SessionListItem, Message, MessageCreate,
-    SessionListResponse, User, SenderType, ToolRequestResponse, ToolInvokeRequest, SessionCreate,BaseResponse
+    SessionListResponse, User, SenderType, ToolRequestResponse, ToolInvokeRequest, SessionCreate,BaseResponse,
+    MessagePageResponse
 )
 from services.session_service import session_service
+from services.session_state import SessionBusyError, TurnHandle, session_state
+from services.sse import encode_event, get_sse_streamer, workflow_text_field
 from services.auth_service import auth_service
 from config.loguru_config import get_logger
 from routes.utils import get_current_user_from_token
 from db.database import get_db
 from work_flow.process import run_workflow, stream_workflow
-import json
+from contextlib import aclosing
 
 logger = get_logger(__name__)
 
@@ -35,9 +40,9 @@ async def list_sessions(current_user: User = Depends(get_current_user_from_token
         session_list.append(SessionListItem(
             id=session.id,
             title=session.title,
-            last_message=None,
-            last_message_time=None,
-            message_count=0,
+            last_message=session.last_message,
+            last_message_time=session.last_message_time,
+            message_count=session.message_count,
             conversation_status=session.conversation_status,
             created_at=session.created_at
         ))
@@ -67,15 +72,28 @@ async def test_workflow(
     
     checkpointer = request.app.state.checkpointer
     
-    # 2. 运行工作流
     try:
-        result = await run_workflow(
+        handle = await session_state.begin_turn(session_id)
+    except SessionBusyError:
+        raise HTTPException(status_code=409, detail="会话正在生成中")
+
+    # 2. 运行工作流：经 session_state.iterate 驱动，运行期间续期轮次锁，收到停止请求时取消运行
+    async def run():
+        yield await run_workflow(
             session_id=session_id,
             user_id=current_user.id,
             original_query=query,
             thread_id=session_id,
             checkpointer=checkpointer
         )
+
+    try:
+        result = None
+        async with aclosing(session_state.iterate(handle, run())) as results:
+            async for result in results:
+                pass
+        if result is None:
+            return {"session_id": session_id, "query": query, "final_answer": None, "status": "cancelled"}
         return {
             "session_id": session_id,
             "query": query,
@@ -85,6 +103,17 @@ async def test_workflow(
     except Exception as e:
         logger.error(f"Workflow execution failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await session_state.end_turn(handle)
+
+def _turn_stream_response(handle: TurnHandle, body) -> StreamingResponse:
+    """
+    返回生成轮次的 SSE 响应
+    轮次锁在路由中提前获取（以便返回 409），响应体生成器的 finally 负责释放；
+    客户端在第一个 chunk 之前断开时生成器不会启动，由响应结束后的后台任务兜底释放
+    """
+    return StreamingResponse(body, media_type="text/event-stream",
+                             background=BackgroundTask(session_state.end_turn, handle))
 
 @router.post("/{session_id}/workflow_stream")
 async def stream_workflow_endpoint(
@@ -105,63 +134,115 @@ async def stream_workflow_endpoint(
     
     checkpointer = request.app.state.checkpointer
     logger.info("Checkpointer 获取成功")
+
+    # 同一会话同一时间只允许一个生成中的轮次（跨 worker）
+    try:
+        handle = await session_state.begin_turn(session_id)
+    except SessionBusyError:
+        raise HTTPException(status_code=409, detail="会话正在生成中")
     
     # 2. 定义流式生成器
     async def event_generator():
         logger.info("开始执行 event_generator")
         try:
-            # 调用流式工作流函数
-            async for chunk in stream_workflow(
+            # 调用流式工作流函数，收到停止请求时立即打断
+            workflow = stream_workflow(
                 session_id=session_id,
                 user_id=current_user.id,
                 original_query=query,
                 thread_id=session_id,
                 checkpointer=checkpointer
-            ):
-                # 转换为 SSE 格式: "data: {json}\n\n"
-                # ensure_ascii=False 保证中文正常显示
-                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
-            
-            # 发送结束标记
-            yield "data: [DONE]\n\n"
+            )
+            # 相邻的 llm_stream 增量合并成帧发送；客户端断开或过慢时关闭工作流生成器
+            frames = get_sse_streamer().stream(
+                session_state.iterate(handle, workflow),
+                text_field=workflow_text_field,
+                request=request,
+            )
+            async with aclosing(frames):
+                async for frame in frames:
+                    yield frame
             
         except Exception as e:
             logger.error(f"Stream workflow execution failed: {e}")
-            error_msg = json.dumps({"event": "error", "error": str(e)}, ensure_ascii=False)
-            yield f"data: {error_msg}\n\n"
+            yield encode_event({"event": "error", "error": str(e)})
+        finally:
+            await session_state.end_turn(handle)
 
     # 3. 返回 StreamingResponse
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return _turn_stream_response(handle, event_generator())
 
 @router.post("/{session_id}/messages/", response_model=Message)
 async def add_message(session_id: str, message_data: MessageCreate, current_user: User = Depends(get_current_user_from_token),db=Depends(get_db)):
     """当用户输入消息时，添加消息到会话，agent回复用户消息"""
-    message_generator = await session_service.add_message_to_session(session_id, current_user.id, message_data,db=db)
-    if not message_generator:
+    try:
+        result = await session_service.add_message_to_session(session_id, current_user.id, message_data,db=db)
+    except SessionBusyError:
+        raise HTTPException(status_code=409, detail="会话正在生成中")
+    if not result:
         raise HTTPException(status_code=404, detail="会话未找到")
-    return StreamingResponse(message_generator,media_type="text/event-stream",)
+    handle, message_generator = result
+    return _turn_stream_response(handle, message_generator)
 
-@router.get("/{session_id}/messages/", response_model=List[Message])
-async def get_messages(session_id: str, current_user: User = Depends(get_current_user_from_token), db=Depends(get_db)):
-    """获取会话中的所有消息"""
-    messages = await session_service.get_messages(session_id, db=db)
-    if messages is None:
-        raise HTTPException(status_code=404, detail="会话未找到")
-    message_list = []
-    for message in messages:
-        if type(message) not in (HumanMessage, AIMessage):
-            continue
-        message_list.append(
-            Message(
-                id=message.id,
-                session_id=session_id,
-                sender=SenderType.USER if type(message)==HumanMessage else SenderType.AGENT,
-                timestamp=message.additional_kwargs.get("created_at"), # 使用DB中记录的时间
-                text=message.content if message.content else ' ',
-                metadata=message.response_metadata
-            )
+def _to_message(session_id: str, message) -> Optional[Message]:
+    if type(message) not in (HumanMessage, AIMessage):
+        return None
+    return Message(
+        id=message.id,
+        session_id=session_id,
+        sender=SenderType.USER if type(message)==HumanMessage else SenderType.AGENT,
+        timestamp=message.additional_kwargs.get("created_at"), # 使用DB中记录的时间
+        text=message.content if message.content else ' ',
+        metadata=message.response_metadata
+    )
+
+@router.get("/{session_id}/messages/", response_class=StreamingResponse, responses={200: {"model": List[Message]}})
+async def get_messages(
+    session_id: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user_from_token),
+    db=Depends(get_db)
+):
+    """
+    获取会话中的所有消息（可按时间范围过滤）
+    以流式 JSON 数组返回，后端按批读取，内存占用与会话长度无关
+    """
+    async def json_array():
+        # 响应开始发送后依赖注入的会话可能已关闭，使用独立的数据库会话
+        from db.database import SessionLocal
+        async with SessionLocal() as stream_db:
+            yield "["
+            first = True
+            async for message in session_service.iter_messages(session_id, stream_db, start_time=start_time, end_time=end_time):
+                item = _to_message(session_id, message)
+                if item is None:
+                    continue
+                yield ("" if first else ",") + item.model_dump_json()
+                first = False
+            yield "]"
+
+    return StreamingResponse(json_array(), media_type="application/json")
+
+@router.get("/{session_id}/messages/page", response_model=MessagePageResponse)
+async def get_messages_page(
+    session_id: str,
+    limit: int = Query(default=20, ge=1, le=200, description="每页的对话轮次数"),
+    cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor，为空时从最新消息开始"),
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user_from_token),
+    db=Depends(get_db)
+):
+    """分页获取会话消息：从最新一轮往前翻页，每页按时间正序返回"""
+    try:
+        messages, next_cursor = await session_service.get_messages_page(
+            session_id, db=db, limit=limit, cursor=cursor, start_time=start_time, end_time=end_time
         )
-    return message_list
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = [item for item in (_to_message(session_id, message) for message in messages) if item is not None]
+    return MessagePageResponse(data=items, next_cursor=next_cursor, has_more=next_cursor is not None)
 
 @router.post("/{session_id}/messages/tools/", response_model=List[ToolRequestResponse])
 async def tool_invoke(session_id:str,tool_invoke_request: ToolInvokeRequest,current_user: User = Depends(get_current_user_from_token)):
@@ -169,8 +250,11 @@ async def tool_invoke(session_id:str,tool_invoke_request: ToolInvokeRequest,curr
     agent调用工具时，发起请求，是否需要获取用户允许，当用户允许时，继续执行工具调用
     否则不进行具体调用
     """
-    stream_generator = await session_service.tool_invoke(session_id=session_id,is_approved=tool_invoke_request.is_authorized)
-    return StreamingResponse(stream_generator,media_type="text/event-stream",)
+    try:
+        handle, stream_generator = await session_service.tool_invoke(session_id=session_id,user_id=current_user.id,is_approved=tool_invoke_request.is_authorized)
+    except SessionBusyError:
+        raise HTTPException(status_code=409, detail="会话正在生成中")
+    return _turn_stream_response(handle, stream_generator)
 
 
 # todo 定义response_model
@@ -182,7 +266,9 @@ async def stop_generation(session_id:str,current_user:User = Depends(get_current
     :param session_id: Description
     :type session_id: str
     """
-    # resp = await session_service.stop_generation(session_id = session_id)
+    stopped = await session_service.stop_generation(session_id = session_id)
+    if not stopped:
+        return BaseResponse(success=False,message="No generation in progress for this session.")
     return BaseResponse(success=True,message="Stop generating new tokens succeeded.")
 
 @router.delete("/{session_id}",response_model=BaseResponse)
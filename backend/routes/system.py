@@ -1,8 +1,16 @@
 import datetime
 
-from fastapi import APIRouter
-from routes.schema import SystemStatus, HealthCheckResponse
-from db.database import check_db_connection
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from routes.schema import SystemStatus, HealthCheckResponse, BaseResponse
+from db.database import check_db_connection, get_db_pool_stats
+from services.tracing import get_tracer
+from services.web_search_service import get_web_search_service
+from services.http_client import get_http_client_stats
+from services.auth_service import password_hasher
+from services.session_memory import session_memory_cache
+from services.resources import resources
+from config.loguru_config import LoguruConfigManager
 router = APIRouter(prefix="/system", tags=["系统管理"])
 
 @router.get("/status", response_model=SystemStatus)
@@ -10,6 +18,16 @@ async def system_status():
     """获取系统状态"""
     return '200'
 
+@router.get("/ready", response_model=BaseResponse)
+async def ready():
+    """
+    就绪检查：嵌入模型等必需资源预热完成前返回 503
+    """
+    data = {"ready": resources.ready, "resources": resources.status()}
+    if not resources.ready:
+        return JSONResponse(status_code=503, content=BaseResponse(success=False, message="资源预热中", data=data).model_dump())
+    return BaseResponse(data=data)
+
 @router.get("/health", response_model=HealthCheckResponse)
 async def health():
     """健康检查"""
@@ -24,4 +42,28 @@ async def health():
         "timestamp": str(datetime.datetime.now()),
     }
 
-    return health_status
\ No newline at end of file
+    return health_status
+
+@router.get("/metrics", response_model=BaseResponse)
+async def metrics(request: Request, recent: int = 0):
+    """
+    工作流链路指标：按节点 / LLM / 工具汇总耗时分位数、token 消耗与缓存命中率，检查点的 Redis 往返统计，
+    密码哈希线程池的排队情况，会话记忆缓存的命中率，以及数据库连接池占用与慢查询
+    recent > 0 时同时返回最近的若干条 span
+    """
+    tracer = get_tracer()
+    data = {
+        "spans": tracer.summary(),
+        "web_search": get_web_search_service().get_stats(),
+        "http_client": get_http_client_stats(),
+    }
+    checkpointer = getattr(request.app.state, "checkpointer", None)
+    if hasattr(checkpointer, "get_stats"):
+        data["checkpoint"] = checkpointer.get_stats()
+    data["password_hash"] = password_hasher.get_stats()
+    data["session_memory_cache"] = session_memory_cache.get_stats()
+    data["log_queues"] = LoguruConfigManager().get_stats()
+    data["database"] = get_db_pool_stats()
+    if recent > 0:
+        data["recent_spans"] = tracer.recent_spans(limit=recent)
+    return BaseResponse(data=data)
\ No newline at end of file
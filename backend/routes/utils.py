@@ -4,6 +4,7 @@ import jwt
 from jwt.exceptions import InvalidTokenError
 from routes.schema import  User
 from services.auth_service import auth_service
+from services.auth_cache import auth_cache
 from config.loguru_config import get_logger
 from config.loader import get_config
 
@@ -25,20 +26,25 @@ async def get_current_user_from_token(authorization: Optional[str] = Header(None
         token = authorization
         logger.info(f'提取到的令牌（无Bearer前缀）: {token}')
     
-    # 验证令牌
+    # 验证令牌：签名与过期时间校验在本地完成，用户信息优先取缓存
     logger.debug('开始验证令牌')
-    session = SessionLocal()
     try:
         payload = jwt.decode(token,config.security.secret_key,algorithms=[config.security.algorithm])
-        user_id = payload.get("sub")
-        user = await auth_service.get_user_by_id(user_id=user_id,db=session)
-        if not user:
-            logger.error(f'用户ID {user_id} 不存在')
-            raise HTTPException(status_code=404, detail="用户不存在")
-        logger.debug(f'令牌验证成功，返回用户: {user.id}')
     except InvalidTokenError:
         logger.error('无效的令牌')
         raise HTTPException(status_code=401, detail="无效的令牌")
-    finally:
-        await session.close()
-    return user
\ No newline at end of file
+    if auth_cache.is_revoked(token):
+        logger.error('令牌已登出')
+        raise HTTPException(status_code=401, detail="无效的令牌")
+
+    user_id = payload.get("sub")
+    user = auth_cache.get_user(user_id)
+    if user is None:
+        async with SessionLocal() as session:
+            user = await auth_service.get_user_by_id(user_id=user_id,db=session)
+        if not user:
+            logger.error(f'用户ID {user_id} 不存在')
+            raise HTTPException(status_code=404, detail="用户不存在")
+        auth_cache.put_user(user)
+    logger.debug(f'令牌验证成功，返回用户: {user.id}')
+    return user
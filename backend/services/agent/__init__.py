@@ -6,6 +6,7 @@ from pathlib import Path
 from services.agent.prompts import major_agent_prompt
 from config.loader import get_config
 from config.models import LLMProvider
+from services.http_client import get_http_client
 
 config = get_config()
 
@@ -13,7 +14,9 @@ async def get_agent():
     from langchain_deepseek import ChatDeepSeek
     from langchain_openai import ChatOpenAI
     # llm = ChatOpenAI(model=config.llm.model,api_key=config.llm.api_key,base_url=config.llm.base_url)
-    llm = ChatDeepSeek(model=config.llm.model,api_key=config.llm.api_key,base_url=config.llm.base_url)
+    # 共用全局 HTTP 客户端，LLM 主机的 POST 在传输层按幂等请求重试，关闭 SDK 自带重试
+    llm = ChatDeepSeek(model=config.llm.model,api_key=config.llm.api_key,base_url=config.llm.base_url,
+                       http_async_client=await get_http_client(),max_retries=0)
     conn = await aiosqlite.connect(str(Path(__file__).parent / "data" / "langgraph_checkpoint"))
     sqlite_saver = AsyncSqliteSaver(
         conn=conn
@@ -1,14 +1,14 @@
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import interrupt
-from langchain_tavily import TavilySearch
+from langgraph.config import get_stream_writer
 from config.loguru_config import get_logger
 from config.loader import get_config
 from services.feishu_service import get_feishu_service
+from services.web_search_service import get_web_search_service
 
 logger = get_logger(__name__)
 config = get_config()
-tavily_search_tool = TavilySearch(tavily_api_key=config.tavily_api_key)
-feishu_service = get_feishu_service()
 
 __all__ = [
     "send_email",
@@ -45,13 +45,15 @@ async def send_email(func_name: str,to: str, subject: str, body: str):
 
 
 @tool
-async def search_web(func_name:str,query:str):
+async def search_web(func_name:str,query:str,run_config:RunnableConfig):
     """
     进行谷歌搜索的agent
     """
     logger.info(f"正在调用search_web，入参为:query={query}")
 
-    result = await tavily_search_tool.ainvoke(query)
+    # 与工作流节点共享同一个搜索服务，按用户做限流隔离
+    tenant_id = run_config.get("configurable", {}).get("user_id")
+    result = await get_web_search_service().search(query, tenant_id=tenant_id)
     logger.info(f"search_web调用完成，返回结果为:{result}")
     return result
 
@@ -90,7 +92,16 @@ async def save_report_to_lark(func_name:str, file_title:str, file_content:str):
     # 用户确认（暂时保持为True）
     try:
         # 使用异步飞书服务保存报告
-        result = await feishu_service.save_report_to_feishu(file_title, file_content)
+        # 飞书客户端在首次调用时创建，不在导入阶段初始化
+        # 长报告分章节写入，每写完一个章节通过 custom 流向前端推送进度
+        try:
+            writer = get_stream_writer()
+        except RuntimeError:
+            writer = None
+        result = await get_feishu_service().save_report_to_feishu(
+            file_title, file_content,
+            progress=(lambda p: writer({"export_progress": p})) if writer else None,
+        )
         logger.info(f"save_report_to_lark调用完成，返回结果为: {result}")
         return result
         
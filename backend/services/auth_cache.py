@@ -0,0 +1,154 @@
+"""
+令牌校验缓存
+请求鉴权只做 JWT 签名与过期校验，不再访问数据库：
+    用户缓存      进程内 TTL 缓存 user_id -> User，未命中时才查询数据库
+    吊销集合      登出的令牌摘要 -> 过期时间，令牌过期后自动移除
+吊销集合与用户缓存失效在多个 uvicorn worker 之间通过 Redis 同步：
+    auth:revoked            有序集合，成员为令牌摘要，分值为令牌过期时间戳（新 worker 启动或重连时全量加载）
+    security.revocation_channel   pub/sub 频道，广播吊销与用户缓存失效事件
+Redis 不可用时退化为进程内状态（仅单 worker 有效）
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+
+from cachetools import TTLCache
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+from db.redis import HAS_REDIS, get_redis_client
+from routes.schema import User
+
+logger = get_logger(__name__)
+
+REVOKED_KEY = "auth:revoked"
+
+
+def token_digest(token: str) -> str:
+    """令牌摘要，吊销集合中不保存令牌原文"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class AuthCache:
+    """用户缓存与令牌吊销集合"""
+
+    def __init__(self):
+        self.config = get_config().security
+        self.client = None
+        self._users: TTLCache = TTLCache(maxsize=self.config.user_cache_max_size, ttl=self.config.user_cache_ttl)
+        # 令牌摘要 -> 过期时间戳
+        self._revoked: Dict[str, float] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @property
+    def distributed(self) -> bool:
+        return self.client is not None
+
+    async def start(self) -> None:
+        """连接 Redis 并订阅吊销频道；连接失败时使用进程内状态"""
+        if not HAS_REDIS:
+            logger.warning("未安装 Redis 库，令牌吊销仅在当前进程内有效")
+            return
+        try:
+            client = get_redis_client()
+            await client.ping()
+        except Exception as e:
+            logger.warning(f"Redis 不可用，令牌吊销仅在当前进程内有效: {e}")
+            return
+        self.client = client
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self.client = None
+
+    async def _load_revoked(self) -> None:
+        """从 Redis 全量加载未过期的吊销记录，并清理已过期的记录"""
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(REVOKED_KEY, "-inf", now)
+            pipe.zrangebyscore(REVOKED_KEY, now, "+inf", withscores=True)
+            _, entries = await pipe.execute()
+        for digest, expires_at in entries:
+            digest = digest.decode("utf-8") if isinstance(digest, bytes) else digest
+            self._revoked[digest] = float(expires_at)
+        logger.info(f"已加载令牌吊销记录 {len(entries)} 条")
+
+    async def _listen(self) -> None:
+        """订阅吊销频道；每次（重新）订阅后全量加载一次，补上断线期间错过的消息"""
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.config.revocation_channel)
+                await self._load_revoked()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    self._apply(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"令牌吊销频道订阅异常，1 秒后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _apply(self, event: dict) -> None:
+        if event.get("type") == "revoke":
+            self._revoked[event["digest"]] = float(event["expires_at"])
+        elif event.get("type") == "user":
+            self._users.pop(event["user_id"], None)
+
+    def _prune(self) -> None:
+        now = time.time()
+        for digest in [d for d, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[digest]
+
+    async def _publish(self, event: dict) -> None:
+        await self.client.publish(self.config.revocation_channel, json.dumps(event))
+
+    def is_revoked(self, token: str) -> bool:
+        return token_digest(token) in self._revoked
+
+    async def revoke(self, token: str, expires_at: float) -> None:
+        """吊销令牌直到其过期；已过期的令牌会被签名校验拒绝，无需记录"""
+        if expires_at <= time.time():
+            return
+        self._prune()
+        digest = token_digest(token)
+        self._revoked[digest] = expires_at
+        if not self.distributed:
+            return
+        try:
+            await self.client.zadd(REVOKED_KEY, {digest: expires_at})
+            await self._publish({"type": "revoke", "digest": digest, "expires_at": expires_at})
+        except Exception as e:
+            logger.error(f"同步令牌吊销记录失败: {e}")
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        return self._users.get(user_id)
+
+    def put_user(self, user: User) -> None:
+        self._users[user.id] = user
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """用户信息变更后使各 worker 的缓存失效"""
+        self._users.pop(user_id, None)
+        if not self.distributed:
+            return
+        try:
+            await self._publish({"type": "user", "user_id": user_id})
+        except Exception as e:
+            logger.error(f"广播用户缓存失效失败: {user_id}, {e}")
+
+
+# 全局令牌校验缓存实例
+auth_cache = AuthCache()
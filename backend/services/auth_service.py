@@ -1,6 +1,11 @@
 from passlib.context import CryptContext
 from typing import Optional, List
 from datetime import datetime, timedelta, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import statistics
+import time
 import uuid
 from pwdlib import PasswordHash
 from fastapi.security import OAuth2PasswordBearer,OAuth2PasswordRequestForm
@@ -17,6 +22,7 @@ from db.db_models import User as DBUser, Token as DBToken
 from db.database import SessionLocal
 from config.loguru_config import get_logger
 from config.loader import get_config
+from services.auth_cache import auth_cache
 logger = get_logger(__name__)
 config = get_config()
 pwd_context = PasswordHash.recommended()
@@ -34,6 +40,88 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHashBusyError(Exception):
+    """等待哈希的请求超过上限"""
+
+
+class PasswordHashPool:
+    """
+    在有界线程池中执行密码哈希/校验（argon2 计算期间释放 GIL），避免阻塞事件循环
+    同时进行的哈希运算数不超过线程数，排队的请求数超过 max_pending 时直接拒绝
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = asyncio.Semaphore(workers)
+        self.pending = 0
+        self.in_flight = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        # 最近的排队耗时 / 运算耗时（毫秒）
+        self._wait_ms = deque(maxlen=1024)
+        self._run_ms = deque(maxlen=1024)
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHashBusyError("登录请求过多，请稍后重试")
+        queued_at = time.perf_counter()
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.pending -= 1
+        started_at = time.perf_counter()
+        self._wait_ms.append((started_at - queued_at) * 1000)
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._run_ms.append((time.perf_counter() - started_at) * 1000)
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def get_stats(self) -> dict:
+        def percentile(samples, q):
+            if not samples:
+                return 0.0
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_p50": round(statistics.median(self._wait_ms), 2) if self._wait_ms else 0.0,
+            "wait_ms_p95": percentile(self._wait_ms, 0.95),
+            "run_ms_p50": round(statistics.median(self._run_ms), 2) if self._run_ms else 0.0,
+            "run_ms_p95": percentile(self._run_ms, 0.95),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHashPool(
+    workers=config.security.password_hash_workers,
+    max_pending=config.security.password_hash_max_pending,
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建访问令牌"""
     to_encode = data.copy()
@@ -62,7 +150,7 @@ class AuthService:
             return None
 
         # 验证密码
-        if not verify_password(password, db_user.password):
+        if not await password_hasher.verify(password, db_user.password):
             return None
 
         # 转换为响应模型
@@ -108,13 +196,22 @@ class AuthService:
         )
 
     async def logout_user(self,token: str,db:AsyncSession) -> BaseResponse:
-        """用户登出"""
+        """用户登出：删除令牌记录并吊销令牌（令牌校验不查库，需依赖吊销集合拒绝已登出的令牌）"""
 
         result = await db.execute(select(DBToken).where(DBToken.token == token))
         db_token = result.scalar_one_or_none()
         if db_token:
+            expires_at = db_token.expires.timestamp()
             await db.delete(db_token)
             await db.commit()
+        else:
+            # 注册时签发的令牌没有数据库记录，从令牌本身取过期时间
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except InvalidTokenError:
+                return BaseResponse(message="登出成功")
+            expires_at = float(payload["exp"])
+        await auth_cache.revoke(token, expires_at)
 
         return BaseResponse(message="登出成功")
 
@@ -146,7 +243,7 @@ class AuthService:
         user_id = str(uuid.uuid4())
         # 确保密码不超过72字节
         password = user_data.password[:72] if len(user_data.password) > 72 else user_data.password
-        hashed_password = get_password_hash(password)
+        hashed_password = await password_hasher.hash(password)
 
         db_user = DBUser(
             id=user_id,
@@ -215,11 +312,12 @@ class AuthService:
             # 确保密码不超过72字节
             password = user_data.password[:72] if len(user_data.password) > 72 else user_data.password
             # 更新密码，需要重新哈希
-            db_user.password = get_password_hash(password)
+            db_user.password = await password_hasher.hash(password)
 
         # 提交更新
         await db.commit()
         await db.refresh(db_user)
+        await auth_cache.invalidate_user(user_id)
 
         # 转换为响应模型
         user = User(
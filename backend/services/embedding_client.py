@@ -0,0 +1,153 @@
+"""
+进程外嵌入服务客户端
+embedding.provider 为 "tei" 时，嵌入计算交给 models/start_tei_server.sh 启动的
+Text Embeddings Inference 服务完成，多个 API worker 共享同一份模型，不再各自加载 HuggingFace 模型。
+
+异步调用走动态批处理：并发请求先进入队列，在 batch_max_wait_ms 窗口内凑满 batch_max_size 条文本
+（或窗口结束）后合并为一次 /embed 请求，再把结果按原请求拆分返回。
+同步调用（文件解析线程）直接按 batch_max_size 分批请求。
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+from langchain_core.embeddings import Embeddings
+
+from config.loguru_config import get_logger
+from services.http_client import AsyncHTTPClient
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _EmbedRequest:
+    texts: List[str]
+    future: asyncio.Future
+
+
+class TEIEmbeddings(Embeddings):
+    """Text Embeddings Inference 服务的嵌入客户端"""
+
+    def __init__(
+        self,
+        base_url: str,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 4,
+        timeout: float = 30.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait = batch_max_wait_ms / 1000
+        self.timeout = timeout
+        self.client = AsyncHTTPClient(base_url=self.base_url)
+        self._sync_client: Optional[httpx.Client] = None
+        self._max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    # ---------- 同步接口：文件解析线程中使用 ----------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(base_url=self.base_url, timeout=self.timeout)
+        vectors = []
+        for start in range(0, len(texts), self.batch_max_size):
+            response = self._sync_client.post("/embed", json=self._payload(texts[start:start + self.batch_max_size]))
+            response.raise_for_status()
+            vectors.extend(response.json())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    # ---------- 异步接口：动态批处理 ----------
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self._ensure_batcher()
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put(_EmbedRequest(texts=list(texts), future=future))
+        return await future
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def _ensure_batcher(self) -> None:
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self._max_concurrent_batches)
+            self._batcher = asyncio.create_task(self._collect())
+
+    async def _collect(self) -> None:
+        """从队列中收集请求组成批次；批次发出后立即开始收集下一批"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0].texts)
+            deadline = loop.time() + self.batch_max_wait
+            while size < self.batch_max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            # 限制同时在途的批次数，超出时在此等待，期间新请求继续在队列中累积
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[_EmbedRequest]) -> None:
+        try:
+            texts = [text for request in batch for text in request.texts]
+            chunks = [texts[i:i + self.batch_max_size] for i in range(0, len(texts), self.batch_max_size)]
+            results = await asyncio.gather(*[self._post(chunk) for chunk in chunks])
+            vectors = [vector for result in results for vector in result]
+            self.batches += len(chunks)
+            self.texts += len(texts)
+        except Exception as e:
+            logger.error(f"嵌入服务请求失败: {e}")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        offset = 0
+        for request in batch:
+            if not request.future.done():
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+    async def _post(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.post(
+            "/embed", json=self._payload(texts), timeout=self.timeout, idempotent=True
+        )
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _payload(texts: List[str]) -> dict:
+        return {"inputs": texts, "truncate": True}
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "texts_per_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
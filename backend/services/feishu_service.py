@@ -3,14 +3,174 @@
 基于httpx的异步飞书API调用
 """
 
+import asyncio
+import hashlib
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
 import httpx
-from typing import Dict, Any, List, Tuple, Optional
+from cachetools import TTLCache
+from typing import Callable, Dict, Any, List, Tuple, Optional
 
 from config.loader import get_config
 from config.loguru_config import get_logger
 from services.http_client import AsyncHTTPClient
 
 logger = get_logger(__name__)
+
+# 租户令牌无效 / 缺失时飞书返回的错误码
+INVALID_TOKEN_CODES = {99991661, 99991663}
+
+HEADING_RE = re.compile(r"^#{1,6}\s")
+
+
+class FeishuWriteError(Exception):
+    """飞书接口返回了非 0 的业务错误码（HTTP 层面成功）"""
+
+
+def split_markdown_sections(content: str, max_chars: int) -> List[str]:
+    """
+    按标题切分 markdown，相邻的短章节合并到 max_chars 以内；
+    超长章节再在空行处切开。代码块内的标题与空行不作为切分点
+    """
+    sections: List[str] = []
+    current: List[str] = []
+    size = 0
+    in_fence = False
+    for line in content.splitlines(keepends=True):
+        is_heading = not in_fence and HEADING_RE.match(line)
+        is_break = not in_fence and size > max_chars and not line.strip()
+        if current and (is_heading or is_break):
+            sections.append("".join(current))
+            current, size = [], 0
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        current.append(line)
+        size += len(line)
+    if current:
+        sections.append("".join(current))
+
+    merged: List[str] = []
+    for section in sections:
+        if merged and len(merged[-1]) + len(section) <= max_chars:
+            merged[-1] += section
+        else:
+            merged.append(section)
+    return merged
+
+
+class RateLimiter:
+    """按固定间隔放行请求，飞书开放接口按应用限频"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class ReportExport:
+    """一次报告导出的进度；写入失败后再次导出同一份报告时从断点继续，不重复创建文档"""
+    document_id: str
+    sections: List[str]
+    # 已写入的章节数，以及文档根节点下已有的一级块数（下一批写入的位置）
+    sections_written: int = 0
+    blocks_written: int = 0
+    # 当前章节中已写入的批次数
+    batches_written: int = 0
+    # 每个批次的幂等令牌，重试时复用，避免飞书重复插入
+    client_tokens: Dict[str, str] = field(default_factory=dict)
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "document_id": self.document_id,
+            "sections_total": len(self.sections),
+            "sections_written": self.sections_written,
+            "blocks_written": self.blocks_written,
+        }
+
+
+class TenantTokenManager:
+    """
+    飞书租户访问令牌管理
+    1、按飞书返回的 expire 记录过期时间，进入提前刷新窗口后继续使用当前令牌，并在后台刷新
+    2、令牌缺失或已过期时同步刷新，并发调用只发起一次请求（single-flight）
+    3、调用方发现令牌被飞书判定无效时调用 invalidate，下次获取时重新申请
+    """
+
+    def __init__(self, client: AsyncHTTPClient, app_id: str, app_secret: str, refresh_ahead: float):
+        self.client = client
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_ahead = refresh_ahead
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at - self.refresh_ahead
+
+    async def get_token(self) -> str:
+        if self._fresh():
+            return self._token
+        if self._token is not None and time.monotonic() < self._expires_at:
+            # 即将过期但仍有效：本次直接使用，后台提前刷新
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_in_background(self._token))
+            return self._token
+        return await self.refresh(self._token)
+
+    async def _refresh_in_background(self, stale: str) -> None:
+        try:
+            await self.refresh(stale)
+        except Exception as e:
+            # 当前令牌过期前仍可使用，下次获取时会再次尝试
+            logger.warning(f"后台刷新飞书租户令牌失败: {e}")
+
+    async def refresh(self, stale: Optional[str] = None) -> str:
+        """刷新令牌；等锁期间已被其它协程刷新时直接返回新令牌"""
+        async with self._lock:
+            if self._token != stale and self._fresh():
+                return self._token
+
+            url = "/open-apis/auth/v3/tenant_access_token/internal"
+            headers = {
+                "Content-Type": "application/json; charset=utf-8"
+            }
+            data = {
+                "app_id": self.app_id,
+                "app_secret": self.app_secret
+            }
+            response = await self.client.post(url, headers=headers, json=data, idempotent=True)
+            response.raise_for_status()
+            response_data = response.json()
+
+            if response_data.get("code") != 0:
+                raise Exception(f"获取访问令牌失败: {response_data}")
+            self._token = response_data.get("tenant_access_token")
+            self._expires_at = time.monotonic() + response_data.get("expire", 7200)
+            logger.info(f"飞书租户访问令牌获取成功，有效期 {response_data.get('expire')} 秒")
+            return self._token
+
+    def invalidate(self, token: str) -> None:
+        """令牌被飞书判定无效；只作废当前令牌，避免覆盖其它协程刚刷新的新令牌"""
+        if token == self._token:
+            self._expires_at = 0.0
+
+
 class FeishuAsyncService:
     """异步飞书服务类"""
     
@@ -19,58 +179,67 @@ class FeishuAsyncService:
         self.feishu_config = self.config.feishu
         # 创建带基础URL的客户端
         self.client = AsyncHTTPClient(base_url=self.feishu_config.base_url)
-        self._tenant_access_token: Optional[str] = None
-    
+        self.token_manager = TenantTokenManager(
+            self.client,
+            app_id=self.feishu_config.app_id,
+            app_secret=self.feishu_config.app_secret,
+            refresh_ahead=self.feishu_config.token_refresh_ahead,
+        )
+        self.rate_limiter = RateLimiter(self.feishu_config.export_rate_limit)
+        # 未完成的报告导出，键为标题与内容的摘要；按份数与时长淘汰，避免失败的导出一直占用内存
+        self._pending_exports: TTLCache = TTLCache(
+            maxsize=self.feishu_config.export_pending_max,
+            ttl=self.feishu_config.export_pending_ttl,
+        )
+        # 同一份报告的并发导出串行执行，避免交错写入同一个文档：export_key -> [锁, 持有或等待的导出数]
+        self._export_locks: Dict[str, list] = {}
+
     async def get_tenant_access_token(self) -> str:
         """异步获取租户访问令牌"""
-        if self._tenant_access_token:
-            return self._tenant_access_token
-            
-        url = "/open-apis/auth/v3/tenant_access_token/internal"
-        headers = {
-            "Content-Type": "application/json; charset=utf-8"
-        }
-        data = {
-            "app_id": self.feishu_config.app_id,
-            "app_secret": self.feishu_config.app_secret
-        }
-        
         try:
-            response = await self.client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            response_data = response.json()
-            
-            if response_data.get("code") == 0:
-                self._tenant_access_token = response_data.get("tenant_access_token")
-                logger.info("飞书租户访问令牌获取成功")
-                return self._tenant_access_token
-            else:
-                raise Exception(f"获取访问令牌失败: {response_data}")
-                
+            return await self.token_manager.get_token()
         except httpx.HTTPStatusError as e:
             logger.error(f"获取飞书token HTTP错误: {e}")
             raise
         except Exception as e:
             logger.error(f"获取飞书token失败: {e}")
             raise
-    
+
+    async def _post(self, url: str, request_body: Dict[str, Any], idempotent: Optional[bool] = None) -> httpx.Response:
+        """携带租户令牌发送请求；令牌被判定无效时刷新后重试一次"""
+        for attempt in range(2):
+            token = await self.get_tenant_access_token()
+            headers = {
+                "Content-Type": "application/json; charset=utf-8",
+                "Authorization": f"Bearer {token}"
+            }
+            await self.rate_limiter.acquire()
+            response = await self.client.post(url, headers=headers, json=request_body, idempotent=idempotent)
+            if attempt == 0 and self._is_token_invalid(response):
+                logger.warning(f"飞书租户令牌已失效，刷新后重试: {url}")
+                self.token_manager.invalidate(token)
+                continue
+            return response
+
+    @staticmethod
+    def _is_token_invalid(response: httpx.Response) -> bool:
+        if response.status_code < 400:
+            return False
+        try:
+            return response.json().get("code") in INVALID_TOKEN_CODES
+        except ValueError:
+            return False
+
     async def create_document(self, title: str) -> str:
         """异步创建飞书文档"""
-        token = await self.get_tenant_access_token()
         url = "/open-apis/docx/v1/documents"
-        
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Authorization": f"Bearer {token}"
-        }
-        
+
         request_body = {
             "title": title
         }
-        
+
         try:
-            import requests
-            response = await self.client.post(url, headers=headers, json=request_body)
+            response = await self._post(url, request_body)
             response.raise_for_status()
             response_json = response.json()
             
@@ -87,21 +256,15 @@ class FeishuAsyncService:
     
     async def convert_markdown_to_blocks(self, markdown_content: str) -> Tuple[List[str], List[Dict]]:
         """异步将markdown转换为飞书文档块"""
-        token = await self.get_tenant_access_token()
         url = "/open-apis/docx/v1/documents/blocks/convert?user_id_type=user_id"
-        
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Authorization": f"Bearer {token}"
-        }
-        
+
         request_body = {
             "content_type": "markdown",
             "content": markdown_content
         }
         
         try:
-            response = await self.client.post(url, headers=headers, json=request_body)
+            response = await self._post(url, request_body)
             response.raise_for_status()
             response_data = response.json()
             
@@ -118,27 +281,29 @@ class FeishuAsyncService:
             logger.error(f"转换Markdown失败: {e}")
             raise
     
-    async def write_blocks_to_document(self, document_id: str, first_level_block_ids: List[str], 
-                                      blocks: List[Dict]) -> Dict:
-        """异步将块写入飞书文档"""
-        token = await self.get_tenant_access_token()
+    async def write_blocks_to_document(self, document_id: str, first_level_block_ids: List[str],
+                                      blocks: List[Dict], index: int = 0, client_token: Optional[str] = None) -> Dict:
+        """
+        异步将块写入飞书文档
+        :param index: 在文档根节点下的插入位置
+        :param client_token: 幂等令牌，相同令牌的重复请求飞书只执行一次
+        """
         url = f"/open-apis/docx/v1/documents/{document_id}/blocks/{document_id}/descendant?document_revision_id=-1"
-        
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Authorization": f"Bearer {token}"
-        }
-        
+        if client_token:
+            url += f"&client_token={client_token}"
+
         request_body = {
-            "index": 0,
+            "index": index,
             "children_id": first_level_block_ids,
             "descendants": blocks
         }
-        
+
         try:
-            response = await self.client.post(url, headers=headers, json=request_body)
+            response = await self._post(url, request_body, idempotent=bool(client_token))
             response.raise_for_status()
             response_data = response.json()
+            if response_data.get("code") != 0:
+                raise FeishuWriteError(f"写入飞书文档失败: {response_data}")
             
             logger.info(f"块写入飞书文档成功: {document_id}")
             return response_data
@@ -150,26 +315,131 @@ class FeishuAsyncService:
             logger.error(f"写入飞书文档失败: {e}")
             raise
     
-    async def save_report_to_feishu(self, file_title: str, file_content: str) -> str:
-        """异步保存报告到飞书"""
+    async def save_report_to_feishu(self, file_title: str, file_content: str,
+                                    progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        异步保存报告到飞书
+        长报告按标题切分为多个章节：章节并发转换为块，再按顺序分批追加到文档。
+        写入失败时保留进度，再次导出同一份报告会写入同一个文档并从失败的章节继续
+        :param progress: 每写完一个章节回调一次，参数见 ReportExport.progress
+        """
+        export_key = hashlib.sha256(f"{file_title}\n{file_content}".encode("utf-8")).hexdigest()
+        entry = self._export_locks.setdefault(export_key, [asyncio.Lock(), 0])
+        entry[1] += 1
         try:
-            # 1. 创建文档
-            document_id = await self.create_document(file_title)
-            
-            # 2. 转换markdown为块
-            first_level_block_ids, blocks = await self.convert_markdown_to_blocks(file_content)
-            
-            # 3. 写入块到文档
-            await self.write_blocks_to_document(document_id, first_level_block_ids, blocks)
-            
-            # 返回文档链接
-            doc_url = f"https://ai.feishu.cn/docx/{document_id}"
-            logger.info(f"报告保存成功: {doc_url}")
-            return f"写入成功,飞书连接为：{doc_url}"
-            
+            async with entry[0]:
+                return await self._save_report(export_key, file_title, file_content, progress)
         except Exception as e:
             logger.error(f"保存报告到飞书失败: {e}")
             raise
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._export_locks.pop(export_key, None)
+
+    async def _save_report(self, export_key: str, file_title: str, file_content: str,
+                           progress: Optional[Callable[[Dict[str, Any]], None]]) -> str:
+        export = self._pending_exports.get(export_key)
+        if export is None:
+            # 1. 创建文档
+            document_id = await self.create_document(file_title)
+            sections = split_markdown_sections(file_content, self.feishu_config.export_section_chars)
+            export = ReportExport(document_id=document_id, sections=sections)
+            self._pending_exports[export_key] = export
+        else:
+            logger.info(f"继续未完成的报告导出: {export.progress()}")
+
+        # 2. 转换与写入
+        try:
+            await self._export_sections(export, progress)
+        except BaseException:
+            # 重新写入以刷新保留时长
+            self._pending_exports[export_key] = export
+            raise
+        self._pending_exports.pop(export_key, None)
+
+        # 返回文档链接
+        doc_url = f"https://ai.feishu.cn/docx/{export.document_id}"
+        logger.info(f"报告保存成功: {doc_url}")
+        return f"写入成功,飞书连接为：{doc_url}"
+
+    async def _export_sections(self, export: ReportExport,
+                               progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        """未写入的章节在并发上限内提前转换，写入严格按章节顺序进行"""
+        slots = asyncio.Semaphore(self.feishu_config.export_concurrency)
+
+        async def convert(section: str) -> Tuple[List[str], List[Dict]]:
+            async with slots:
+                return await self.convert_markdown_to_blocks(section)
+
+        conversions = [asyncio.create_task(convert(section)) for section in export.sections[export.sections_written:]]
+        try:
+            for i, conversion in enumerate(conversions, start=export.sections_written):
+                first_level_block_ids, blocks = await conversion
+                batches = self._batch_blocks(first_level_block_ids, blocks)
+                for batch_no in range(export.batches_written, len(batches)):
+                    batch_ids, batch_blocks = batches[batch_no]
+                    token_key = f"{i}:{batch_no}"
+                    client_token = export.client_tokens.setdefault(token_key, str(uuid.uuid4()))
+                    await self._write_batch(export, batch_ids, batch_blocks, client_token)
+                    export.blocks_written += len(batch_ids)
+                    export.batches_written += 1
+                    export.client_tokens.pop(token_key, None)
+                export.sections_written = i + 1
+                export.batches_written = 0
+                logger.info(f"飞书报告导出进度: {export.progress()}")
+                if progress:
+                    progress(export.progress())
+        finally:
+            # 写入中途失败时取消尚未用到的转换，并取回其结果，避免未处理的任务异常
+            for conversion in conversions:
+                conversion.cancel()
+            await asyncio.gather(*conversions, return_exceptions=True)
+
+    def _batch_blocks(self, first_level_block_ids: List[str], blocks: List[Dict]) -> List[Tuple[List[str], List[Dict]]]:
+        """按一级块切分，每批的块总数（含子孙块）不超过 export_batch_blocks；一级块与其子孙块总在同一批"""
+        by_id = {block["block_id"]: block for block in blocks}
+        batches: List[Tuple[List[str], List[Dict]]] = []
+        batch_ids: List[str] = []
+        batch_blocks: List[Dict] = []
+        for block_id in first_level_block_ids:
+            subtree = []
+            stack = [block_id]
+            while stack:
+                block = by_id.get(stack.pop())
+                if block is None:
+                    continue
+                subtree.append(block)
+                stack.extend(block.get("children", []))
+            if batch_ids and len(batch_blocks) + len(subtree) > self.feishu_config.export_batch_blocks:
+                batches.append((batch_ids, batch_blocks))
+                batch_ids, batch_blocks = [], []
+            batch_ids.append(block_id)
+            batch_blocks.extend(subtree)
+        if batch_ids:
+            batches.append((batch_ids, batch_blocks))
+        return batches
+
+    async def _write_batch(self, export: ReportExport, batch_ids: List[str], batch_blocks: List[Dict],
+                           client_token: str) -> None:
+        """
+        写入一批块，重试复用同一个幂等令牌
+        网络错误与 5xx 已由传输层按幂等请求重试，这里只对飞书返回的业务错误按指数退避重试
+        """
+        retries = self.feishu_config.export_write_retries
+        for attempt in range(retries + 1):
+            try:
+                await self.write_blocks_to_document(
+                    export.document_id, batch_ids, batch_blocks,
+                    index=export.blocks_written, client_token=client_token,
+                )
+                return
+            except FeishuWriteError as e:
+                if attempt >= retries:
+                    raise
+                delay = random.uniform(0, min(10.0, 0.5 * (2 ** attempt)))
+                logger.warning(f"写入飞书文档第 {attempt + 1} 次失败，{delay:.2f} 秒后重试: {e}")
+                await asyncio.sleep(delay)
 
 
 # 全局飞书服务实例
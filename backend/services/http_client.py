@@ -1,11 +1,24 @@
 """
 异步HTTP客户端管理器
 提供基于httpx的异步HTTP客户端，支持连接池、重试、超时等特性
+
+飞书、MinerU、Web 搜索、嵌入服务与 LLM（http_async_client）共用同一个客户端，
+容错逻辑放在传输层 ResilientTransport 中，对调用方透明：
+1、按上游主机划分连接池，可为单个主机单独设置连接数上限，某个上游变慢不会占满其它上游的连接
+2、按幂等性重试：GET/PUT/DELETE 等在网络错误与 429/502/503/504 时重试；
+   POST 默认只在请求未发出（建连失败）或 429 时重试，调用方可通过 idempotent=True 声明可安全重试；
+   LLM 与 idempotent_post_hosts 中主机的 POST 没有副作用，按幂等请求重试（SDK 自带重试已关闭，只有传输层一层重试）
+3、指数退避 + 全抖动，优先遵循 Retry-After
+4、按主机熔断：连续失败达到阈值后快速失败，冷却后放行一个探测请求
+5、按主机统计响应头耗时直方图
 """
 
 import httpx
 import asyncio
-from typing import Optional, Dict, Any
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 
 
@@ -13,6 +26,248 @@ from config.loader import get_config
 from config.loguru_config import get_logger
 logger = get_logger(__name__)
 
+# HTTP/2 需要安装 h2（pip install httpx[http2]）
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+# 请求尚未发出即失败，任何方法都可以安全重试
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# 耗时直方图的桶上界（毫秒）
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """上游处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """单个上游主机的熔断器：closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            # 冷却结束后只放行一个探测请求
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_aborted(self) -> None:
+        """请求既未成功也未失败就结束（被取消或非传输层异常）；若是探测请求，释放探测并重新进入冷却"""
+        if self._probing:
+            self._probing = False
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"上游连续失败 {self.failures} 次，熔断 {self.reset_timeout} 秒")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """单个上游主机的响应耗时直方图（到收到响应头为止）"""
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.status: Dict[str, int] = {}
+
+    def observe(self, elapsed_ms: float, status_code: Optional[int]) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+        if status_code is None:
+            self.errors += 1
+        else:
+            key = f"{status_code // 100}xx"
+            self.status[key] = self.status.get(key, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回分位数所在桶的上界"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else float("inf")
+        return None
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "status": dict(self.status),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """按主机分连接池，并在传输层完成重试、熔断与耗时统计"""
+
+    def __init__(self, http_config, idempotent_hosts=()):
+        self.config = http_config
+        # 这些主机的 POST 按幂等请求重试
+        self.idempotent_hosts = frozenset(idempotent_hosts)
+        self.http2 = http_config.http2 and HAS_HTTP2
+        if http_config.http2 and not HAS_HTTP2:
+            logger.warning("未安装 h2，HTTP/2 不可用，回退到 HTTP/1.1")
+        self._pools: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def _pool(self, host: str) -> httpx.AsyncHTTPTransport:
+        pool = self._pools.get(host)
+        if pool is None:
+            max_connections = self.config.host_max_connections.get(host, self.config.max_connections)
+            pool = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=min(self.config.max_keepalive_connections, max_connections),
+                    keepalive_expiry=self.config.keepalive_expiry,
+                ),
+                http2=self.http2,
+                verify=self.config.verify_ssl,
+                cert=self.config.cert,
+                proxy=self.config.proxy,
+            )
+            self._pools[host] = pool
+        return pool
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(self.config.circuit_failure_threshold, self.config.circuit_reset_timeout)
+            self._breakers[host] = breaker
+        return breaker
+
+    def _histogram(self, host: str) -> LatencyHistogram:
+        histogram = self._histograms.get(host)
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self._histograms[host] = histogram
+        return histogram
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        pool = self._pool(host)
+        breaker = self._breaker(host)
+        histogram = self._histogram(host)
+        idempotent = request.extensions.get("idempotent")
+        if idempotent is None:
+            idempotent = request.method in IDEMPOTENT_METHODS or host in self.idempotent_hosts
+        # 流式请求体只能发送一次
+        replayable = isinstance(request.stream, httpx.ByteStream)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                histogram.rejected += 1
+                raise CircuitOpenError(f"上游 {host} 已熔断", request=request)
+
+            start_time = time.perf_counter()
+            try:
+                response = await pool.handle_async_request(request)
+            except httpx.TransportError as e:
+                histogram.observe((time.perf_counter() - start_time) * 1000, None)
+                breaker.record_failure()
+                retryable = idempotent or isinstance(e, CONNECT_ERRORS)
+                if not (retryable and replayable and attempt < self.config.retries):
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{request.method} {request.url} 失败: {e!r}，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+            except BaseException:
+                # 包括 asyncio.CancelledError（停止生成、SSE 断开），不释放探测会使熔断器永久停在 half_open
+                breaker.record_aborted()
+                raise
+            else:
+                histogram.observe((time.perf_counter() - start_time) * 1000, response.status_code)
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                # 429 表示请求未被处理，任何方法都可以重试
+                retryable = response.status_code == 429 or (
+                    idempotent and response.status_code in self.config.retry_statuses
+                )
+                if not (retryable and replayable and attempt < self.config.retries):
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                await response.aclose()
+                logger.warning(f"{request.method} {request.url} 返回 {response.status_code}，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+
+            histogram.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避 + 全抖动，避免多个 worker 同时重试"""
+        return random.uniform(0, min(self.config.max_backoff, self.config.backoff_factor * (2 ** attempt)))
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), self.config.max_backoff)
+
+    async def aclose(self) -> None:
+        for pool in self._pools.values():
+            await pool.aclose()
+        self._pools.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            host: {
+                **histogram.to_dict(),
+                "circuit": self._breakers[host].state,
+                "http2": self.http2,
+            }
+            for host, histogram in self._histograms.items()
+        }
 
 
 class HTTPClientManager:
@@ -21,6 +276,7 @@ class HTTPClientManager:
     # 保证单例模式
     _instance: Optional["HTTPClientManager"] = None
     _client: Optional[httpx.AsyncClient] = None
+    _transport: Optional[ResilientTransport] = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -32,6 +288,7 @@ class HTTPClientManager:
             self._initialized = True
             self.config = get_config()
             self._client = None
+            self._transport = None
     
     async def get_client(self) -> httpx.AsyncClient:
         """获取异步HTTP客户端实例"""
@@ -41,32 +298,43 @@ class HTTPClientManager:
     
     async def _create_client(self):
         """创建HTTP客户端"""
-        http_config = self.config.http_client_config
+        http_config = self.config.http_client
         
+        # 连接池、重试与熔断由传输层按主机处理
+        self._transport = ResilientTransport(http_config, self._idempotent_hosts())
+
         # 构建客户端配置
         client_kwargs: Dict[str, Any] = {
             "timeout": httpx.Timeout(http_config.timeout), # 配置超时
-            # 配置连接池和保持连接
-            "limits": httpx.Limits(
-                max_connections=http_config.max_connections,
-                max_keepalive_connections=http_config.max_keepalive_connections,
-                keepalive_expiry=http_config.keepalive_expiry
-            ),
+            "transport": self._transport,
             "headers": http_config.default_headers.copy(),
         }
         
-        
-        
         self._client = httpx.AsyncClient(**client_kwargs)
         logger.info("HTTP客户端已创建", 
                    timeout=http_config.timeout,
                    max_connections=http_config.max_connections)
     
+    def _idempotent_hosts(self) -> List[str]:
+        """POST 可安全重试的主机：配置项 + LLM 服务（对话补全无副作用，客户端关闭了 SDK 自带重试）"""
+        hosts = list(self.config.http_client.idempotent_post_hosts)
+        for llm_config in (self.config.llm, self.config.lite_llm):
+            if llm_config and llm_config.base_url:
+                hosts.append(httpx.URL(llm_config.base_url).netloc.decode("ascii"))
+        return hosts
+
+    def get_stats(self) -> dict:
+        """按上游主机统计的请求耗时、重试与熔断状态"""
+        if self._transport is None:
+            return {}
+        return self._transport.get_stats()
+
     async def close(self):
         """关闭客户端连接"""
         if self._client:
             await self._client.aclose()
             self._client = None
+            self._transport = None
             logger.info("HTTP客户端已关闭")
     
     async def __aenter__(self):
@@ -87,6 +355,11 @@ async def get_http_client() -> httpx.AsyncClient:
     return await _http_client_manager.get_client()
 
 
+def get_http_client_stats() -> dict:
+    """获取全局HTTP客户端的按主机统计"""
+    return _http_client_manager.get_stats()
+
+
 @asynccontextmanager
 async def http_client_context():
     """HTTP客户端上下文管理器"""
@@ -107,33 +380,34 @@ class AsyncHTTPClient:
     
     async def get(self, url: str, **kwargs) -> httpx.Response:
         """异步GET请求"""
-        async with http_client_context() as client:
-            full_url = self._build_url(url)
-            return await client.get(full_url, **kwargs)
+        return await self.request("GET", url, **kwargs)
     
     async def post(self, url: str, **kwargs) -> httpx.Response:
         """异步POST请求"""
-        async with http_client_context() as client:
-            full_url = self._build_url(url)
-            return await client.post(full_url, **kwargs)
+        return await self.request("POST", url, **kwargs)
     
     async def put(self, url: str, **kwargs) -> httpx.Response:
         """异步PUT请求"""
-        async with http_client_context() as client:
-            full_url = self._build_url(url)
-            return await client.put(full_url, **kwargs)
+        return await self.request("PUT", url, **kwargs)
     
     async def delete(self, url: str, **kwargs) -> httpx.Response:
         """异步DELETE请求"""
-        async with http_client_context() as client:
-            full_url = self._build_url(url)
-            return await client.delete(full_url, **kwargs)
+        return await self.request("DELETE", url, **kwargs)
     
     async def patch(self, url: str, **kwargs) -> httpx.Response:
         """异步PATCH请求"""
+        return await self.request("PATCH", url, **kwargs)
+
+    async def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        发送请求
+        :param idempotent: 请求能否安全重试，默认按方法判断；查询类 POST 可传 True
+        """
+        if idempotent is not None:
+            kwargs["extensions"] = {**kwargs.get("extensions", {}), "idempotent": idempotent}
         async with http_client_context() as client:
             full_url = self._build_url(url)
-            return await client.patch(full_url, **kwargs)
+            return await client.request(method, full_url, **kwargs)
     
     def _build_url(self, url: str) -> str:
         """使用base_url + endpoint构建完整URL，去除掉endpoint中的前导斜杠"""
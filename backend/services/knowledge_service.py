@@ -11,7 +11,6 @@ import opendal
 from opendal import Operator, AsyncOperator
 from pymilvus import MilvusClient, DataType, FunctionType, Function, AsyncMilvusClient
 from langchain.embeddings import init_embeddings
-from langchain_huggingface import HuggingFaceEmbeddings
 from config.loader import get_config
 from config.loguru_config import get_logger
 from sqlalchemy.future import select
@@ -22,9 +21,10 @@ import uuid
 import time
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import asyncio
+import threading
+from typing import Optional
 from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
-from mineru_vl_utils import MinerUClient
 config = get_config()
 logger = get_logger(__name__)
 
@@ -63,21 +63,54 @@ class KnowledgeService:
         # 同步的milvus client，在解析任务当中使用
         self._sync_milvus_client = None
         
-        
-        
-        if config.embedding.provider == "self-hosted":
-            self.embedding_model = HuggingFaceEmbeddings(model_name=config.embedding.model_path)
-        else:
-            self.embedding_model = init_embeddings(
-                model=config.embedding.model_path, 
-                provider=config.embedding.provider, 
-                api_key=config.embedding.api_key, 
-                base_url=config.embedding.base_url)
+        # 嵌入模型延迟加载：自托管时需要在 CPU 上加载完整的 transformer 模型，
+        # 放在导入阶段会拖慢服务启动，改为启动后由后台预热任务加载，或在首次使用时加载
+        self._embedding_model = None
+        self._embedding_lock = threading.Lock()
         # 此处采用多线程方式进行解析，实际生产环境下，可以单独配置celery worker进行异步解析
         self.parse_executor = ThreadPoolExecutor(max_workers=10)
 
         self.milvus_collection_name = config.milvus.collection_name
 
+    def _load_embedding_model(self):
+        """加载嵌入模型，解析线程与预热任务可能同时调用，加锁保证只加载一次"""
+        with self._embedding_lock:
+            if self._embedding_model is None:
+                start_time = time.time()
+                if config.embedding.provider == "self-hosted":
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._embedding_model = HuggingFaceEmbeddings(model_name=config.embedding.model_path)
+                elif config.embedding.provider == "tei":
+                    # 进程外嵌入服务，多个 worker 共享同一份模型
+                    from services.embedding_client import TEIEmbeddings
+                    self._embedding_model = TEIEmbeddings(
+                        base_url=config.embedding.base_url,
+                        batch_max_size=config.embedding.batch_max_size,
+                        batch_max_wait_ms=config.embedding.batch_max_wait_ms,
+                        max_concurrent_batches=config.embedding.max_concurrent_batches,
+                        timeout=config.embedding.timeout)
+                else:
+                    self._embedding_model = init_embeddings(
+                        model=config.embedding.model_path, 
+                        provider=config.embedding.provider, 
+                        api_key=config.embedding.api_key, 
+                        base_url=config.embedding.base_url)
+                logger.info(f"嵌入模型加载完成, 耗时: {time.time() - start_time:.2f} 秒")
+        return self._embedding_model
+
+    @property
+    def embedding_model(self):
+        """同步获取嵌入模型（解析线程中使用），未加载时在当前线程加载"""
+        if self._embedding_model is None:
+            return self._load_embedding_model()
+        return self._embedding_model
+
+    async def aget_embedding_model(self):
+        """异步获取嵌入模型，未加载时在线程中加载，不阻塞事件循环"""
+        if self._embedding_model is None:
+            return await asyncio.to_thread(self._load_embedding_model)
+        return self._embedding_model
+
     @property
     def sync_milvus_client(self):
         if self._sync_milvus_client is None:
@@ -284,16 +317,18 @@ class KnowledgeService:
             # 提交到线程池执行
             # 注意：在异步上下文中，我们需要确保数据库操作是线程安全的
             # 这里我们传递必要的信息，在任务内部创建新的数据库会话
+            # 主事件循环一并传入，解析线程中的 MinerU 请求提交回主循环，复用共享的 HTTP 连接池
             self.parse_executor.submit(
                 self._run_parse_task,
                 user_id,
-                file_id
+                file_id,
+                asyncio.get_running_loop()
             )
             
             return file_id 
         return None
 
-    def _run_parse_task(self, user_id: str, file_id: str):
+    def _run_parse_task(self, user_id: str, file_id: str, loop: Optional[asyncio.AbstractEventLoop] = None):
         """
         在线程池中运行的解析任务
         使用同步方式处理
@@ -306,13 +341,13 @@ class KnowledgeService:
              return
 
         try:
-            self._process_file_parsing_sync(user_id, file_id, SyncSessionLocal)
+            self._process_file_parsing_sync(user_id, file_id, SyncSessionLocal, loop)
         except Exception as e:
             # 记录错误日志
             logger.error(f"Error in parse task: {e}")
             raise Exception(e)
 
-    def _process_file_parsing_sync(self, user_id: str, file_id: str, SessionLocal):
+    def _process_file_parsing_sync(self, user_id: str, file_id: str, SessionLocal, loop: Optional[asyncio.AbstractEventLoop] = None):
         """
         实际的解析逻辑 (同步版本)
         """
@@ -345,7 +380,7 @@ class KnowledgeService:
                 parser = None
                 if mime_type == 'application/pdf':
                     logger.info("开始解析pdf文件")
-                    parser = MineruPDFLoader()
+                    parser = MineruPDFLoader(loop=loop)
                     clean_file_name= file_record.file_name.replace(".pdf","")
                 elif mime_type == 'text/csv' or mime_type == 'text/plain': # csv sometimes detected as text/plain
                      if file_record.file_name.endswith('.csv'):
@@ -543,7 +578,8 @@ class KnowledgeService:
             query = [query]
         
         logger.info(f"search_content query: {query}")
-        query_dense_vector = await self.embedding_model.aembed_documents(query)
+        embedding_model = await self.aget_embedding_model()
+        query_dense_vector = await embedding_model.aembed_documents(query)
         
 
         search_param_1 = {
@@ -633,7 +669,9 @@ class KnowledgeService:
                 })
             return_result.append(return_query_result_list)
 
-        logger.info(f"search_content return_result: {return_result}")
+        # 完整结果只在 DEBUG 级别输出，且延迟到确实需要写出时才格式化
+        logger.info(f"search_content 返回 {len(return_result)} 组结果")
+        logger.opt(lazy=True).debug("search_content return_result: {}", lambda: return_result)
         return return_result
 
     async def _prepare_milvus_data(self, documents:list[Document],file_id:str,file_name:str)->list[dict]:
@@ -641,13 +679,14 @@ class KnowledgeService:
         将langchain文档转换为milvus格式
         """
         data = []
+        embedding_model = await self.aget_embedding_model()
         for doc in documents:
             data.append({
                 "id": doc.id,
                 "file_id": file_id,
                 "file_name": file_name,
                 "text": doc.page_content,
-                "text_sparse": await self.embedding_model.aembed_documents([doc.page_content]),
+                "text_sparse": await embedding_model.aembed_documents([doc.page_content]),
             })
         return data
     
@@ -0,0 +1,175 @@
+"""
+MinerU 解析服务客户端
+长 PDF 按页切分为多个分片（每片 shard_pages 页，切成独立的小 PDF 上传，避免每个分片都上传整份文件），
+分片轮询分配到 mineru.base_urls 中的各个实例并发解析，每个实例同时处理的分片数受 max_concurrent_shards 限制；
+分片失败时换下一个实例重试，全部完成后按页序拼接 markdown 与 content_list（页码换算为整份文档的页码）。
+请求走共享的 HTTP 连接池（services.http_client）；没有运行中的主事件循环时（如离线脚本），
+parse_pdf_blocking 在临时事件循环中使用短生命周期的客户端，不触碰绑定在主循环上的共享连接池。
+"""
+import asyncio
+import io
+import json
+import random
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+from services.http_client import AsyncHTTPClient
+
+logger = get_logger(__name__)
+
+
+def split_pdf(pdf_bytes: bytes, shard_pages: int) -> List[Tuple[int, int, bytes]]:
+    """按页切分 PDF，返回 (起始页, 结束页, 分片 PDF) 列表；页码从 0 开始，结束页包含在内"""
+    import pypdfium2 as pdfium
+
+    source = pdfium.PdfDocument(pdf_bytes)
+    try:
+        page_count = len(source)
+        if page_count <= shard_pages:
+            return [(0, page_count - 1, pdf_bytes)]
+
+        shards = []
+        for start in range(0, page_count, shard_pages):
+            end = min(start + shard_pages, page_count) - 1
+            shard = pdfium.PdfDocument.new()
+            try:
+                shard.import_pages(source, pages=list(range(start, end + 1)))
+                buffer = io.BytesIO()
+                shard.save(buffer)
+            finally:
+                shard.close()
+            shards.append((start, end, buffer.getvalue()))
+        return shards
+    finally:
+        source.close()
+
+
+@dataclass
+class MineruResult:
+    """MinerU 解析结果"""
+    markdown: str = ""
+    # 按阅读顺序排列的内容块，page_idx 为整份文档中的页码；任一分片缺少 content_list 时为空
+    content_list: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class MineruClient:
+    """MinerU /file_parse 的异步客户端"""
+
+    def __init__(self):
+        self.config = get_config().mineru
+        base_urls = self.config.base_urls or [self.config.base_url]
+        self.clients = [AsyncHTTPClient(base_url=url) for url in base_urls]
+        # 每个实例的并发分片数限制；信号量绑定事件循环，按循环分别创建
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, List[asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+    @property
+    def backend(self) -> str:
+        return "vlm-vllm-async-engine" if self.config.use_vllm else "pipeline"
+
+    def parse_pdf_blocking(self, pdf_bytes: bytes, file_name: str,
+                           loop: Optional[asyncio.AbstractEventLoop] = None) -> MineruResult:
+        """
+        在工作线程中同步解析 PDF
+        :param loop: 主事件循环；运行中时请求提交到主循环，复用共享连接池，否则在临时事件循环中使用独立的客户端
+        """
+        if loop is not None and loop.is_running():
+            return asyncio.run_coroutine_threadsafe(self.parse_pdf(pdf_bytes, file_name), loop).result()
+
+        async def standalone() -> MineruResult:
+            async with httpx.AsyncClient(timeout=self.config.timeout) as client:
+                return await self.parse_pdf(pdf_bytes, file_name, http_client=client)
+
+        return asyncio.run(standalone())
+
+    async def parse_pdf(self, pdf_bytes: bytes, file_name: str,
+                        http_client: Optional[httpx.AsyncClient] = None) -> MineruResult:
+        """
+        解析整份 PDF，返回按页序拼接的 markdown 与 content_list
+        :param file_name: 上传的文件名（不含扩展名），MinerU 按它返回结果
+        :param http_client: 指定时使用该客户端发送请求，否则使用共享连接池
+        """
+        shards = await asyncio.to_thread(split_pdf, pdf_bytes, self.config.shard_pages)
+        logger.info(f"MinerU 解析 {file_name}: 共 {shards[-1][1] + 1} 页，切分为 {len(shards)} 个分片，后端 {self.backend}")
+        results = await asyncio.gather(*[
+            self._parse_shard(index, start, end, data, file_name, http_client)
+            for index, (start, end, data) in enumerate(shards)
+        ])
+        merged = MineruResult(markdown="\n\n".join(result.markdown for result in results if result.markdown))
+        # 只有每个分片都返回了 content_list 时才使用它，否则缺失的分片会从索引中丢失；此时退回整份 markdown
+        missing = [f"{start + 1}-{end + 1}" for (start, end, _), result in zip(shards, results) if not result.content_list]
+        if missing:
+            if len(missing) < len(shards):
+                logger.warning(f"MinerU 解析 {file_name}: 第 {', '.join(missing)} 页的分片没有返回 content_list，改用 markdown")
+            return merged
+        for (start, _, _), result in zip(shards, results):
+            for item in result.content_list:
+                merged.content_list.append({**item, "page_idx": item.get("page_idx", 0) + start})
+        return merged
+
+    def _loop_slots(self) -> List[asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = [asyncio.Semaphore(self.config.max_concurrent_shards) for _ in self.clients]
+        return slots
+
+    async def _parse_shard(self, index: int, start: int, end: int, data: bytes, file_name: str,
+                           http_client: Optional[httpx.AsyncClient]) -> MineruResult:
+        slots = self._loop_slots()
+        retries = self.config.shard_retries
+        for attempt in range(retries + 1):
+            # 首次按分片序号轮询分配实例，重试时换到下一个实例
+            instance = (index + attempt) % len(self.clients)
+            try:
+                async with slots[instance]:
+                    return await self._post(instance, data, file_name, http_client)
+            except Exception as e:
+                if attempt >= retries:
+                    logger.error(f"MinerU 分片解析失败: {file_name} 第 {start + 1}-{end + 1} 页, {e}")
+                    raise
+                delay = random.uniform(0, min(10.0, 2 ** attempt))
+                logger.warning(f"MinerU 分片解析失败: {file_name} 第 {start + 1}-{end + 1} 页，{delay:.2f} 秒后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def _post(self, instance: int, data: bytes, file_name: str,
+                    http_client: Optional[httpx.AsyncClient]) -> MineruResult:
+        request = dict(
+            data={"backend": self.backend, "return_md": "true", "return_content_list": "true"},
+            files=[("files", (f"{file_name}.pdf", data, "application/pdf"))],
+            timeout=self.config.timeout,
+        )
+        client = self.clients[instance]
+        if http_client is not None:
+            response = await http_client.post(f"{client.base_url}/{self.config.parse_endpoint.lstrip('/')}", **request)
+        else:
+            response = await client.post(self.config.parse_endpoint, **request)
+        if response.status_code != 200:
+            raise Exception(f"Mineru解析失败: {response.status_code} {response.text[:500]}")
+
+        results = response.json().get("results") or {}
+        result = results.get(file_name) or results.get(Path(file_name).stem)
+        if result is None:
+            if not results:
+                raise Exception(f"未知的 Mineru 返回格式: {response.text[:500]}")
+            result = next(iter(results.values()))
+        content_list = result.get("content_list") or []
+        if isinstance(content_list, str):
+            content_list = json.loads(content_list)
+        return MineruResult(markdown=result.get("md_content") or "", content_list=content_list)
+
+
+_mineru_client: Optional[MineruClient] = None
+
+
+def get_mineru_client() -> MineruClient:
+    """获取 MinerU 客户端实例"""
+    global _mineru_client
+    if _mineru_client is None:
+        _mineru_client = MineruClient()
+    return _mineru_client
@@ -1,12 +1,38 @@
 """
 Markdown解析器，对Markdown进行解析
+
+直接在内存中把 markdown 字符串（或 MinerU 的 content_list）解析为元素，不经过临时文件与 unstructured：
+    Title          标题，metadata.category_depth 为层级（从 0 开始）
+    NarrativeText  段落
+    ListItem       列表项
+    Table          表格（markdown 表格或 MinerU 输出的 HTML 表格，HTML 转为按行的文本）
+    Formula        公式块
+    CodeSnippet    代码块
+    Image          图片标题 / 脚注
+每个元素的 metadata.breadcrumbs 为所在的标题路径
 """
+import json
+from html import unescape
 from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from services.parsers.base import BaseParser
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple, Union
 import re
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+(.*)$")
+IMAGE_RE = re.compile(r"^\s*!\[[^\]]*\]\([^)]*\)\s*$")
+# MinerU content_list 中不参与检索的块类型（页眉页脚、页码等）
+SKIPPED_CONTENT_TYPES = {"discarded", "header", "footer", "page_number", "aside_text", "page_footnote"}
+
+
+def html_table_to_text(html: str) -> str:
+    """HTML 表格转为按行的文本，单元格之间以 | 分隔"""
+    text = re.sub(r"</t[dh]\s*>", " | ", html, flags=re.IGNORECASE)
+    text = re.sub(r"</tr\s*>", "\n", text, flags=re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", "", text)
+    rows = [row.strip().rstrip("|").strip() for row in unescape(text).splitlines()]
+    return "\n".join(row for row in rows if row)
 class MarkdownParser(BaseParser):
     """
     Markdown文件解析器
@@ -20,26 +46,135 @@ class MarkdownParser(BaseParser):
 
     def parse(self, file_path: str) -> List[Document]:
         """
-        通过MineruParser将PDF文件解析成MarkDown之后，再通过MarkdownLoader解析Markdown文件内容，将其切分成不同的chunk，再将chunk内容存储到Milvus当中去
+        解析Markdown文件内容，切分为元素
         :param file_path: Markdown文件路径
         :return: 解析后的文本内容
         """
-        loader = UnstructuredMarkdownLoader(file_path=file_path,mode="elements")
-        documents = loader.load()
-        return documents
+        with open(file_path, "r", encoding="utf-8") as f:
+            return self.parse_text(f.read(), source=file_path)
+
+    def parse_text(self, markdown_text: str, source: Optional[str] = None) -> List[Document]:
+        """
+        直接解析 markdown 字符串
+        :param source: 写入 metadata.source 的来源标识
+        """
+        builder = _ElementBuilder(source)
+        lines = self._clean_markdown(markdown_text).split("\n")
+        paragraph: List[str] = []
+
+        def flush_paragraph():
+            if paragraph:
+                builder.add("NarrativeText", " ".join(line.strip() for line in paragraph))
+                paragraph.clear()
+
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            stripped = line.strip()
+
+            # 代码块 / 公式块：收集到对应的结束标记为止
+            fence = next((mark for mark in ("```", "~~~", "$$") if stripped.startswith(mark)), None)
+            if fence:
+                flush_paragraph()
+                if fence == "$$" and len(stripped) > 2 and stripped.endswith("$$"):
+                    builder.add("Formula", stripped)
+                    i += 1
+                    continue
+                block = [line]
+                i += 1
+                while i < len(lines):
+                    block.append(lines[i])
+                    i += 1
+                    if lines[i - 1].strip().startswith(fence):
+                        break
+                builder.add("Formula" if fence == "$$" else "CodeSnippet", "\n".join(block))
+                continue
+
+            heading = HEADING_RE.match(line)
+            if heading:
+                flush_paragraph()
+                builder.add_title(heading.group(2), len(heading.group(1)) - 1)
+            elif stripped.startswith("|") or stripped.lower().startswith("<table"):
+                # 连续的表格行作为一个表格元素
+                flush_paragraph()
+                block = []
+                is_html = stripped.lower().startswith("<table")
+                while i < len(lines) and lines[i].strip():
+                    if not is_html and not lines[i].strip().startswith("|"):
+                        break
+                    block.append(lines[i])
+                    i += 1
+                    if is_html and "</table>" in lines[i - 1].lower():
+                        break
+                text = "\n".join(block)
+                builder.add("Table", html_table_to_text(text) if is_html else text)
+                continue
+            elif LIST_ITEM_RE.match(line):
+                flush_paragraph()
+                item = [LIST_ITEM_RE.match(line).group(1)]
+                # 缩进的续行属于同一个列表项
+                while i + 1 < len(lines) and lines[i + 1].startswith((" ", "\t")) and lines[i + 1].strip() \
+                        and not LIST_ITEM_RE.match(lines[i + 1]):
+                    i += 1
+                    item.append(lines[i].strip())
+                builder.add("ListItem", " ".join(item))
+            elif not stripped or IMAGE_RE.match(line):
+                flush_paragraph()
+            else:
+                paragraph.append(line)
+            i += 1
+
+        flush_paragraph()
+        return builder.documents
+
+    def parse_content_list(self, content_list: Union[str, List[Dict[str, Any]]],
+                           source: Optional[str] = None) -> List[Document]:
+        """
+        解析 MinerU 的 content_list（按阅读顺序排列的块），保留页码
+        :param content_list: content_list 列表或其 JSON 字符串
+        """
+        if isinstance(content_list, str):
+            content_list = json.loads(content_list)
+        builder = _ElementBuilder(source)
+        for item in content_list:
+            item_type = item.get("type")
+            page = {"page_number": item["page_idx"] + 1} if "page_idx" in item else {}
+            if item_type in SKIPPED_CONTENT_TYPES:
+                continue
+            if item_type == "text":
+                if item.get("text_level"):
+                    builder.add_title(item.get("text", ""), item["text_level"] - 1, **page)
+                else:
+                    builder.add("NarrativeText", item.get("text", ""), **page)
+            elif item_type == "list":
+                for list_item in item.get("list_items", []):
+                    builder.add("ListItem", list_item, **page)
+            elif item_type == "equation":
+                builder.add("Formula", item.get("text", ""), **page)
+            elif item_type == "table":
+                body = html_table_to_text(item.get("table_body", ""))
+                text = "\n".join(item.get("table_caption", []) + [body] + item.get("table_footnote", []))
+                builder.add("Table", text, **page)
+            elif item_type == "code":
+                text = "\n".join(item.get("code_caption", []) + [item.get("code_body", "")])
+                builder.add("CodeSnippet", text, **page)
+            elif item_type == "image":
+                builder.add("Image", "\n".join(item.get("image_caption", []) + item.get("image_footnote", [])), **page)
+            elif item.get("text"):
+                builder.add("NarrativeText", item["text"], **page)
+        return builder.documents
     
     @staticmethod
     def _clean_markdown(markdown_text: str) -> str:
         """
-        对MarkDown文档文本进行清洗：
-        1、移除Markdown当中的空行（包括多个连续的空行），空行在原文档当中可能表示换页
+        对MarkDown文档文本进行清洗，保留换行，标题、列表、表格的结构依赖换行：
+        1、统一换行符，移除行尾空白
+        2、多个连续的空行合并为一个，空行在原文档当中可能表示换页
         """
-        # 移除Markdown中的特殊字符，如反引号、星号等
-        # 1、移除多个连续的空行
-        cleaned_text = re.sub(r'\n\s*\n', '\n', markdown_text)
-        # 2、移除多余的空格
-        cleaned_text = re.sub(r'\s+', ' ', cleaned_text)
-        return cleaned_text
+        cleaned_text = markdown_text.replace("\r\n", "\n").replace("\r", "\n")
+        cleaned_text = re.sub(r'[ \t]+\n', '\n', cleaned_text)
+        cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text)
+        return cleaned_text.strip()
 
     def _enrich_with_breadcrumbs(self,documents:List[Document])->List[dict]:
         """
@@ -85,4 +220,37 @@ class MarkdownParser(BaseParser):
         在单个element内，如果内容长度超出最大长度，进行切分
         通过RecursiveCharacterTextSplitter进行切分，暂不实现
         """
+
+
+class _ElementBuilder:
+    """收集元素并维护标题栈，为每个元素记录面包屑"""
+
+    def __init__(self, source: Optional[str]):
+        self.source = source
+        self.documents: List[Document] = []
+        # [(level, text), ...]
+        self.header_stack: List[Tuple[int, str]] = []
+
+    def add_title(self, text: str, depth: int, **metadata) -> None:
+        text = text.strip()
+        if not text:
+            return
+        while self.header_stack and self.header_stack[-1][0] >= depth:
+            self.header_stack.pop()
+        self.add("Title", text, category_depth=depth, **metadata)
+        self.header_stack.append((depth, text))
+
+    def add(self, category: str, text: str, **metadata) -> None:
+        text = text.strip()
+        if not text:
+            return
+        self.documents.append(Document(
+            page_content=text,
+            metadata={
+                "category": category,
+                "source": self.source,
+                "breadcrumbs": " > ".join(h[1] for h in self.header_stack),
+                **metadata,
+            },
+        ))
         
\ No newline at end of file
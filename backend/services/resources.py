@@ -0,0 +1,95 @@
+"""
+重量级资源的生命周期
+嵌入模型、tokenizer 等加载耗时较长的资源不在导入阶段创建，而是登记到 ResourceRegistry：
+服务开始接收请求后由后台任务依次预热，未预热完成时各资源仍会在首次使用时按需加载。
+就绪状态通过 /api/system/ready 暴露，供负载均衡 / k8s readinessProbe 使用
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config.loguru_config import get_logger
+
+logger = get_logger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class Resource:
+    """一个需要预热的资源"""
+    name: str
+    loader: Callable[[], Awaitable[Any]]
+    # 必需资源未就绪时，服务整体报告为未就绪
+    required: bool = True
+    state: str = PENDING
+    load_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ResourceRegistry:
+    """资源登记与后台预热"""
+
+    def __init__(self):
+        self._resources: Dict[str, Resource] = {}
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, loader: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        self._resources[name] = Resource(name=name, loader=loader, required=required)
+
+    def start_warmup(self) -> None:
+        """创建后台预热任务，立即返回，不阻塞服务启动"""
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup())
+
+    async def _warmup(self) -> None:
+        for resource in self._resources.values():
+            if resource.state == READY:
+                continue
+            await self.load(resource.name)
+        logger.info(f"资源预热结束: {self.status()}")
+
+    async def load(self, name: str) -> None:
+        """加载单个资源，失败时记录错误，不影响其它资源"""
+        resource = self._resources[name]
+        resource.state = LOADING
+        start_time = time.perf_counter()
+        try:
+            await resource.loader()
+        except Exception as e:
+            resource.state = FAILED
+            resource.error = str(e)
+            logger.error(f"资源 {name} 预热失败: {e}")
+        else:
+            resource.state = READY
+            resource.error = None
+            logger.info(f"资源 {name} 预热完成")
+        finally:
+            resource.load_ms = round((time.perf_counter() - start_time) * 1000, 1)
+
+    async def stop(self) -> None:
+        if self._warmup_task:
+            self._warmup_task.cancel()
+            try:
+                await self._warmup_task
+            except asyncio.CancelledError:
+                pass
+            self._warmup_task = None
+
+    @property
+    def ready(self) -> bool:
+        return all(r.state == READY for r in self._resources.values() if r.required)
+
+    def status(self) -> List[dict]:
+        return [
+            {"name": r.name, "state": r.state, "required": r.required, "load_ms": r.load_ms, "error": r.error}
+            for r in self._resources.values()
+        ]
+
+
+# 全局资源登记表
+resources = ResourceRegistry()
@@ -0,0 +1,167 @@
+"""
+会话记忆缓存
+long_term_memory_import 在检查点中没有对话历史时（新会话、检查点过期或服务重启），
+需要从数据库导入长期摘要与最近几轮对话。热会话的这部分数据保存在进程内 LRU 缓存中：
+    命中       直接返回，不访问数据库
+    未命中     一条查询（sessions LEFT JOIN session_summaries LEFT JOIN LATERAL 最近 N 轮）取回全部数据，
+               会话不存在时返回空记忆，会话由本轮结束时的写入事务创建（见 services.turn_writes）
+    写穿       memory_summary 写库后同步更新缓存，并通过 Redis pub/sub 通知其它 worker 丢弃该会话的缓存
+Redis 不可用时缓存只在进程内失效，依赖 TTL 兜底
+"""
+import asyncio
+import os
+import socket
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import select, true
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+from db.redis import HAS_REDIS, get_redis_client
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class SessionMemory:
+    """会话的长期摘要与最近几轮对话 (用户输入, 回复)"""
+    summary: str = ""
+    recent_turns: List[Tuple[str, str]] = field(default_factory=list)
+
+
+class SessionMemoryCache:
+    """会话记忆的进程内 LRU 缓存"""
+
+    def __init__(self):
+        self.config = get_config().session_memory_cache
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.client = None
+        self._entries: TTLCache = TTLCache(maxsize=self.config.max_sessions, ttl=self.config.ttl)
+        self._listener_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        """订阅失效频道；Redis 不可用时只在进程内失效"""
+        if not HAS_REDIS:
+            return
+        try:
+            client = get_redis_client()
+            await client.ping()
+        except Exception as e:
+            logger.warning(f"Redis 不可用，会话记忆缓存仅在当前进程内失效: {e}")
+            return
+        self.client = client
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self.client = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.config.invalidate_channel)
+                # 订阅中断期间可能错过失效消息，重新订阅后清空缓存
+                self._entries.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = message["data"]
+                    data = data.decode("utf-8") if isinstance(data, bytes) else data
+                    worker_id, _, session_id = data.partition("|")
+                    if worker_id != self.worker_id:
+                        self._entries.pop(session_id, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"会话记忆失效频道订阅异常，1 秒后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def _publish(self, session_id: str) -> None:
+        if self.client is None:
+            return
+        try:
+            await self.client.publish(self.config.invalidate_channel, f"{self.worker_id}|{session_id}")
+        except Exception as e:
+            logger.error(f"广播会话记忆失效失败: {session_id}, {e}")
+
+    def get(self, session_id: str) -> Optional[SessionMemory]:
+        return self._entries.get(session_id)
+
+    async def load(self, session_id: str, user_id: str) -> SessionMemory:
+        """读取会话记忆，未命中时一条查询从数据库导入"""
+        memory = self._entries.get(session_id)
+        if memory is not None:
+            self.hits += 1
+            return memory
+        self.misses += 1
+        memory = await self._load_from_db(session_id, user_id)
+        self._entries[session_id] = memory
+        return memory
+
+    async def _load_from_db(self, session_id: str, user_id: str) -> SessionMemory:
+        from db.database import SessionLocal
+        from db.db_models import ConversationHistory, Session, SessionSummary
+
+        recent = (
+            select(ConversationHistory.user_input, ConversationHistory.agent_output, ConversationHistory.created_at)
+            .where(ConversationHistory.session_id == Session.id)
+            .order_by(ConversationHistory.created_at.desc())
+            .limit(self.config.recent_turns)
+            .lateral("recent")
+        )
+        stmt = (
+            select(SessionSummary.summary, recent.c.user_input, recent.c.agent_output, recent.c.created_at)
+            .select_from(Session)
+            .outerjoin(SessionSummary, SessionSummary.session_id == Session.id)
+            .outerjoin(recent, true())
+            .where(Session.id == session_id)
+            .order_by(recent.c.created_at.asc())
+        )
+        async with SessionLocal() as db:
+            rows = (await db.execute(stmt)).all()
+        if not rows:
+            logger.info(f"会话 {session_id} 不存在，将在本轮结束时创建")
+            return SessionMemory()
+
+        return SessionMemory(
+            summary=rows[0].summary or "",
+            recent_turns=[(row.user_input, row.agent_output) for row in rows if row.created_at is not None],
+        )
+
+    async def remember(self, session_id: str, summary: str, conversation_history: List[Tuple[str, str]]) -> None:
+        """写穿：本轮写库完成后更新缓存，并使其它 worker 上的缓存失效"""
+        self._entries[session_id] = SessionMemory(
+            summary=summary,
+            recent_turns=list(conversation_history[-self.config.recent_turns:]),
+        )
+        await self._publish(session_id)
+
+    async def invalidate(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+        await self._publish(session_id)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# 全局会话记忆缓存实例
+session_memory_cache = SessionMemoryCache()
@@ -1,12 +1,17 @@
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import aclosing
+import base64
+import json
 from datetime import datetime
-from collections import defaultdict
 from langgraph.types import Command
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select,delete
+from sqlalchemy import select,delete,tuple_
 from routes.schema import MessageCreate, Session, SessionStatus
 from db.db_models import Session
 from services.agent import get_agent
+from services.session_state import TurnHandle, session_state
+from services.session_memory import session_memory_cache
+from services.sse import agent_text_field, get_sse_streamer
 from langchain_core.messages import BaseMessage, ToolMessage, HumanMessage, AIMessage
 
 from config.loguru_config import get_logger
@@ -20,8 +25,6 @@ class SessionService:
     def __init__(self):
         # agent通过协程后面进行懒加载，现在仅需要给一个None即可
         self.agent = None
-        # 对agent生成进行暂停flag
-        self.session_keep_generate_flag = defaultdict(lambda : True)
         
 
     async def init_agent(self):
@@ -103,47 +106,123 @@ class SessionService:
                 conversation_status=session.conversation_status,
                 created_at=session.created_at,
                 updated_at=session.updated_at,
-                message_count=session.message_count
+                message_count=session.message_count or 0,
+                last_message=session.last_message,
+                last_message_time=session.last_message_time
             ) for session in db_sessions
         ]
 
+    @staticmethod
+    def encode_cursor(created_at: datetime, record_id: str) -> str:
+        """将 (created_at, id) 编码为分页游标"""
+        raw = json.dumps({"t": created_at.isoformat(), "id": record_id})
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        """解析分页游标，格式错误时抛出 ValueError"""
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(raw["t"]), raw["id"]
+        except Exception as e:
+            raise ValueError(f"无效的分页游标: {cursor}") from e
+
+    @staticmethod
+    def _history_query(session_id: str, start_time: Optional[datetime], end_time: Optional[datetime]):
+        from db.db_models import ConversationHistory
+
+        query = select(
+            ConversationHistory.id,
+            ConversationHistory.user_input,
+            ConversationHistory.agent_output,
+            ConversationHistory.created_at,
+        ).where(ConversationHistory.session_id == session_id)
+        if start_time:
+            query = query.where(ConversationHistory.created_at >= start_time)
+        if end_time:
+            query = query.where(ConversationHistory.created_at < end_time)
+        return query
+
+    @staticmethod
+    def _record_to_messages(record) -> List[BaseMessage]:
+        """将一条对话记录还原为 HumanMessage / AIMessage"""
+        messages = []
+        # 重构 HumanMessage
+        if record.user_input:
+            messages.append(HumanMessage(
+                content=record.user_input, 
+                id=f"{record.id}_user", # 构造唯一的ID
+                additional_kwargs={"created_at": record.created_at.isoformat()}
+            ))
+        
+        # 重构 AIMessage
+        if record.agent_output:
+            messages.append(AIMessage(
+                content=record.agent_output,
+                id=f"{record.id}_agent", # 构造唯一的ID
+                additional_kwargs={"created_at": record.created_at.isoformat()}
+            ))
+        return messages
+
+    async def iter_messages(self, session_id: str, db: AsyncSession, start_time: Optional[datetime] = None,
+                            end_time: Optional[datetime] = None, batch_size: int = 200) -> AsyncIterator[BaseMessage]:
+        """
+        按时间正序逐批读取会话历史消息
+        使用 (created_at, id) keyset 分批查询，每批都是一次走索引的小查询，内存占用与会话长度无关
+        """
+        from db.db_models import ConversationHistory
+
+        after: Optional[Tuple[datetime, str]] = None
+        while True:
+            query = self._history_query(session_id, start_time, end_time)
+            if after:
+                query = query.where(tuple_(ConversationHistory.created_at, ConversationHistory.id) > after)
+            query = query.order_by(ConversationHistory.created_at.asc(), ConversationHistory.id.asc()).limit(batch_size)
+            records = (await db.execute(query)).all()
+            for record in records:
+                for message in self._record_to_messages(record):
+                    yield message
+            if len(records) < batch_size:
+                return
+            after = (records[-1].created_at, records[-1].id)
+
     async def get_messages(self, session_id: str, db: AsyncSession) -> List[BaseMessage]:
         """
         从数据库获取会话历史消息
         """
+        return [message async for message in self.iter_messages(session_id, db)]
+
+    async def get_messages_page(self, session_id: str, db: AsyncSession, limit: int = 20, cursor: Optional[str] = None,
+                                start_time: Optional[datetime] = None,
+                                end_time: Optional[datetime] = None) -> Tuple[List[BaseMessage], Optional[str]]:
+        """
+        分页获取会话历史消息：从最新的对话轮次往前翻页
+        :param limit: 每页的对话轮次数（每轮包含用户消息与回复）
+        :param cursor: 上一页返回的 next_cursor，为空时从最新一轮开始
+        :return: (按时间正序排列的本页消息, 下一页游标；没有更早的消息时为 None)
+        """
         from db.db_models import ConversationHistory
-        
-        # 从数据库查询历史记录
-        result = await db.execute(
-            select(ConversationHistory)
-            .where(ConversationHistory.session_id == session_id)
-            .order_by(ConversationHistory.created_at.asc())
-        )
-        history_records = result.scalars().all()
-        
+
+        query = self._history_query(session_id, start_time, end_time)
+        if cursor:
+            query = query.where(tuple_(ConversationHistory.created_at, ConversationHistory.id) < self.decode_cursor(cursor))
+        # 多取一条用于判断是否还有更早的记录
+        query = query.order_by(ConversationHistory.created_at.desc(), ConversationHistory.id.desc()).limit(limit + 1)
+        records = (await db.execute(query)).all()
+
+        has_more = len(records) > limit
+        records = records[:limit]
+        next_cursor = self.encode_cursor(records[-1].created_at, records[-1].id) if has_more else None
+
         messages = []
-        for record in history_records:
-            # 重构 HumanMessage
-            if record.user_input:
-                messages.append(HumanMessage(
-                    content=record.user_input, 
-                    id=f"{record.id}_user", # 构造唯一的ID
-                    additional_kwargs={"created_at": record.created_at.isoformat()}
-                ))
-            
-            # 重构 AIMessage
-            if record.agent_output:
-                messages.append(AIMessage(
-                    content=record.agent_output,
-                    id=f"{record.id}_agent", # 构造唯一的ID
-                    additional_kwargs={"created_at": record.created_at.isoformat()}
-                ))
-                
-        return messages
+        for record in reversed(records):
+            messages.extend(self._record_to_messages(record))
+        return messages, next_cursor
 
     async def add_message_to_session(self,session_id: str, user_id: str, message_data: MessageCreate,db: AsyncSession):
         """
         向会话添加消息
+        :return: (轮次句柄, 响应生成器)；会话不存在时返回 None
         """
         import json
         session = await session_service.get_session(session_id,db)
@@ -152,93 +231,92 @@ class SessionService:
         logger.info("add_message_to_session invoking...")
         config = {
             "configurable":
-                {"thread_id":session_id}
+                {"thread_id":session_id, "user_id":user_id}
         }
         await self.init_agent()
         invoke_message = {"messages":("user",message_data.text)}
-        return self._agent_generate_response(messages=invoke_message,config=config)
+        # 同一会话已有生成中的轮次时抛出 SessionBusyError
+        handle = await session_state.begin_turn(session_id)
+        return handle, self._agent_generate_response(handle=handle,messages=invoke_message,config=config)
 
-    async def tool_invoke(self,session_id,is_approved):
+    async def tool_invoke(self,session_id,user_id,is_approved):
         """
         根据用户输入内容，判断是否需要执行真正工作调用。通过Interrupt / Consume 等 langgraph原语实现
         """
         import json
         config = {
             "configurable":
-                {"thread_id": session_id}
+                {"thread_id": session_id, "user_id": user_id}
         }
         await self.init_agent()
+        handle = await session_state.begin_turn(session_id)
         if is_approved:
             # agent继续执行
-            return self._agent_generate_response(command=Command(resume=True),config=config)
+            return handle, self._agent_generate_response(handle=handle,command=Command(resume=True),config=config)
         else:
-            return self._agent_generate_response(command=Command(resume=False),config=config)
+            return handle, self._agent_generate_response(handle=handle,command=Command(resume=False),config=config)
     
-    async def _agent_generate_response(self,*,command:Command=None,config:Dict=None,messages:Dict=None):
+    async def _agent_generate_response(self,*,handle:TurnHandle,command:Command=None,config:Dict=None,messages:Dict=None):
         """
         模型生成
         
+        :param handle: begin_turn 返回的轮次句柄，收到停止请求时打断生成，结束时释放轮次锁
         :param command: Description
         :type command: Command
         """
-        import json
-        logger.info("调用_agent_generate_response中")
-        self.session_keep_generate_flag[config["configurable"]["thread_id"]] = True # 重新置为True,避免影响后面生成
-        logger.info(f"当前flag值为:{self.session_keep_generate_flag[config["configurable"]["thread_id"]]}")
-        async for chunk in self.agent.astream(
-                    input=command or messages,
-                    config=config,
-                    stream_mode=["updates", "messages"]
-            ):
+        try:
+            # 相邻的 ai_message 增量合并成帧发送；客户端断开或过慢时关闭 Agent 生成器
+            frames = get_sse_streamer().stream(
+                self._agent_stream(handle=handle,command=command,config=config,messages=messages),
+                text_field=agent_text_field,
+            )
+            async with aclosing(frames):
+                async for frame in frames:
+                    yield frame
+        finally:
+            await session_state.end_turn(handle)
 
-            if not self.session_keep_generate_flag[config["configurable"]["thread_id"]]:
-                logger.info(f"当前session_id为:{config["configurable"]["thread_id"]}置为True")
-                self.session_keep_generate_flag[config["configurable"]["thread_id"]] = True # 重新置为True,避免影响后面生成
-
-                break
-        
-        
+    async def _agent_stream(self,*,handle:TurnHandle,command:Command=None,config:Dict=None,messages:Dict=None):
+        logger.info("调用_agent_generate_response中")
+        stream = self.agent.astream(
+            input=command or messages,
+            config=config,
+            stream_mode=["updates", "messages", "custom"]
+        )
+        async for chunk in session_state.iterate(handle, stream):
             # 对于messages类型数据，需要判断是ai_message or tool_message，前端使用不同的方式渲染
             if chunk[0] == "messages":
                 if isinstance(chunk[1][0], ToolMessage):
-                    message_json = {
+                    yield {
                             "tool_message": chunk[1][0].content
                     }
                 elif chunk[1][0].content:
-                    message_json = {
+                    yield {
                         "ai_message": chunk[1][0].content
                     }
-                else:
-                    continue
-                data = json.dumps(message_json)
-                logger.debug(f'当前生成的AI消息为:{data}')
-                yield f"data : {data}\n\n"
 
             # 对于状态更新类型的数据，且状态当中有interrupt，向前端发送特定类型数据
             elif chunk[0] == "updates" and "__interrupt__" in chunk[1]:
                 interrupt_value = chunk[1]["__interrupt__"][0].value
-                interrupt_json = {
+                logger.debug(f"当前生成的状态更新消息为:{interrupt_value}")
+                yield {
                     "func_call":interrupt_value
                 }
-                data = json.dumps(interrupt_json)
-                logger.debug(f"当前生成的状态更新消息为:{data}")
-                yield f"data: {data}\n\n"
-        
-        
-        yield "data : [DONE]\n\n"
-        # 总是需要将状态重新置为True
-        
+
+            # 工具通过 stream writer 推送的自定义数据（如飞书导出进度）
+            elif chunk[0] == "custom" and isinstance(chunk[1], dict):
+                yield chunk[1]
             
     async def stop_generation(self,session_id:str)->bool:
         """
-        暂停Agent继续生成
+        暂停Agent继续生成，生成可能在任意一个 worker 上
         
         :param session_id: Description
         :type session_id: str
+        :return: 当前是否有正在生成的轮次
         """
-        logger.info(f"当前session_id为:{session_id}置为False")
-        self.session_keep_generate_flag[session_id] = False # 将flag置为False,停止模型的生成
-        return True
+        logger.info(f"请求停止会话生成: {session_id}")
+        return await session_state.request_stop(session_id)
     
     async def delete_session(self,session_id:str,db: AsyncSession):
         """
@@ -256,6 +334,7 @@ class SessionService:
         # 最后删除会话
         await db.execute(delete(Session).where(Session.id == session_id))
         await db.commit()
+        await session_memory_cache.invalidate(session_id)
 
     async def update_session_title(self, session_id: str, title: str):
         """
@@ -0,0 +1,255 @@
+"""
+会话运行时状态
+停止标志、活跃流登记、轮次锁保存在 Redis 中，由所有 uvicorn worker 共享：
+    session:lock:{session_id}     轮次锁，同一会话同一时间只允许一个生成中的轮次 (SET NX + TTL，生成期间续期)
+    session:stream:{session_id}   活跃流登记，值为正在生成的 worker
+    session:stop:{session_id}     停止标志，作为 pub/sub 消息丢失时的兜底
+停止请求通过 pub/sub 广播，持有该会话流的 worker 收到后立即打断生成循环
+Redis 不可用时退化为进程内状态（仅单 worker 有效），进程内的轮次同样按 turn_lock_ttl 过期
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional, TypeVar
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+from db.redis import HAS_REDIS, get_redis_client
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# 仅当锁仍由自己持有时才删除，避免误删其它 worker 在锁过期后重新获取的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SessionBusyError(Exception):
+    """会话已有正在生成中的轮次"""
+
+
+@dataclass
+class TurnHandle:
+    """一次生成轮次的句柄"""
+    session_id: str
+    token: str
+    cancelled: asyncio.Event = field(default_factory=asyncio.Event)
+    # 进程内模式下的过期时间（time.monotonic），生成期间随心跳续期
+    expires_at: float = 0.0
+    ended: bool = False
+
+
+class SessionRuntimeState:
+    """会话运行时状态"""
+
+    def __init__(self):
+        self.config = get_config().session_state
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.client = None
+        # 本 worker 上正在生成的轮次：session_id -> TurnHandle
+        self._turns: Dict[str, TurnHandle] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @property
+    def distributed(self) -> bool:
+        return self.client is not None
+
+    @staticmethod
+    def _lock_key(session_id: str) -> str:
+        return f"session:lock:{session_id}"
+
+    @staticmethod
+    def _stream_key(session_id: str) -> str:
+        return f"session:stream:{session_id}"
+
+    @staticmethod
+    def _stop_key(session_id: str) -> str:
+        return f"session:stop:{session_id}"
+
+    async def start(self) -> None:
+        """连接 Redis 并订阅停止频道；连接失败时使用进程内状态"""
+        if not HAS_REDIS:
+            logger.warning("未安装 Redis 库，会话状态仅在当前进程内有效")
+            return
+        try:
+            client = get_redis_client()
+            await client.ping()
+        except Exception as e:
+            logger.warning(f"Redis 不可用，会话状态仅在当前进程内有效: {e}")
+            return
+        self.client = client
+        self._listener_task = asyncio.create_task(self._listen())
+        logger.info(f"会话状态使用 Redis 共享 [worker: {self.worker_id}]")
+
+    async def stop(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self.client = None
+
+    async def _listen(self) -> None:
+        """订阅停止频道，收到消息后打断本 worker 上对应会话的生成；连接断开时自动重连"""
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.config.cancel_channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = message["data"]
+                    session_id = data.decode("utf-8") if isinstance(data, bytes) else data
+                    handle = self._turns.get(session_id)
+                    if handle:
+                        logger.info(f"收到停止生成消息: {session_id}")
+                        handle.cancelled.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"停止频道订阅异常，1 秒后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def begin_turn(self, session_id: str) -> TurnHandle:
+        """
+        开始一次生成轮次：获取轮次锁、清除旧的停止标志、登记活跃流
+        :raises SessionBusyError: 该会话已有生成中的轮次
+        """
+        ttl = self.config.turn_lock_ttl
+        handle = TurnHandle(session_id=session_id, token=uuid.uuid4().hex, expires_at=time.monotonic() + ttl)
+        if self.distributed:
+            acquired = await self.client.set(self._lock_key(session_id), handle.token, nx=True, ex=ttl)
+            if not acquired:
+                raise SessionBusyError(session_id)
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(self._stop_key(session_id))
+                pipe.set(self._stream_key(session_id), self.worker_id, ex=ttl)
+                await pipe.execute()
+        else:
+            current = self._turns.get(session_id)
+            if current is not None and time.monotonic() < current.expires_at:
+                raise SessionBusyError(session_id)
+            if current is not None:
+                logger.warning(f"会话 {session_id} 的轮次已过期未释放，重新获取")
+
+        self._turns[session_id] = handle
+        return handle
+
+    async def end_turn(self, handle: TurnHandle) -> None:
+        """结束生成轮次：释放轮次锁、注销活跃流；可重复调用，只有第一次生效"""
+        if handle.ended:
+            return
+        handle.ended = True
+        if self._turns.get(handle.session_id) is handle:
+            self._turns.pop(handle.session_id, None)
+        if not self.distributed:
+            return
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(handle.session_id), handle.token)
+                pipe.delete(self._stream_key(handle.session_id), self._stop_key(handle.session_id))
+                await pipe.execute()
+        except Exception as e:
+            # 锁带有 TTL，释放失败时最迟在过期后自动解除
+            logger.error(f"释放会话轮次锁失败: {handle.session_id}, {e}")
+
+    async def request_stop(self, session_id: str) -> bool:
+        """
+        请求停止会话的生成，不论生成发生在哪个 worker
+        :return: 当前是否有正在生成的轮次
+        """
+        handle = self._turns.get(session_id)
+        if handle:
+            handle.cancelled.set()
+        if not self.distributed:
+            return handle is not None
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self._stop_key(session_id), 1, ex=self.config.stop_flag_ttl)
+            pipe.publish(self.config.cancel_channel, session_id)
+            pipe.exists(self._stream_key(session_id))
+            _, _, active = await pipe.execute()
+        return handle is not None or bool(active)
+
+    async def is_generating(self, session_id: str) -> bool:
+        """会话当前是否有正在生成的轮次"""
+        if session_id in self._turns:
+            return True
+        if not self.distributed:
+            return False
+        return bool(await self.client.exists(self._stream_key(session_id)))
+
+    async def _heartbeat(self, handle: TurnHandle) -> None:
+        """续期轮次锁与活跃流登记，并检查停止标志（pub/sub 消息丢失时的兜底）"""
+        ttl = self.config.turn_lock_ttl
+        handle.expires_at = time.monotonic() + ttl
+        if not self.distributed:
+            return
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.expire(self._lock_key(handle.session_id), ttl)
+                pipe.expire(self._stream_key(handle.session_id), ttl)
+                pipe.exists(self._stop_key(handle.session_id))
+                _, _, stopped = await pipe.execute()
+        except Exception as e:
+            logger.error(f"会话轮次续期失败: {handle.session_id}, {e}")
+            return
+        if stopped:
+            handle.cancelled.set()
+
+    async def iterate(self, handle: TurnHandle, source: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        迭代生成流，收到停止请求时立即打断（不必等待下一个 chunk 到达），并关闭底层生成器
+        """
+        loop = asyncio.get_running_loop()
+        cancel_wait = asyncio.create_task(handle.cancelled.wait())
+        next_chunk: Optional[asyncio.Task] = None
+        last_heartbeat = loop.time()
+        try:
+            while not handle.cancelled.is_set():
+                if loop.time() - last_heartbeat >= self.config.poll_interval:
+                    await self._heartbeat(handle)
+                    last_heartbeat = loop.time()
+                    continue
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(source.__anext__())
+                done, _ = await asyncio.wait(
+                    {next_chunk, cancel_wait},
+                    timeout=self.config.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if next_chunk in done:
+                    task, next_chunk = next_chunk, None
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+            logger.info(f"会话 {handle.session_id} 的生成已停止")
+        finally:
+            cancel_wait.cancel()
+            if next_chunk is not None:
+                next_chunk.cancel()
+                try:
+                    await next_chunk
+                except (asyncio.CancelledError, Exception):
+                    pass
+            aclose = getattr(source, "aclose", None)
+            if aclose:
+                await aclose()
+
+
+# 全局会话运行时状态实例
+session_state = SessionRuntimeState()
@@ -0,0 +1,196 @@
+"""
+SSE 流式输出
+所有流式接口共用的事件发送器：
+    token 合并   相邻的文本增量事件在 flush_interval / max_batch_chars 窗口内合并为一帧，减少帧数与序列化开销
+    序列化       使用 orjson 直接输出 UTF-8 字节
+    心跳         空闲超过 heartbeat_interval 时发送 SSE 注释帧，写入失败即可发现客户端已断开
+    背压         生成端与发送端之间为有界队列，客户端持续不消费超过 send_timeout 时停止生成；
+                 客户端断开时关闭底层生成器，不再继续运行工作流
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+import orjson
+from starlette.requests import Request
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+
+logger = get_logger(__name__)
+
+DONE_FRAME = b"data: [DONE]\n\n"
+HEARTBEAT_FRAME = b": ping\n\n"
+
+_END = object()
+_IDLE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def encode_event(event: Any) -> bytes:
+    """编码为一个 SSE data 帧"""
+    payload = orjson.dumps(event, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return b"data: " + payload + b"\n\n"
+
+
+def workflow_text_field(event: dict) -> Optional[str]:
+    """工作流事件中 llm_stream 的文本字段"""
+    return "data" if event.get("event") == "llm_stream" else None
+
+
+def agent_text_field(event: dict) -> Optional[str]:
+    """Agent 对话事件中 ai_message 的文本字段"""
+    return "ai_message" if "ai_message" in event else None
+
+
+class SSEStreamer:
+    """把事件生成器转换为 SSE 字节流"""
+
+    def __init__(self):
+        self.config = get_config().sse
+
+    async def _produce(self, source: AsyncIterator[Any], queue: asyncio.Queue) -> None:
+        """在独立任务中拉取事件放入有界队列；队列持续已满说明客户端消费过慢，停止生成"""
+        try:
+            async for event in source:
+                try:
+                    await asyncio.wait_for(queue.put(event), timeout=self.config.send_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"客户端 {self.config.send_timeout}s 内未消费数据，停止生成")
+                    return
+            item = _END
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            item = _Failure(e)
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose:
+                await aclose()
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # 发送端读空队列后会发现生成任务已结束
+            pass
+
+    async def stream(
+        self,
+        source: AsyncIterator[Any],
+        *,
+        text_field: Optional[Callable[[dict], Optional[str]]] = None,
+        request: Optional[Request] = None,
+        done: bool = True,
+    ) -> AsyncIterator[bytes]:
+        """
+        :param source: 事件生成器，事件为可 JSON 序列化的对象
+        :param text_field: 返回事件中可合并的文本字段名，返回 None 的事件不合并
+        :param request: 传入时在心跳周期检查客户端是否已断开
+        :param done: 正常结束时是否发送 [DONE] 帧
+        """
+        config = self.config
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.max_queue)
+        producer = asyncio.create_task(self._produce(source, queue))
+
+        pending: Optional[dict] = None
+        pending_field: Optional[str] = None
+        pending_since = 0.0
+        last_write = loop.time()
+        frames: List[bytes] = []
+
+        def flush_pending():
+            nonlocal pending
+            if pending is not None:
+                frames.append(encode_event(pending))
+                pending = None
+
+        def add(event: Any):
+            nonlocal pending, pending_field, pending_since
+            field = text_field(event) if text_field and isinstance(event, dict) else None
+            if pending is not None and field == pending_field and _mergeable(pending, event, field):
+                pending[field] += event[field]
+            else:
+                flush_pending()
+                if field and isinstance(event.get(field), str):
+                    pending, pending_field, pending_since = dict(event), field, loop.time()
+                else:
+                    frames.append(encode_event(event))
+            if pending is not None and len(pending[pending_field]) >= config.max_batch_chars:
+                flush_pending()
+
+        try:
+            while True:
+                now = loop.time()
+                deadline = last_write + config.heartbeat_interval
+                if pending is not None:
+                    deadline = min(deadline, pending_since + config.flush_interval)
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - now))
+                except asyncio.TimeoutError:
+                    item = _IDLE
+
+                finished = False
+                failure: Optional[_Failure] = None
+                if item is not _IDLE:
+                    # 一次取出队列中已就绪的全部事件，合并后一次写出
+                    while True:
+                        if item is _END:
+                            finished = True
+                            break
+                        if isinstance(item, _Failure):
+                            failure = item
+                            break
+                        add(item)
+                        if queue.empty():
+                            break
+                        item = queue.get_nowait()
+
+                now = loop.time()
+                if pending is not None and (finished or failure or now - pending_since >= config.flush_interval):
+                    flush_pending()
+                if finished and done:
+                    frames.append(DONE_FRAME)
+                if frames:
+                    yield b"".join(frames)
+                    frames.clear()
+                    last_write = loop.time()
+                elif now - last_write >= config.heartbeat_interval:
+                    if request is not None and await request.is_disconnected():
+                        logger.info("客户端已断开，停止生成")
+                        return
+                    yield HEARTBEAT_FRAME
+                    last_write = loop.time()
+
+                if failure:
+                    raise failure.error
+                if finished or (producer.done() and queue.empty()):
+                    return
+        finally:
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+
+def _mergeable(pending: dict, event: Any, field: Optional[str]) -> bool:
+    """同一文本字段、其余字段完全相同的两个事件可以合并"""
+    if not field or not isinstance(event, dict) or not isinstance(event.get(field), str):
+        return False
+    if pending.keys() != event.keys():
+        return False
+    return all(pending[k] == event[k] for k in event if k != field)
+
+
+_streamer: Optional[SSEStreamer] = None
+
+
+def get_sse_streamer() -> SSEStreamer:
+    global _streamer
+    if _streamer is None:
+        _streamer = SSEStreamer()
+    return _streamer
@@ -0,0 +1,414 @@
+"""
+工作流链路追踪
+为工作流节点、LLM 调用与工具调用记录结构化 span：
+    wall_ms:   执行耗时
+    queue_ms:  等待调度耗时（节点为上一个节点结束到本节点开始的间隔，包含 checkpoint 读写等开销）
+    tokens_in / tokens_out: LLM 调用消耗的 token 数
+    cache_hit: 是否命中缓存
+span 可以导出到本地 JSON 文件（jsonl）或 OTLP collector，并在内存中聚合，供 /api/system/metrics 查询
+"""
+import contextvars
+import functools
+import inspect
+import json
+import queue
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+
+logger = get_logger(__name__)
+
+# 当前工作流轮次的 trace_id，由 process.run_workflow / stream_workflow 设置，随协程上下文传递
+_current_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+
+@dataclass
+class Span:
+    """一次节点 / LLM / 工具调用的记录"""
+    name: str
+    kind: str  # node / llm / tool
+    trace_id: Optional[str]
+    start_time: float
+    end_time: float = 0.0
+    wall_ms: float = 0.0
+    queue_ms: float = 0.0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    cache_hit: Optional[bool] = None
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class JsonFileSpanExporter:
+    """
+    将 span 以 jsonl 形式写入本地文件，写入在后台线程中完成，不阻塞事件循环
+    文件超过 max_bytes 时轮转为 .1 ~ .N，写入队列有上限，写盘跟不上时丢弃新的 span
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, queue_size: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="span-json-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"span 导出队列已满，已丢弃 {self.dropped} 个 span")
+
+    def _rotate(self) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def _run(self) -> None:
+        f = open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+                if self.max_bytes > 0 and f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+        finally:
+            f.close()
+
+    def shutdown(self) -> None:
+        # 队列满时不阻塞退出，后台线程是守护线程
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+
+
+class OTLPSpanExporter:
+    """通过 opentelemetry SDK 将 span 导出到 OTLP collector"""
+
+    def __init__(self, endpoint: str, service_name: str):
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter as _GrpcExporter
+
+        self._provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        self._provider.add_span_processor(BatchSpanProcessor(_GrpcExporter(endpoint=endpoint, insecure=True)))
+        self._tracer = self._provider.get_tracer(__name__)
+
+    def export(self, span: Span) -> None:
+        attributes = {
+            "span.kind": span.kind,
+            "trace_id": span.trace_id or "",
+            "wall_ms": span.wall_ms,
+            "queue_ms": span.queue_ms,
+            "tokens_in": span.tokens_in,
+            "tokens_out": span.tokens_out,
+        }
+        if span.cache_hit is not None:
+            attributes["cache_hit"] = span.cache_hit
+        if span.error:
+            attributes["error"] = span.error
+        attributes.update({k: str(v) for k, v in span.attributes.items()})
+        otel_span = self._tracer.start_span(span.name, start_time=int(span.start_time * 1e9), attributes=attributes)
+        otel_span.end(end_time=int(span.end_time * 1e9))
+
+    def shutdown(self) -> None:
+        self._provider.shutdown()
+
+
+class Tracer:
+    """span 的记录、聚合与导出"""
+
+    def __init__(self):
+        self.config = get_config().tracing
+        self.enabled = self.config.enabled
+        self._exporter = self._create_exporter() if self.enabled else None
+        # 按 span 名称聚合：最近 N 次耗时样本 + 累计计数
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.config.sample_size))
+        self._totals: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+            "kind": "", "count": 0, "errors": 0, "wall_ms": 0.0, "queue_ms": 0.0,
+            "tokens_in": 0, "tokens_out": 0, "cache_hits": 0, "cache_lookups": 0,
+        })
+        self._recent: Deque[Span] = deque(maxlen=self.config.sample_size)
+        # trace_id -> 最近一个节点的结束时间，用于计算节点的等待调度耗时
+        self._trace_last_end: Dict[str, float] = {}
+        self._trace_start: Dict[str, float] = {}
+
+    def _create_exporter(self):
+        exporter = self.config.exporter
+        if exporter == "otlp":
+            try:
+                return OTLPSpanExporter(self.config.otlp_endpoint, self.config.service_name)
+            except ImportError as e:
+                logger.warning(f"未安装 opentelemetry OTLP 导出依赖({e})，改为导出到 JSON 文件")
+                exporter = "json"
+        if exporter == "json":
+            return JsonFileSpanExporter(
+                self.config.json_path,
+                max_bytes=self.config.json_max_bytes,
+                backup_count=self.config.json_backup_count,
+                queue_size=self.config.export_queue_size,
+            )
+        return None
+
+    @contextmanager
+    def trace(self, session_id: str):
+        """标记一轮工作流执行，期间产生的 span 共享同一个 trace_id"""
+        trace_id = f"{session_id}:{uuid.uuid4().hex[:8]}"
+        token = _current_trace_id.set(trace_id)
+        self._trace_start[trace_id] = time.time()
+        try:
+            yield trace_id
+        finally:
+            try:
+                _current_trace_id.reset(token)
+            except ValueError:
+                # 流式生成器可能在其它上下文中被关闭
+                pass
+            self._trace_start.pop(trace_id, None)
+            self._trace_last_end.pop(trace_id, None)
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        return _current_trace_id.get()
+
+    def record(self, span: Span) -> None:
+        """记录一个已结束的 span"""
+        if not self.enabled:
+            return
+        if not span.end_time:
+            span.end_time = time.time()
+        span.wall_ms = (span.end_time - span.start_time) * 1000
+
+        totals = self._totals[span.name]
+        totals["kind"] = span.kind
+        totals["count"] += 1
+        totals["wall_ms"] += span.wall_ms
+        totals["queue_ms"] += span.queue_ms
+        totals["tokens_in"] += span.tokens_in
+        totals["tokens_out"] += span.tokens_out
+        if span.error:
+            totals["errors"] += 1
+        if span.cache_hit is not None:
+            totals["cache_lookups"] += 1
+            totals["cache_hits"] += int(span.cache_hit)
+        self._samples[span.name].append(span.wall_ms)
+        self._recent.append(span)
+
+        if self._exporter is not None:
+            try:
+                self._exporter.export(span)
+            except Exception as e:
+                logger.warning(f"span 导出失败: {e}")
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes):
+        """以上下文管理器的方式记录 span，调用方可在过程中修改 span 的字段"""
+        span = Span(name=name, kind=kind, trace_id=self.current_trace_id(), start_time=time.time(), attributes=attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            self.record(span)
+
+    def _node_queue_ms(self, trace_id: Optional[str], start_time: float) -> float:
+        if not trace_id:
+            return 0.0
+        ready_time = self._trace_last_end.get(trace_id) or self._trace_start.get(trace_id)
+        if not ready_time or start_time < ready_time:
+            return 0.0
+        return (start_time - ready_time) * 1000
+
+    def trace_node(self, name: str, func: Callable) -> Callable:
+        """包装图节点函数，保留原函数签名（LangGraph 根据签名决定是否注入 config）"""
+
+        def _finish(span: Span):
+            span.end_time = time.time()
+            if span.trace_id:
+                self._trace_last_end[span.trace_id] = max(self._trace_last_end.get(span.trace_id, 0.0), span.end_time)
+            self.record(span)
+
+        def _start() -> Span:
+            trace_id = self.current_trace_id()
+            start_time = time.time()
+            return Span(name=f"node:{name}", kind="node", trace_id=trace_id, start_time=start_time,
+                        queue_ms=self._node_queue_ms(trace_id, start_time))
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                span = _start()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    span.error = repr(e)
+                    raise
+                finally:
+                    _finish(span)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            span = _start()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                span.error = repr(e)
+                raise
+            finally:
+                _finish(span)
+        return sync_wrapper
+
+    def summary(self) -> Dict[str, Any]:
+        """按 span 名称汇总耗时分位数、token 与缓存命中情况"""
+        result = {}
+        for name, totals in self._totals.items():
+            samples = sorted(self._samples[name])
+            count = totals["count"]
+            item = {
+                "kind": totals["kind"],
+                "count": count,
+                "errors": totals["errors"],
+                "avg_ms": round(totals["wall_ms"] / count, 3) if count else 0.0,
+                "avg_queue_ms": round(totals["queue_ms"] / count, 3) if count else 0.0,
+                "tokens_in": totals["tokens_in"],
+                "tokens_out": totals["tokens_out"],
+            }
+            if samples:
+                item["p50_ms"] = round(statistics.median(samples), 3)
+                item["p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)
+                item["p99_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3)
+            if totals["cache_lookups"]:
+                item["cache_hit_rate"] = round(totals["cache_hits"] / totals["cache_lookups"], 4)
+            result[name] = item
+        return result
+
+    def recent_spans(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return [asdict(span) for span in list(self._recent)[-limit:]]
+
+    def shutdown(self) -> None:
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+
+class TracingCallbackHandler(AsyncCallbackHandler):
+    """
+    LangChain 回调：为 LLM 与工具调用记录 span
+    通过 graph 调用的 config["callbacks"] 传入，会自动传递给节点内部的 Agent 调用
+    """
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Span] = {}
+
+    def _start(self, run_id: UUID, name: str, kind: str, metadata: Optional[Dict[str, Any]]) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        attributes = {"node": node} if node else {}
+        self._spans[run_id] = Span(name=name, kind=kind, trace_id=self.tracer.current_trace_id(),
+                                   start_time=time.time(), attributes=attributes)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return None
+        if error is not None:
+            span.error = repr(error)
+        span.end_time = time.time()
+        return span
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model = (serialized or {}).get("kwargs", {}).get("model") or (serialized or {}).get("name", "llm")
+        self._start(run_id, f"llm:{model}", "llm", metadata)
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, f"llm:{(serialized or {}).get('name', 'llm')}", "llm", metadata)
+
+    async def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is not None and "ttft_ms" not in span.attributes:
+            span.attributes["ttft_ms"] = round((time.time() - span.start_time) * 1000, 3)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._end(run_id)
+        if span is None:
+            return
+        tokens_in = tokens_out = 0
+        for generations in response.generations or []:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    tokens_in += usage.get("input_tokens", 0)
+                    tokens_out += usage.get("output_tokens", 0)
+        if not tokens_in and not tokens_out:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            tokens_in = usage.get("prompt_tokens", 0)
+            tokens_out = usage.get("completion_tokens", 0)
+        span.tokens_in, span.tokens_out = tokens_in, tokens_out
+        self.tracer.record(span)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._end(run_id, error)
+        if span is not None:
+            self.tracer.record(span)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, f"tool:{(serialized or {}).get('name', 'tool')}", "tool", metadata)
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._end(run_id)
+        if span is not None:
+            self.tracer.record(span)
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        span = self._end(run_id, error)
+        if span is not None:
+            self.tracer.record(span)
+
+
+# 全局 tracer 实例
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取全局 tracer 实例"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def shutdown_tracer() -> None:
+    """关闭 tracer，刷新未导出的 span（应用退出时调用）"""
+    if _tracer is not None:
+        _tracer.shutdown()
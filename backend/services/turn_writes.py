@@ -0,0 +1,104 @@
+"""
+单轮对话的持久化写入
+一轮对话要写的数据（自动创建会话、生成的标题、本轮对话记录、长期摘要）先在工作流状态中累积，
+由 memory_summary 在轮次结束时放在同一个事务中写入：
+    conversation_history  INSERT 本轮对话，主键为 turn_id，ON CONFLICT DO NOTHING
+    sessions              INSERT ... ON CONFLICT (id) DO UPDATE，会话不存在时创建，同时更新标题与列表展示用的冗余字段
+    session_summaries     INSERT ... ON CONFLICT (session_id) DO UPDATE
+每轮只提交一次事务。轮次中途失败时，标题等待写入项保留在检查点中，下一轮一并写入；
+续跑中断的运行会重新执行 memory_summary，turn_id 不变，对话记录不会重复插入，消息数也不会重复累加
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from config.loguru_config import get_logger
+from db.db_models import ConversationHistory, Session, SessionSummary
+
+logger = get_logger(__name__)
+
+# 会话列表中最后一条消息的预览长度
+LAST_MESSAGE_PREVIEW_CHARS = 200
+DEFAULT_SESSION_TITLE = "New Session"
+
+
+def merge_pending_writes(left: Optional[dict], right: Optional[dict]) -> dict:
+    """OverAllState.pending_writes 的合并函数；并行节点各自写入不同的键，写入 None 表示已落库、清空"""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
+
+
+@dataclass
+class TurnWrites:
+    """一轮对话待写入的数据"""
+    turn_id: str
+    session_id: str
+    user_id: str
+    user_input: str
+    agent_output: str
+    turn_time: datetime
+    # 本轮生成的会话标题，None 表示不修改
+    title: Optional[str] = None
+    # 更新后的长期摘要，None 表示不修改
+    summary: Optional[str] = None
+
+    async def flush(self) -> None:
+        """在一个事务中写入全部数据"""
+        from db.database import SessionLocal
+
+        async with SessionLocal() as db:
+            async with db.begin():
+                result = await db.execute(
+                    insert(ConversationHistory)
+                    .values(
+                        id=self.turn_id,
+                        session_id=self.session_id,
+                        user_id=self.user_id,
+                        user_input=self.user_input,
+                        agent_output=self.agent_output,
+                        created_at=self.turn_time,
+                    )
+                    .on_conflict_do_nothing(index_elements=[ConversationHistory.id])
+                    .returning(ConversationHistory.id)
+                )
+                inserted = result.first() is not None
+                await db.execute(self._session_upsert(inserted))
+                if self.summary is not None:
+                    await db.execute(
+                        insert(SessionSummary)
+                        .values(id=str(uuid.uuid4()), session_id=self.session_id, user_id=self.user_id, summary=self.summary)
+                        .on_conflict_do_update(
+                            index_elements=[SessionSummary.session_id],
+                            set_={"summary": self.summary, "updated_at": func.now()},
+                        )
+                    )
+        logger.info(f"会话 {self.session_id} 本轮数据写入完成 (标题: {self.title is not None}, 摘要: {self.summary is not None})")
+
+    def _session_upsert(self, counted: bool):
+        """:param counted: 本轮对话记录是否为新插入，重复写入时不再累加消息数"""
+        messages = 2 if counted else 0  # 用户消息 + 回复
+        stmt = insert(Session).values(
+            id=self.session_id,
+            user_id=self.user_id,
+            title=self.title or DEFAULT_SESSION_TITLE,
+            conversation_status="active",
+            last_message=(self.agent_output or "")[:LAST_MESSAGE_PREVIEW_CHARS],
+            last_message_time=self.turn_time,
+            message_count=messages,
+            updated_at=self.turn_time,
+        )
+        # 会话已存在时增量更新会话列表展示用的冗余字段，列表接口无需再聚合历史表
+        set_ = {
+            "last_message": stmt.excluded.last_message,
+            "last_message_time": stmt.excluded.last_message_time,
+            "message_count": func.coalesce(Session.message_count, 0) + messages,
+            "updated_at": stmt.excluded.updated_at,
+        }
+        if self.title is not None:
+            set_["title"] = stmt.excluded.title
+        return stmt.on_conflict_do_update(index_elements=[Session.id], set_=set_)
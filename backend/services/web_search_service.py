@@ -0,0 +1,171 @@
+"""
+Web搜索服务
+对Tavily搜索进行统一封装，供工作流节点与Agent工具共享：
+1、按规范化后的query做TTL缓存，相同问题在有效期内不再请求上游
+2、相同query的并发请求合并为一次上游调用（single-flight）
+3、复用全局HTTP连接池，不再每次执行节点都创建新的Tavily客户端
+4、按租户（用户）做令牌桶限流，避免突发流量打满Tavily配额
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from config.loader import get_config
+from config.loguru_config import get_logger
+from services.http_client import AsyncHTTPClient
+from services.tracing import get_tracer
+
+logger = get_logger(__name__)
+
+
+class TokenBucketRateLimiter:
+    """
+    令牌桶限流器，按key（租户）隔离
+    令牌不足时挂起等待，而不是直接拒绝请求
+    空闲超过补满时间的桶与新桶等价，由 TTLCache 淘汰，避免按租户无限增长
+    """
+
+    def __init__(self, rate_per_minute: int, burst: int, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60.0  # 每秒补充的令牌数
+        self.capacity = max(1, burst)
+        ttl = max(60.0, self.capacity / self.rate) if self.rate > 0 else 60.0
+        # key -> [当前令牌数, 上次补充时间, 锁]
+        self._buckets: TTLCache = TTLCache(maxsize=max_keys, ttl=ttl)
+
+    async def acquire(self, key: str) -> None:
+        """获取一个令牌，令牌不足时等待"""
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.capacity), time.monotonic(), asyncio.Lock()]
+        # 重新写入以刷新过期时间
+        self._buckets[key] = bucket
+        async with bucket[2]:
+            while True:
+                now = time.monotonic()
+                tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if tokens >= 1:
+                    bucket[0] = tokens - 1
+                    return
+                bucket[0] = tokens
+                await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class WebSearchService:
+    """Web搜索服务类"""
+
+    def __init__(self):
+        self.config = get_config()
+        self.search_config = self.config.web_search
+        # 复用全局HTTP连接池
+        self.client = AsyncHTTPClient(base_url=self.search_config.base_url)
+        self._cache: TTLCache = TTLCache(
+            maxsize=self.search_config.cache_max_size,
+            ttl=self.search_config.cache_ttl,
+        )
+        # 正在进行中的上游请求：规范化query -> Task
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._rate_limiter = TokenBucketRateLimiter(
+            rate_per_minute=self.search_config.rate_limit_per_minute,
+            burst=self.search_config.rate_limit_burst,
+        )
+        self._stats = {"cache_hits": 0, "coalesced": 0, "upstream_calls": 0, "upstream_errors": 0}
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """规范化query：全半角统一、小写、合并空白"""
+        query = unicodedata.normalize("NFKC", query or "")
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    async def search(self, query: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行Web搜索
+        :param query: 查询语句
+        :param tenant_id: 租户ID（通常为user_id），用于限流隔离
+        :return: Tavily返回的搜索结果
+        """
+        key = self._normalize_query(query)
+
+        with get_tracer().span("tool:web_search", kind="tool") as span:
+            cached = self._cache.get(key)
+            span.cache_hit = cached is not None
+            if cached is not None:
+                self._stats["cache_hits"] += 1
+                logger.debug(f"Web搜索命中缓存: {key}")
+                return cached
+
+            # 每个调用方都按自己的租户限流，包括合并到进行中请求的调用方
+            await self._rate_limiter.acquire(tenant_id or "default")
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._stats["cache_hits"] += 1
+                span.cache_hit = True
+                return cached
+
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._fetch(key, query))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done: self._on_fetch_done(key, done))
+            else:
+                self._stats["coalesced"] += 1
+                span.attributes["coalesced"] = True
+                logger.debug(f"Web搜索合并并发请求: {key}")
+
+            # shield：单个调用方被取消时，不影响其它等待同一结果的调用方
+            return await asyncio.shield(task)
+
+    def _on_fetch_done(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 所有等待方都已取消时仍取回异常，避免 asyncio 报告未处理的任务异常
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, key: str, query: str) -> Dict[str, Any]:
+        """请求Tavily上游并写入缓存"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config.tavily_api_key}",
+        }
+        request_body = {
+            "query": query,
+            "max_results": self.search_config.max_results,
+        }
+
+        self._stats["upstream_calls"] += 1
+        start_time = time.time()
+        try:
+            # 搜索是只读查询，可以安全重试
+            response = await self.client.post("/search", headers=headers, json=request_body, idempotent=True)
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            self._stats["upstream_errors"] += 1
+            logger.error(f"Tavily搜索失败: {e}")
+            raise
+
+        logger.info(f"Tavily搜索完成，耗时: {time.time() - start_time:.3f} 秒")
+        self._cache[key] = result
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取缓存与合并统计信息"""
+        return {**self._stats, "cache_size": len(self._cache), "inflight": len(self._inflight)}
+
+
+# 全局Web搜索服务实例
+_web_search_service: Optional[WebSearchService] = None
+
+
+def get_web_search_service() -> WebSearchService:
+    """获取Web搜索服务实例"""
+    global _web_search_service
+    if _web_search_service is None:
+        _web_search_service = WebSearchService()
+    return _web_search_service
@@ -3,6 +3,7 @@ from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 import aiosqlite
 from pathlib import Path
 from config.loader import get_config
+from services.http_client import get_http_client
 config = get_config()
 
 async def get_agent(system_prompt: str, llm_type: str = "standard"):
@@ -21,6 +22,10 @@ async def get_agent(system_prompt: str, llm_type: str = "standard"):
     else:
         target_config = config.llm
 
+    # 共用全局 HTTP 客户端（按主机连接池、熔断与耗时统计）；
+    # LLM 主机的 POST 在传输层按幂等请求重试（5xx、读超时），关闭 SDK 自带重试以免重试次数叠加
+    client_kwargs = {"http_async_client": await get_http_client(), "max_retries": 0}
+
     # 根据 provider 选择不同的 Chat 模型类
     # 注意：这里假设 config 中有 provider 字段，或者根据实际情况调整
     # 之前代码写死用 ChatDeepSeek，但 lite-llm 可能是 OpenAI 格式
@@ -30,7 +35,8 @@ async def get_agent(system_prompt: str, llm_type: str = "standard"):
             model=target_config.model,
             api_key=target_config.api_key,
             base_url=target_config.base_url,
-            temperature=target_config.temperature
+            temperature=target_config.temperature,
+            **client_kwargs
         )
     else:
         # 默认使用 OpenAI 兼容客户端 (适用于 dashscope/openai/其他)
@@ -45,7 +51,8 @@ async def get_agent(system_prompt: str, llm_type: str = "standard"):
             api_key=target_config.api_key,
             base_url=target_config.base_url,
             temperature=target_config.temperature,
-            **openai_kwargs
+            **openai_kwargs,
+            **client_kwargs
         )
     
     # 确保存储路径存在
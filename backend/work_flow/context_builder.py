@@ -0,0 +1,283 @@
+"""
+上下文构建器 - 按 token 预算组装 llm_response 的 Prompt 上下文
+
+1、使用目标模型的 tokenizer 计算 token 数（tiktoken 不识别的模型退回 cl100k_base）
+2、对 RAG / Web 检索片段去重，内容高度重叠的片段只保留得分更高的一条
+3、先为长期记忆与最近对话分配预算，剩余预算按得分在 RAG / Web 片段之间分配
+4、超出预算的内容按 token 截断，相同输入总是得到相同输出
+"""
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config.loader import get_config
+from config.models import ContextBudgetConfig
+from config.loguru_config import get_logger
+
+logger = get_logger(__name__)
+
+RAG_SOURCE = "rag"
+WEB_SOURCE = "web"
+
+
+class TokenCounter:
+    """基于 tiktoken 的 token 计数器，未安装 tiktoken 或无法加载编码时按字符数估算"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        try:
+            import tiktoken
+        except ImportError:
+            logger.warning("未安装 tiktoken，使用字符数估算 token")
+            return
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # 首次使用时 tiktoken 需要下载 BPE 文件，离线或被防火墙拦截时会失败
+            logger.warning(f"加载 tiktoken 编码失败，使用字符数估算 token: {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return len(text)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断文本，使其不超过 max_tokens 个 token"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is None:
+            return text[:max_tokens]
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        # 解码时丢弃被截断的多字节字符
+        return self._encoding.decode(tokens[:max_tokens]).rstrip("�")
+
+
+@dataclass
+class Passage:
+    """检索得到的上下文片段"""
+    source: str
+    text: str
+    score: float = 0.0
+    title: str = ""
+    order: int = 0
+
+
+@dataclass
+class BuiltContext:
+    """构建完成的 Prompt 上下文"""
+    memory_summary: str
+    recent_history: str
+    context: str
+    metrics: Dict[str, Any] = field(default_factory=dict)
+
+
+class ContextBuilder:
+    """按 token 预算组装 Prompt 上下文"""
+
+    def __init__(self, model: Optional[str] = None, budget_config: Optional[ContextBudgetConfig] = None):
+        config = get_config()
+        self.budget_config = budget_config or config.context_budget
+        self.counter = TokenCounter(model or config.llm.model)
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> set:
+        """字符级 n-gram，兼顾中文与英文文本"""
+        compact = re.sub(r"\s+", "", text.lower())
+        if len(compact) <= size:
+            return {compact} if compact else set()
+        return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+    def _deduplicate(self, passages: List[Passage]) -> Tuple[List[Passage], int]:
+        """
+        去除重叠片段：两个片段 n-gram 的包含度超过阈值时，视为重复
+        passages 需已按得分降序排列，保证保留下来的是得分更高的片段
+        """
+        kept: List[Tuple[Passage, set]] = []
+        dropped = 0
+        for passage in passages:
+            shingles = self._shingles(passage.text)
+            if not shingles:
+                dropped += 1
+                continue
+            duplicate = False
+            for _, kept_shingles in kept:
+                overlap = len(shingles & kept_shingles) / min(len(shingles), len(kept_shingles))
+                if overlap >= self.budget_config.dedup_threshold:
+                    duplicate = True
+                    break
+            if duplicate:
+                dropped += 1
+                continue
+            kept.append((passage, shingles))
+        return [p for p, _ in kept], dropped
+
+    @staticmethod
+    def _normalize_scores(passages: List[Passage]) -> None:
+        """
+        各来源的得分量纲不同（RRF 得分约为 0.01 量级，Tavily 得分为 0~1），
+        按来源内最大值归一化后再统一排序；没有得分的片段按原始顺序递减
+        """
+        by_source: Dict[str, List[Passage]] = {}
+        for passage in passages:
+            by_source.setdefault(passage.source, []).append(passage)
+        for items in by_source.values():
+            max_score = max((p.score for p in items), default=0.0)
+            for p in items:
+                if max_score > 0:
+                    p.score = p.score / max_score
+                else:
+                    p.score = 1.0 / (1 + p.order)
+
+    @staticmethod
+    def _format_turn(index: int, turn: Sequence[str]) -> str:
+        q, a = turn
+        return f"轮次 {index}:\n用户: {q}\n助手: {a}\n\n"
+
+    def _build_memory(self, memory_summary: str, history: List[Sequence[str]], budget: int) -> Tuple[str, str, int]:
+        """长期记忆最多占记忆预算的一半，其余留给最近对话（从最新一轮开始保留）"""
+        summary_budget = budget // 2 if history else budget
+        summary = self.counter.truncate(memory_summary or "", summary_budget)
+        used = self.counter.count(summary)
+
+        kept_turns: List[Tuple[int, Sequence[str]]] = []
+        for index in range(len(history) - 1, -1, -1):
+            cost = self.counter.count(self._format_turn(index + 1, history[index]))
+            if used + cost > budget:
+                break
+            kept_turns.append((index, history[index]))
+            used += cost
+        kept_turns.reverse()
+        recent_history = "".join(self._format_turn(i + 1, turn) for i, turn in kept_turns)
+        return summary, recent_history, used
+
+    def _format_passage(self, index: int, passage: Passage) -> str:
+        if passage.source == WEB_SOURCE and passage.title:
+            return f"来源 {index}（{passage.title}）:\n{passage.text}\n\n"
+        return f"来源 {index}:\n{passage.text}\n\n"
+
+    def build(
+        self,
+        template: str,
+        user_input: str,
+        memory_summary: str,
+        conversation_history: List[Sequence[str]],
+        passages: List[Passage],
+        include_rag: bool,
+        include_web: bool,
+    ) -> BuiltContext:
+        """
+        组装上下文
+        :param template: Prompt 模板，用于扣除模板自身占用的 token
+        :param passages: RAG 与 Web 检索片段
+        :param include_rag: 本轮是否执行了 RAG 检索
+        :param include_web: 本轮是否执行了 Web 检索
+        """
+        fixed_tokens = self.counter.count(template) + self.counter.count(user_input)
+        budget = max(0, self.budget_config.max_prompt_tokens - fixed_tokens)
+
+        # 1. 记忆部分
+        memory_budget = int(budget * self.budget_config.memory_ratio)
+        summary, recent_history, memory_tokens = self._build_memory(
+            memory_summary, conversation_history or [], memory_budget
+        )
+
+        # 2. 检索部分：剩余预算（包括记忆未用完的部分）按得分分配
+        remaining = budget - memory_tokens
+        passages_in = len(passages)
+        self._normalize_scores(passages)
+        ordered = sorted(passages, key=lambda p: (-p.score, p.source, p.order))
+        ordered, duplicates = self._deduplicate(ordered)
+
+        selected: Dict[str, List[Passage]] = {RAG_SOURCE: [], WEB_SOURCE: []}
+        section_tokens = {RAG_SOURCE: 0, WEB_SOURCE: 0}
+        truncated = 0
+        for passage in ordered:
+            if remaining < self.budget_config.min_passage_tokens:
+                break
+            index = len(selected[passage.source]) + 1
+            cost = self.counter.count(self._format_passage(index, passage))
+            if cost > remaining:
+                overhead = cost - self.counter.count(passage.text)
+                text = self.counter.truncate(passage.text, remaining - overhead)
+                if not text:
+                    break
+                # 截断到副本上，不修改调用方传入的片段
+                passage = replace(passage, text=text)
+                cost = self.counter.count(self._format_passage(index, passage))
+                if cost > remaining:
+                    break
+                truncated += 1
+            selected[passage.source].append(passage)
+            section_tokens[passage.source] += cost
+            remaining -= cost
+
+        # 3. 拼接各段
+        context_parts = []
+        if include_rag:
+            rag_text = "".join(self._format_passage(i + 1, p) for i, p in enumerate(selected[RAG_SOURCE]))
+            context_parts.append(f"【本地知识库检索结果】\n{rag_text or '未找到相关本地知识。'}")
+        if include_web:
+            web_text = "".join(self._format_passage(i + 1, p) for i, p in enumerate(selected[WEB_SOURCE]))
+            context_parts.append(f"【互联网搜索结果】\n{web_text or '未找到相关网络信息。'}")
+        context = "\n\n".join(context_parts) if context_parts else "未执行检索，请基于现有知识回答。"
+
+        metrics = {
+            "budget_tokens": budget,
+            "fixed_tokens": fixed_tokens,
+            "memory_tokens": memory_tokens,
+            "rag_tokens": section_tokens[RAG_SOURCE],
+            "web_tokens": section_tokens[WEB_SOURCE],
+            "prompt_tokens": fixed_tokens + memory_tokens + sum(section_tokens.values()),
+            "passages_in": passages_in,
+            "passages_kept": len(selected[RAG_SOURCE]) + len(selected[WEB_SOURCE]),
+            "duplicates_dropped": duplicates,
+            "passages_truncated": truncated,
+        }
+        return BuiltContext(
+            memory_summary=summary or "无",
+            recent_history=recent_history or "无",
+            context=context,
+            metrics=metrics,
+        )
+
+
+def rag_hits_to_passages(rag_hits: Optional[List[Dict[str, Any]]]) -> List[Passage]:
+    """将 knowledge_service.search_content 的单个 query 结果转换为片段"""
+    return [
+        Passage(source=RAG_SOURCE, text=hit.get("text") or "", score=hit.get("score") or 0.0,
+                title=hit.get("file_name") or "", order=i)
+        for i, hit in enumerate(rag_hits or [])
+    ]
+
+
+def web_results_to_passages(web_output: Any) -> List[Passage]:
+    """将 Tavily 的搜索结果转换为片段，兼容旧版字符串形式的输出"""
+    if not web_output:
+        return []
+    if isinstance(web_output, str):
+        return [Passage(source=WEB_SOURCE, text=web_output, score=1.0)]
+    results = web_output.get("results", []) if isinstance(web_output, dict) else []
+    return [
+        Passage(source=WEB_SOURCE, text=item.get("content") or "", score=item.get("score") or 0.0,
+                title=item.get("title") or "", order=i)
+        for i, item in enumerate(results)
+    ]
+
+
+_context_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """获取全局上下文构建器（tokenizer 加载一次后复用）"""
+    global _context_builder
+    if _context_builder is None:
+        _context_builder = ContextBuilder()
+    return _context_builder
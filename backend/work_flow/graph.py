@@ -1,10 +1,15 @@
-from typing import Literal
+import time
+from typing import Any, Callable, Dict, Literal, Tuple
 
 from langgraph.constants import START
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+
 from work_flow.state import OverAllState
 from work_flow import node
+from config.loguru_config import get_logger
+from services.tracing import get_tracer
+
+logger = get_logger(__name__)
 
 # 条件边的路由函数
 def route_condition(state: OverAllState) -> Literal["mix", "rag", "tavily"]:
@@ -19,16 +24,21 @@ def route_condition(state: OverAllState) -> Literal["mix", "rag", "tavily"]:
 def main_graph(checkpointer=None):
    # 每次调用时创建新的 builder，避免重复添加节点报错
    builder = StateGraph(OverAllState)
+   tracer = get_tracer()
 
-   builder.add_node("long_term_memory_import", node.long_term_memory_import)
-   builder.add_node("title_generate", node.title_generate)
-   builder.add_node("intention_recognition", node.intention_recognition)
-   builder.add_node("convergence_node", node.convergence_node, defer = True)
-   builder.add_node("llm_response", node.llm_response)
-   builder.add_node("memory_summary", node.memory_summary)
-   builder.add_node("rag_process",node.rag_process)
-   builder.add_node("tavily_process",node.tavily_process)
-   builder.add_node("mix_process",node.mix_process)
+   def add_node(name, func, **kwargs):
+      # 每个节点都包一层 tracing，记录耗时与等待调度时间
+      builder.add_node(name, tracer.trace_node(name, func), **kwargs)
+
+   add_node("long_term_memory_import", node.long_term_memory_import)
+   add_node("title_generate", node.title_generate)
+   add_node("intention_recognition", node.intention_recognition)
+   add_node("convergence_node", node.convergence_node, defer = True)
+   add_node("llm_response", node.llm_response)
+   add_node("memory_summary", node.memory_summary)
+   add_node("rag_process", node.rag_process)
+   add_node("tavily_process", node.tavily_process)
+   add_node("mix_process", node.mix_process)
 
    builder.add_edge(START,"long_term_memory_import")
    builder.add_edge(START,"title_generate")
@@ -59,7 +69,55 @@ def main_graph(checkpointer=None):
 def create_graph(checkpointer=None):
     return main_graph(checkpointer)
 
-# 默认实例 (使用 MemorySaver，方便测试和单机运行)
-default_saver = MemorySaver()
-graph = create_graph(checkpointer=default_saver)
-graph.invoke
+
+class GraphRegistry:
+   """
+   编译后图的注册表
+   每个 (图变体, checkpointer) 组合只编译一次，之后所有请求复用同一个编译结果；
+   编译后的图本身是无状态的，线程/会话隔离由调用时传入的 config 保证
+   """
+
+   def __init__(self):
+      self._builders: Dict[str, Callable[..., Any]] = {"main": main_graph}
+      # (variant, id(checkpointer)) -> (checkpointer, compiled_graph)
+      self._compiled: Dict[Tuple[str, int], Tuple[Any, Any]] = {}
+      self.compile_seconds: Dict[str, float] = {}
+
+   def register(self, variant: str, builder: Callable[..., Any]) -> None:
+      """注册新的图变体，builder 接收 checkpointer 参数并返回编译后的图"""
+      self._builders[variant] = builder
+
+   def get(self, variant: str = "main", checkpointer=None):
+      """获取编译后的图，未编译过时立即编译并缓存"""
+      key = (variant, id(checkpointer))
+      entry = self._compiled.get(key)
+      # 同时校验对象本身，避免 checkpointer 被回收后 id 复用导致取到错误的图
+      if entry is not None and entry[0] is checkpointer:
+         return entry[1]
+
+      if variant not in self._builders:
+         raise ValueError(f"未知的图变体: {variant}")
+      start_time = time.perf_counter()
+      compiled = self._builders[variant](checkpointer)
+      elapsed = time.perf_counter() - start_time
+      self._compiled[key] = (checkpointer, compiled)
+      self.compile_seconds[f"{variant}:{type(checkpointer).__name__}"] = elapsed
+      logger.info(f"图 {variant} 编译完成 (checkpointer={type(checkpointer).__name__})，耗时: {elapsed * 1000:.1f} ms")
+      return compiled
+
+   def warmup(self, checkpointer=None) -> None:
+      """启动时预编译所有图变体"""
+      for variant in self._builders:
+         self.get(variant, checkpointer)
+
+   def clear(self) -> None:
+      self._compiled.clear()
+
+
+# 全局图注册表
+graph_registry = GraphRegistry()
+
+
+def get_compiled_graph(variant: str = "main", checkpointer=None):
+   """从全局注册表获取编译后的图"""
+   return graph_registry.get(variant, checkpointer)
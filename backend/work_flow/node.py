@@ -13,9 +13,7 @@ async def long_term_memory_import(state: OverAllState) -> dict:
       dict: 更新后的状态
    """
     print("执行节点: long_term_memory_import")
-    from db.database import SessionLocal
-    from db.db_models import ConversationHistory, SessionSummary
-    from sqlalchemy import select
+    from services.session_memory import session_memory_cache
     
     # 假设 session_id 已经存在于 state 中，或者从上下文获取
     # 这里为了演示暂时使用硬编码或从 state 获取
@@ -32,47 +30,15 @@ async def long_term_memory_import(state: OverAllState) -> dict:
             # conversation_history 已经在 state 中，不返回也没关系，但为了保持一致性可以返回
         }
     
-    # 不存在 -> 说明是冷启动（新会话或服务刚重启），需要从数据库加载
-    print(f"⚠️ [内存未命中] 正在从数据库加载会话 {session_id} 的历史记录...")
-
-    async with SessionLocal() as db:
-        # 0. 检查 Session 是否存在，不存在则创建
-        from db.db_models import Session
-        session_result = await db.execute(select(Session).where(Session.id == session_id))
-        if not session_result.scalars().first():
-            print(f"会话 {session_id} 不存在，正在自动创建...")
-            new_session = Session(
-                id=session_id,
-                user_id=state.get("user_id", "user_001"), # 优先从 state 获取 user_id
-                title="New Session",
-                conversation_status="active"
-            )
-            db.add(new_session)
-            await db.commit()
-            print(f"会话 {session_id} 创建成功")
-
-        # 1. 获取长期记忆总结 (Summary)
-        summary_result = await db.execute(select(SessionSummary).where(SessionSummary.session_id == session_id))
-        summary_obj = summary_result.scalars().first()
-        memory_summary = summary_obj.summary if summary_obj else ""
-
-        # 2. 获取最近 3 条完整对话历史 (Recent History)
-        # 按时间倒序查询最近的 3 条，然后再反转回正序
-        history_result = await db.execute(
-            select(ConversationHistory)
-            .where(ConversationHistory.session_id == session_id)
-            .order_by(ConversationHistory.created_at.desc())
-            .limit(3)
-        )
-        recent_records = history_result.scalars().all()
-        
-        # 将记录转换为 Tuple[str, str] 的列表，并按时间正序排列
-        conversation_history = [
-            (record.user_input, record.agent_output) 
-            for record in reversed(recent_records)
-        ]
+    # 不存在 -> 说明是冷启动（新会话或服务刚重启）
+    # 先查进程内的会话记忆缓存，未命中时一条查询导入 摘要 + 最近 N 轮对话
+    # 会话不存在时不在这里创建，由本轮结束时 memory_summary 的写入事务一并创建
+    print(f"⚠️ [内存未命中] 正在导入会话 {session_id} 的历史记录...")
+    memory = await session_memory_cache.load(session_id, state.get("user_id", "user_001"))
+    memory_summary = memory.summary
+    conversation_history = list(memory.recent_turns)
 
-        print(f"导入记忆: 总结长度={len(memory_summary)}, 历史条数={len(conversation_history)}")
+    print(f"导入记忆: 总结长度={len(memory_summary)}, 历史条数={len(conversation_history)}")
 
     # 更新状态
     return {
@@ -117,16 +83,8 @@ async def title_generate(state: OverAllState) -> dict:
     title = response["messages"][-1].content.strip()
     print(f"生成的标题: {title}")
 
-    # 更新数据库中的会话标题
-    session_id = state.get("session_id")
-    if session_id:
-        try:
-            from services.session_service import session_service
-            await session_service.update_session_title(session_id, title)
-        except Exception as e:
-            print(f"更新会话标题失败: {e}")
-
-    return {"conversation_title": title}
+    # 标题随本轮其它数据在 memory_summary 中一并写库
+    return {"conversation_title": title, "pending_writes": {"title": title}}
 
 async def intention_recognition(state: OverAllState) -> dict:
     """
@@ -200,46 +158,44 @@ async def llm_response(state: OverAllState, config: RunnableConfig) -> dict:
     print("执行节点: llm_response")
     from work_flow.agent import get_agent
     from work_flow.agent.prompt import AgentPrompts
+    from work_flow.context_builder import get_context_builder, rag_hits_to_passages, web_results_to_passages
     from langchain_core.messages import HumanMessage
+    from config.loguru_config import get_logger
+
+    logger = get_logger(__name__)
 
     # 1. 提取所有上下文信息
     user_input = state.get("original_query", "")
-    memory_summary = state.get("memory_summary", "无")
-    
-    # 格式化最近三轮对话
-    conversation_history = state.get("conversation_history", [])
-    recent_history_str = ""
-    for i, (q, a) in enumerate(conversation_history):
-        recent_history_str += f"轮次 {i+1}:\n用户: {q}\n助手: {a}\n\n"
-    if not recent_history_str:
-        recent_history_str = "无"
 
     # 获取检索上下文 (可能是 rag, tavily 或 mix 的结果)
     # 根据 rag_use 和 tavily_use 状态判断是否加入 context
     rag_use = state.get("rag_use", False)
     tavily_use = state.get("tavily_use", False)
-    
-    context_parts = []
-    
+
+    passages = []
     if rag_use:
-        rag_out = state.get("rag_output", "未找到相关本地知识。")
-        context_parts.append(f"【本地知识库检索结果】\n{rag_out}")
-        
+        passages += rag_hits_to_passages(state.get("rag_hits"))
     if tavily_use:
-        tavily_out = state.get("tavily_output", "未找到相关网络信息。")
-        context_parts.append(f"【互联网搜索结果】\n{tavily_out}")
-        
-    if not context_parts:
-        context = "未执行检索，请基于现有知识回答。"
-    else:
-        context = "\n\n".join(context_parts)
+        passages += web_results_to_passages(state.get("tavily_output"))
+
+    # 按 token 预算组装记忆与检索上下文 (去重、按得分分配、确定性截断)
+    built = get_context_builder().build(
+        template=AgentPrompts.FINAL_GENERATION_PROMPT,
+        user_input=user_input,
+        memory_summary=state.get("memory_summary") or "",
+        conversation_history=state.get("conversation_history", []),
+        passages=passages,
+        include_rag=rag_use,
+        include_web=tavily_use,
+    )
+    logger.info(f"llm_response Prompt 统计: {built.metrics}")
 
     # 2. 构造 Prompt
     prompt = AgentPrompts.FINAL_GENERATION_PROMPT.format(
         user_input=user_input,
-        memory_summary=memory_summary,
-        recent_history=recent_history_str,
-        context=context
+        memory_summary=built.memory_summary,
+        recent_history=built.recent_history,
+        context=built.context
     )
 
     # 3. 调用 Agent 生成回复
@@ -255,7 +211,7 @@ async def llm_response(state: OverAllState, config: RunnableConfig) -> dict:
     final_answer = response["messages"][-1].content.strip()
     print(f"LLM回复生成完成，长度: {len(final_answer)}")
 
-    return {"final_answer": final_answer}
+    return {"final_answer": final_answer, "prompt_metrics": built.metrics}
 
 async def memory_summary(state: OverAllState) -> dict:
     """
@@ -268,37 +224,45 @@ async def memory_summary(state: OverAllState) -> dict:
          dict: 更新后的状态
     """
     print("执行节点: memory_summary")
+    import asyncio
+    import uuid
     from db.database import SessionLocal
-    from db.db_models import ConversationHistory, SessionSummary
+    from db.db_models import SessionSummary
     from work_flow.agent import get_agent
     from work_flow.agent.prompt import AgentPrompts
     from langchain_core.messages import HumanMessage
+    from services.session_memory import session_memory_cache
+    from services.turn_writes import TurnWrites
     from sqlalchemy import select
-    import uuid
+    from datetime import datetime
 
     user_id = state.get("user_id")
     session_id = state.get("session_id")
     original_query = state.get("original_query")
     final_answer = state.get("final_answer")
+    turn_time = datetime.now().astimezone()
+
+    # 本轮的全部写入（会话、标题、对话记录、摘要）在摘要生成后放在一个事务中提交
+    writes = TurnWrites(
+        turn_id=state.get("turn_id") or str(uuid.uuid4()),
+        session_id=session_id,
+        user_id=user_id,
+        user_input=original_query,
+        agent_output=final_answer,
+        turn_time=turn_time,
+        title=(state.get("pending_writes") or {}).get("title"),
+    )
 
-    async with SessionLocal() as db:
-        # 1. 存储本轮短时记忆
-        new_history = ConversationHistory(
-            id=str(uuid.uuid4()),
-            session_id=session_id,
-            user_id=user_id,
-            user_input=original_query,
-            agent_output=final_answer
-        )
-        db.add(new_history)
-        await db.commit()
-        print("短时记忆存储完成")
-
-        # 2. 生成并更新长时记忆摘要
-        # 获取现有的摘要
-        summary_result = await db.execute(select(SessionSummary).where(SessionSummary.session_id == session_id))
-        existing_summary_obj = summary_result.scalars().first()
-        existing_summary = existing_summary_obj.summary if existing_summary_obj else "无"
+    try:
+        # 生成长时记忆摘要
+        # 获取现有的摘要：上一轮写穿到缓存中的摘要即为最新值，未命中时才查询数据库
+        cached_memory = session_memory_cache.get(session_id)
+        if cached_memory is not None:
+            existing_summary = cached_memory.summary or "无"
+        else:
+            async with SessionLocal() as db:
+                summary_result = await db.execute(select(SessionSummary.summary).where(SessionSummary.session_id == session_id))
+                existing_summary = summary_result.scalar() or "无"
 
         # 获取短期会话记忆 (List[Tuple[str, str]])
         conversation_history = state.get("conversation_history", [])
@@ -323,21 +287,17 @@ async def memory_summary(state: OverAllState) -> dict:
         agent = await get_agent(system_prompt=prompt, llm_type="lite")
         response = await agent.ainvoke({"messages": [HumanMessage(content="请更新摘要")]})
         new_summary = response["messages"][-1].content.strip()
-
-        # 更新或插入摘要
-        if existing_summary_obj:
-            existing_summary_obj.summary = new_summary
-        else:
-            new_summary_obj = SessionSummary(
-                id=str(uuid.uuid4()),
-                session_id=session_id,
-                user_id=user_id,
-                summary=new_summary
-            )
-            db.add(new_summary_obj)
-        
-        await db.commit()
-        print("长时记忆摘要更新完成")
+        writes.summary = new_summary
+    except BaseException:
+        # 摘要生成失败或被取消（停止生成、客户端断开，此时回答已经发送给用户）时仍保存本轮对话，摘要保持不变
+        async def flush_turn():
+            await writes.flush()
+            await session_memory_cache.invalidate(session_id)
+        await asyncio.shield(flush_turn())
+        raise
+
+    await writes.flush()
+    print("本轮对话与长时记忆摘要存储完成")
 
     # --- 关键步骤：更新状态以同步到 Checkpointer ---
     # 我们必须把本轮对话追加到 conversation_history 中并返回
@@ -348,9 +308,13 @@ async def memory_summary(state: OverAllState) -> dict:
     if len(updated_history) > 10:
         updated_history = updated_history[-10:]
 
+    # 写穿会话记忆缓存，下次冷启动（检查点中没有历史）时无需查询数据库
+    await session_memory_cache.remember(session_id, new_summary, updated_history)
+
     return {
         "memory_summary": new_summary,
-        "conversation_history": updated_history
+        "conversation_history": updated_history,
+        "pending_writes": None,
     }
 
 async def rag_process(state: OverAllState) -> dict:
@@ -375,16 +339,17 @@ async def rag_process(state: OverAllState) -> dict:
     search_results = await knowledge_service.search_content(query=original_query, limit=5)
     
     # 格式化检索结果
+    rag_hits = search_results[0] if search_results else []
     rag_output = ""
-    if search_results and len(search_results) > 0:
-        for i, item in enumerate(search_results[0]):
+    if rag_hits:
+        for i, item in enumerate(rag_hits):
             rag_output += f"来源 {i+1}:\n{item.get('text', '')}\n\n"
     else:
         rag_output = "知识库中未找到相关内容。"
         
     print(f"RAG检索完成，结果长度: {len(rag_output)}")
 
-    return {"rag_output": rag_output}
+    return {"rag_output": rag_output, "rag_hits": rag_hits}
 
 async def tavily_process(state: OverAllState) -> dict:
     """
@@ -397,18 +362,13 @@ async def tavily_process(state: OverAllState) -> dict:
          dict: 更新后的状态
     """
     print("执行节点: tavily_temp")
-    from langchain_tavily import TavilySearch
-    from config.loader import get_config
-    
-    config = get_config()
-    tavily_search_tool = TavilySearch(tavily_api_key=config.tavily_api_key)
+    from services.web_search_service import get_web_search_service
     
     # 获取用户查询
     original_query = state.get("original_query", "")
     
-    # 调用 Tavily 搜索
-    # tavily_search_tool.ainvoke(query) 返回的是搜索结果的字符串摘要
-    search_result = await tavily_search_tool.ainvoke(original_query)
+    # 调用共享的 Web 搜索服务 (带缓存、并发合并与按用户限流)
+    search_result = await get_web_search_service().search(original_query, tenant_id=state.get("user_id"))
     
     print(f"Tavily检索完成，结果长度: {len(search_result)}")
 
@@ -426,31 +386,28 @@ async def mix_process(state: OverAllState) -> dict:
     """
     print("执行节点: mix_temp (同时执行 RAG 和 Tavily)")
     from services.knowledge_service import knowledge_service
-    from langchain_tavily import TavilySearch
-    from config.loader import get_config
+    from services.web_search_service import get_web_search_service
     import asyncio
 
-    config = get_config()
-    tavily_search_tool = TavilySearch(tavily_api_key=config.tavily_api_key)
-    
     original_query = state.get("original_query", "")
 
     # 定义异步任务
     async def run_rag():
         results = await knowledge_service.search_content(query=original_query, limit=5)
+        hits = results[0] if results else []
         output = ""
-        if results and len(results) > 0:
-            for i, item in enumerate(results[0]):
+        if hits:
+            for i, item in enumerate(hits):
                 output += f"来源 {i+1}:\n{item.get('text', '')}\n\n"
         else:
             output = "知识库中未找到相关内容。"
-        return output
+        return output, hits
 
     async def run_tavily():
-        return await tavily_search_tool.ainvoke(original_query)
+        return await get_web_search_service().search(original_query, tenant_id=state.get("user_id"))
 
     # 并发执行两个任务
-    rag_result, tavily_result = await asyncio.gather(run_rag(), run_tavily())
+    (rag_result, rag_hits), tavily_result = await asyncio.gather(run_rag(), run_tavily())
 
     # 整合结果
     mix_output = f"""
@@ -461,7 +418,7 @@ async def mix_process(state: OverAllState) -> dict:
 {tavily_result}
 """
     print(f"混合检索完成，总长度: {len(mix_output)}")
-    return {"rag_output": rag_result, "tavily_output": tavily_result}
+    return {"rag_output": rag_result, "rag_hits": rag_hits, "tavily_output": tavily_result}
 
 def finish(state :OverAllState) -> dict:
     """
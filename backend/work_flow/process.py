@@ -1,53 +1,80 @@
+import asyncio
+import uuid
 from langgraph.checkpoint.memory import MemorySaver
 from config.loader import get_config
-from db.redis import SimpleRedisSaver
-from work_flow.graph import create_graph
+from db.redis import HAS_REDIS, SimpleRedisSaver, build_redis_url, close_redis_client, get_redis_client
+from work_flow.graph import get_compiled_graph
 from config.loguru_config import get_logger
+from services.tracing import get_tracer, TracingCallbackHandler
 logger = get_logger(__name__)
 
-# 尝试导入 Redis 相关库
-try:
-    from redis.asyncio import Redis
-    HAS_REDIS = True
-except ImportError:
-    HAS_REDIS = False
+# 进程内共享的 Redis Checkpointer
+_redis_checkpointer = None
+# Redis 不可用时的降级 Checkpointer，同样进程内只创建一次：
+# 图注册表按 checkpointer 对象缓存编译结果，且会话状态需要跨轮次保留
+_memory_checkpointer = None
+
+
+def _get_memory_checkpointer() -> MemorySaver:
+    global _memory_checkpointer
+    if _memory_checkpointer is None:
+        _memory_checkpointer = MemorySaver()
+    return _memory_checkpointer
 
 async def get_redis_checkpointer():
     """
     获取 Redis 持久化器 (Checkpointer)
-    如果 Redis 不可用或连接失败，自动降级为 MemorySaver
+    进程内只创建一次，底层复用共享的 Redis 连接池
+    如果 Redis 不可用或连接失败，自动降级为进程内共享的 MemorySaver，下次调用时重新尝试连接 Redis
     """
+    global _redis_checkpointer
+    if _redis_checkpointer is not None:
+        return _redis_checkpointer
+
     if not HAS_REDIS:
         logger.info("ℹ️ 未安装 Redis 库，使用 MemorySaver")
-        return MemorySaver()
+        return _get_memory_checkpointer()
   
     try:
-        # 读取配置
-        config = get_config()
-        redis_config = config.redis
-        
-        if redis_config and redis_config.url:
-            redis_url = redis_config.url
-        elif redis_config:
-            auth_part = f":{redis_config.password}@" if redis_config.password else ""
-            redis_url = f"redis://{auth_part}{redis_config.host}:{redis_config.port}/{redis_config.db}"
-        else:
-            redis_url = "redis://localhost:6379/0"
-
-        logger.info(f"🔄 正在连接 Redis: {redis_url} ...")
+        logger.info(f"🔄 正在连接 Redis: {build_redis_url(get_config().redis)} ...")
         
-        # 建立连接
-        redis_client = Redis.from_url(redis_url)
+        # 共享连接池中的客户端
+        redis_client = get_redis_client()
         # 测试连接是否通畅
         await redis_client.ping()
         
-        checkpointer = SimpleRedisSaver(redis_client)
+        _redis_checkpointer = SimpleRedisSaver(redis_client)
         logger.info("✅ Redis Checkpointer (Custom) 就绪")
-        return checkpointer
+        return _redis_checkpointer
         
     except Exception as e:
         logger.error(f"❌ Redis 连接失败: {e}，降级使用 MemorySaver")
-        return MemorySaver()
+        return _get_memory_checkpointer()
+
+async def _end_turn(checkpointer, thread_id: str):
+    """
+    轮次结束（正常完成、异常或客户端断开）时提交检查点写缓冲，并记录本轮 Redis 往返次数
+    使用 shield，避免请求被取消时中断提交
+    """
+    if not isinstance(checkpointer, SimpleRedisSaver):
+        return
+    try:
+        round_trips = await asyncio.shield(checkpointer.aend_turn(thread_id))
+        logger.debug(f"本轮 Redis 往返次数: {round_trips} [Thread: {thread_id}]")
+    except Exception as e:
+        logger.error(f"提交检查点失败 [Thread: {thread_id}]: {e}")
+
+async def _resume_or_start(graph, config: dict, initial_state: dict):
+    """
+    检查线程上一次运行是否中途中断（仍有待执行的节点）
+    如果是同一个查询，返回 None 让 LangGraph 从最后完成的节点继续执行（已完成节点的写入会被复用），
+    否则返回新的初始状态重新开始
+    """
+    snapshot = await graph.aget_state(config)
+    if snapshot.next and snapshot.values.get("original_query") == initial_state["original_query"]:
+        logger.info(f"检测到未完成的运行，从节点 {snapshot.next} 继续 [Thread: {config['configurable']['thread_id']}]")
+        return None
+    return initial_state
 
 async def run_workflow(session_id: str, user_id: str, original_query: str, thread_id: str = None, checkpointer=None):
     """
@@ -68,34 +95,42 @@ async def run_workflow(session_id: str, user_id: str, original_query: str, threa
     if checkpointer is None:
         checkpointer = await get_redis_checkpointer()
 
-    # 创建图
-    graph = create_graph(checkpointer=checkpointer)
+    # 从注册表获取编译好的图 (每个 checkpointer 只编译一次)
+    graph = get_compiled_graph(checkpointer=checkpointer)
     
     # 构造初始状态
     initial_state = {
         "user_id": user_id, 
         "session_id": session_id,
-        "original_query": original_query
+        "original_query": original_query,
+        # 续跑中断的运行时沿用检查点中的 turn_id，本轮对话记录按它幂等写入
+        "turn_id": str(uuid.uuid4()),
     }
     
     # 如果没传 thread_id，默认使用 session_id
     if not thread_id:
         thread_id = session_id
         
-    config = {"configurable": {"thread_id": thread_id}}
+    tracer = get_tracer()
+    # callbacks 会传递到节点内部的 LLM / 工具调用，用于记录耗时与 token
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [TracingCallbackHandler(tracer)]}
     
     print(f"▶️ 开始执行工作流 [Thread: {thread_id}]")
     print(f"👤 用户: {user_id} | 💬 查询: {original_query}")
     
     try:
         # 异步调用图
-        result = await graph.ainvoke(initial_state, config=config)
+        with tracer.trace(session_id):
+            graph_input = await _resume_or_start(graph, config, initial_state)
+            result = await graph.ainvoke(graph_input, config=config)
         return result
     except Exception as e:
         print(f"❌ 工作流执行出错: {e}")
         import traceback
         traceback.print_exc()
         raise e
+    finally:
+        await _end_turn(checkpointer, thread_id)
 
 async def stream_workflow(session_id: str, user_id: str, original_query: str, thread_id: str = None, checkpointer=None):
     """
@@ -104,62 +139,69 @@ async def stream_workflow(session_id: str, user_id: str, original_query: str, th
     if checkpointer is None:
         checkpointer = await get_redis_checkpointer()
 
-    graph = create_graph(checkpointer=checkpointer)
+    graph = get_compiled_graph(checkpointer=checkpointer)
     
     initial_state = {
         "user_id": user_id, 
         "session_id": session_id,
-        "original_query": original_query
+        "original_query": original_query,
+        # 续跑中断的运行时沿用检查点中的 turn_id，本轮对话记录按它幂等写入
+        "turn_id": str(uuid.uuid4()),
     }
     
     if not thread_id:
         thread_id = session_id
         
-    config = {"configurable": {"thread_id": thread_id}}
+    tracer = get_tracer()
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [TracingCallbackHandler(tracer)]}
     
     # 使用 astream_events 获取更细粒度的流式更新 (包括 LLM 的 token 流)
     try:
-        async for event in graph.astream_events(initial_state, config=config, version="v2"):
-            kind = event["event"]
+        with tracer.trace(session_id):
+            graph_input = await _resume_or_start(graph, config, initial_state)
+            async for event in graph.astream_events(graph_input, config=config, version="v2"):
+                kind = event["event"]
             
-            # 1. 处理 LLM 流式输出 (Token 级别)
-            if kind == "on_chat_model_stream":
-                # 获取当前生成的 token
-                content = event["data"]["chunk"].content
+                # 1. 处理 LLM 流式输出 (Token 级别)
+                if kind == "on_chat_model_stream":
+                    # 获取当前生成的 token
+                    content = event["data"]["chunk"].content
                 
-                # 获取事件 tags
-                tags = event.get("tags", [])
+                    # 获取事件 tags
+                    tags = event.get("tags", [])
                 
-                # 只流式传输带有 node:llm_response 标签的输出
-                if content and "node:llm_response" in tags:
-                    yield {
-                        "event": "llm_stream",
-                        "node": "llm_response", 
-                        "data": content
-                    }
+                    # 只流式传输带有 node:llm_response 标签的输出
+                    if content and "node:llm_response" in tags:
+                        yield {
+                            "event": "llm_stream",
+                            "node": "llm_response", 
+                            "data": content
+                        }
             
-            # 2. 处理节点状态更新 (Node 级别)
-            elif kind == "on_chain_end":
-                # 筛选出图节点的结束事件
-                if event["name"] and event["name"] in graph.nodes:
-                    node_name = event["name"]
-                    # 注意：on_chain_end 的 output 可能是 State update，也可能是其他
-                    # 这里我们主要关注节点执行完成的信号，具体数据可能需要根据节点返回值结构调整
-                    # 为了保持兼容性，我们可以简化处理，或者只发送特定节点的结束信号
+                # 2. 处理节点状态更新 (Node 级别)
+                elif kind == "on_chain_end":
+                    # 筛选出图节点的结束事件
+                    if event["name"] and event["name"] in graph.nodes:
+                        node_name = event["name"]
+                        # 注意：on_chain_end 的 output 可能是 State update，也可能是其他
+                        # 这里我们主要关注节点执行完成的信号，具体数据可能需要根据节点返回值结构调整
+                        # 为了保持兼容性，我们可以简化处理，或者只发送特定节点的结束信号
                     
-                    # 只有当 output 是字典且包含更新时才发送
-                    output = event["data"].get("output")
-                    if isinstance(output, dict):
-                         yield {
-                            "event": "node_update",
-                            "node": node_name,
-                            "data": output
-                        }
+                        # 只有当 output 是字典且包含更新时才发送
+                        output = event["data"].get("output")
+                        if isinstance(output, dict):
+                             yield {
+                                "event": "node_update",
+                                "node": node_name,
+                                "data": output
+                            }
                         
     except Exception as e:
         print(f"❌ 流式执行出错: {e}")
         yield {"event": "error", "error": str(e)}
         raise e
+    finally:
+        await _end_turn(checkpointer, thread_id)
 
 async def main():
     # 初始化数据库连接
@@ -203,12 +245,10 @@ async def main():
     finally:
         await db_shutdown()
         # 关闭 Redis 连接
-        if hasattr(checkpointer, "client"):
-            await checkpointer.client.aclose()
+        await close_redis_client()
 
 if __name__ == "__main__":
     import sys
-    import asyncio
     if sys.platform.startswith('win'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     asyncio.run(main())
@@ -17,9 +17,13 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 # 现在可以导入 graph 了
-from work_flow.graph import graph
+from langgraph.checkpoint.memory import MemorySaver
+from work_flow.graph import get_compiled_graph
 from db.database import db_startup, db_shutdown
 
+# 使用 MemorySaver，方便测试和单机运行
+graph = get_compiled_graph(checkpointer=MemorySaver())
+
 async def main():
     # 初始化数据库连接
     await db_startup()
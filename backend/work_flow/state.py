@@ -1,4 +1,6 @@
-from typing import TypedDict, List, Tuple
+from typing import Annotated, TypedDict, List, Tuple
+
+from services.turn_writes import merge_pending_writes
 
 
 class OverAllState(TypedDict):
@@ -6,6 +8,7 @@ class OverAllState(TypedDict):
    session_id: str   #会话ID
    conversation_history: List[Tuple[str, str]]  #短期会话记忆
    original_query: str  #原始查询
+   turn_id: str  #本轮对话ID，续跑时不变，用作对话记录的主键
 
    # 会话标题节点生成
    conversation_title:str  #会话标题
@@ -21,5 +24,11 @@ class OverAllState(TypedDict):
    final_answer:str  #最终回答
 
    rag_output:str  #RAG检索输出
+   rag_hits:List[dict]  #RAG检索原始结果(含得分)，用于按预算组装上下文
+
+   tavily_output:str #tavily检索输出
+
+   prompt_metrics:dict  #本轮生成Prompt的大小统计
 
-   tavily_output:str #tavily检索输出
\ No newline at end of file
+   # 待写库的数据（如生成的标题），由 memory_summary 在轮次结束时一并写入后清空
+   pending_writes:Annotated[dict, merge_pending_writes]
\ No newline at end of file
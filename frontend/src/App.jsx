@@ -452,10 +452,13 @@ function App() {
         buffer = lines.pop(); // 保留最后一行不完整的数据
         
         for (const line of lines) {
-          if (line.trim().startsWith('data :')) {
+          if (line.trim().startsWith('data:')) {
             // 解析SSE数据行
             try {
-              const jsonStr = line.trim().slice(7); // 去掉 "data : " 前缀
+              const jsonStr = line.trim().slice(5).trim(); // 去掉 "data:" 前缀
+              if (jsonStr === '[DONE]') {
+                continue;
+              }
               const data = JSON.parse(jsonStr);
               
               if (data.ai_message) {